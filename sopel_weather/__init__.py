@@ -9,29 +9,41 @@ A working re-implementation of the weather plugin for Sopel
 # Licensed under the Eiffel Forum License 2.
 from __future__ import unicode_literals, absolute_import, print_function, division
 
-import requests
+import functools
+import re
+import sqlite3
+import threading
+import time
 
-from datetime import datetime
+from contextlib import contextmanager
 
-import pytz
+import requests
 
-from sopel.config.types import NO_DEFAULT, BooleanAttribute, ChoiceAttribute, StaticSection, ValidatedAttribute
-from sopel.plugin import commands, example, NOLIMIT
-from sopel.tools import get_logger, Identifier
+from sopel.config.types import (
+    NO_DEFAULT, BooleanAttribute, ChoiceAttribute, ListAttribute, StaticSection, ValidatedAttribute
+)
+from sopel.plugin import commands, example, interval, NOLIMIT, OP, require_admin, require_owner
+from sopel.tools import get_logger
 from sopel.tools.time import format_time
 
-from .providers.weather.openmeteo import openmeteo_forecast, openmeteo_weather
-from .providers.weather.openweathermap import openweathermap_forecast, openweathermap_weather
-from .providers.weather.pirateweather import pirateweather_forecast, pirateweather_weather
-from .providers.weather.tomorrow import tomorrow_forecast, tomorrow_weather
+from . import breaker, quota, ratelimit, timezones, transport
+from .httpcache import ResponseCache
+from .cache import grid_cell, normalize_query, TTLCache
+from .coalesce import SingleFlight
+from .engine import DEFAULT_DEADLINE, DEFAULT_WORKERS, FetchEngine
+from .gazetteer import Gazetteer
+from .locations import NickLocationIndex
+from .model import normalize_report
+from .prefetch import HotLocations
+from .ratelimit import RateLimited, RateLimiter
+from .render import convert_timestamp, get_humidity, get_temp, get_wind, Renderer, UNIT_SETS  # noqa: F401
+from .stats import METRICS
+from .providers.weather import get_provider, provider_specs, using_api_key
+
+WEATHER_PROVIDERS = sorted(provider_specs())
 
-WEATHER_PROVIDERS = [
-    'darksky',
-    'openmeteo',
-    'openweathermap',
-    'pirateweather',
-    'tomorrow',
-]
+# Every geocoding endpoint shares one LocationIQ account, and so one quota
+GEOCOORDS_QUOTA = 'locationiq'
 
 GEOCOORDS_PROVIDERS = {
     'locationiq_eu': 'https://eu1.locationiq.com/v1/search.php',
@@ -42,20 +54,202 @@ GEOCOORDS_PROVIDERS = {
 
 LOGGER = get_logger('weather')
 
+# SopelDB's upsert is a select then an insert, so concurrent writes of one key can collide
+_plugin_value_lock = threading.Lock()
+
+# Separates the locations of a multi-location ``.weather``
+LOCATION_SEPARATOR = '|'
+
+# ``.weather #channel`` shows the weather of everyone in the channel
+CHANNEL_PREFIXES = ('#', '&')
+
+# Seconds between prefetch runs; hot entries expiring within two runs are refreshed
+PREFETCH_INTERVAL = 60
+
+# Seconds between writes of changed state to the database
+SAVE_INTERVAL = 60
+# Plugin values saved by :func:`save_changes`, and the ``bot.memory`` entry each is dumped from
+SAVED_STATE = {
+    'geocode_cache': 'weather_geocode_cache',
+    'quota_usage': 'weather_quota',
+}
+
+# ``.forecast hourly [hours] [location]``; at most two digits, so ZIP codes stay locations
+HOURLY_PATTERN = re.compile(r'hourly(?:\s+(\d{1,2})(?=\s|$))?(?:\s+(.+))?$', re.IGNORECASE)
+HOURLY_DEFAULT_HOURS = 6
+# Most hours that may be asked for; the renderer drops any that don't fit on one line
+HOURLY_MAX_HOURS = 12
+
 
 # Define our sopel weather configuration
 class WeatherSection(StaticSection):
     geocoords_provider = ChoiceAttribute('geocoords_provider', GEOCOORDS_PROVIDERS.keys(), default='locationiq_us')
     geocoords_api_key = ValidatedAttribute('geocoords_api_key', str, default='')
+    gazetteer_file = ValidatedAttribute('gazetteer_file', str, default='')
     weather_provider = ChoiceAttribute('weather_provider', WEATHER_PROVIDERS, default=NO_DEFAULT)
     weather_api_key = ValidatedAttribute('weather_api_key', str, default='')
+    fallback_providers = ListAttribute('fallback_providers', default=[])
+    fallback_api_keys = ListAttribute('fallback_api_keys', default=[])
+    hedge_delay = ValidatedAttribute('hedge_delay', float, default=2.0)
     sunrise_sunset = BooleanAttribute('sunrise_sunset', default=False)
+    units = ChoiceAttribute('units', UNIT_SETS, default='both')
     nick_lookup = BooleanAttribute('nick_lookup', default=True)
+    geocode_cache_size = ValidatedAttribute('geocode_cache_size', int, default=1024)
+    geocode_cache_ttl = ValidatedAttribute('geocode_cache_ttl', int, default=30 * 24 * 60 * 60)
+    geocode_cache_grace = ValidatedAttribute('geocode_cache_grace', int, default=7 * 24 * 60 * 60)
+    weather_cache_size = ValidatedAttribute('weather_cache_size', int, default=512)
+    weather_cache_grid = ValidatedAttribute('weather_cache_grid', float, default=0.1)
+    weather_cache_ttl = ValidatedAttribute('weather_cache_ttl', int, default=10 * 60)
+    forecast_cache_ttl = ValidatedAttribute('forecast_cache_ttl', int, default=60 * 60)
+    weather_cache_grace = ValidatedAttribute('weather_cache_grace', int, default=10 * 60)
+    cache_jitter = ValidatedAttribute('cache_jitter', float, default=0.1)
+    cache_early_refresh = ValidatedAttribute('cache_early_refresh', float, default=0.05)
+    http_pool_size = ValidatedAttribute('http_pool_size', int, default=transport.DEFAULT_POOL_SIZE)
+    http_connect_timeout = ValidatedAttribute('http_connect_timeout', float,
+                                              default=transport.DEFAULT_CONNECT_TIMEOUT)
+    http_read_timeout = ValidatedAttribute('http_read_timeout', float, default=transport.DEFAULT_READ_TIMEOUT)
+    http_cache_file = ValidatedAttribute('http_cache_file', str, default='')
+    breaker_failure_rate = ValidatedAttribute('breaker_failure_rate', float, default=breaker.DEFAULT_FAILURE_RATE)
+    breaker_min_calls = ValidatedAttribute('breaker_min_calls', int, default=breaker.DEFAULT_MIN_CALLS)
+    breaker_cooldown = ValidatedAttribute('breaker_cooldown', float, default=breaker.DEFAULT_COOLDOWN)
+    quota_limits = ListAttribute('quota_limits', default=[])
+    quota_max_wait = ValidatedAttribute('quota_max_wait', float, default=quota.DEFAULT_MAX_WAIT)
+    quota_reserve = ValidatedAttribute('quota_reserve', float, default=quota.DEFAULT_RESERVE)
+    quota_coarse_grid = ValidatedAttribute('quota_coarse_grid', float, default=0.5)
+    metrics_file = ValidatedAttribute('metrics_file', str, default='')
+    fetch_workers = ValidatedAttribute('fetch_workers', int, default=DEFAULT_WORKERS)
+    fetch_deadline = ValidatedAttribute('fetch_deadline', float, default=DEFAULT_DEADLINE)
+    prefetch_locations = ValidatedAttribute('prefetch_locations', int, default=10)
+    max_locations = ValidatedAttribute('max_locations', int, default=5)
+    roster_cooldown = ValidatedAttribute('roster_cooldown', int, default=5 * 60)
+    roster_ops_only = BooleanAttribute('roster_ops_only', default=False)
+    rate_limit_nick = ValidatedAttribute('rate_limit_nick', int, default=5)
+    rate_limit_channel = ValidatedAttribute('rate_limit_channel', int, default=15)
+    rate_limit_period = ValidatedAttribute('rate_limit_period', int, default=5 * 60)
 
 
 def setup(bot):
     bot.config.define_section('weather', WeatherSection)
 
+    # Each fallback sends its own API key, never the main provider's
+    bot.memory['weather_api_keys'] = check_fallbacks(
+        bot.config.weather.weather_provider,
+        bot.config.weather.fallback_providers,
+        parse_api_keys(bot.config.weather.fallback_api_keys),
+    )
+
+    # Upstream responses kept on disk, so a restart does not start from nothing
+    http_cache = None
+    if bot.config.weather.http_cache_file:
+        try:
+            http_cache = ResponseCache(bot.config.weather.http_cache_file)
+        except sqlite3.Error as err:
+            LOGGER.warning('Not using the HTTP response cache: %s', err)
+
+    transport.configure(
+        pool_size=bot.config.weather.http_pool_size,
+        connect_timeout=bot.config.weather.http_connect_timeout,
+        read_timeout=bot.config.weather.http_read_timeout,
+        cache=http_cache,
+        failure_rate=bot.config.weather.breaker_failure_rate,
+        min_calls=bot.config.weather.breaker_min_calls,
+        cooldown=bot.config.weather.breaker_cooldown,
+    )
+
+    # Daily budgets and pacing for each API key, counted across restarts
+    quotas = quota.QuotaManager(
+        quota.parse_limits(bot.config.weather.quota_limits),
+        max_wait=bot.config.weather.quota_max_wait,
+    )
+    quotas.load(bot.db.get_plugin_value('weather', 'quota_usage'))
+    bot.memory['weather_quota'] = quotas
+
+    # Upstream calls run on the engine's HTTP workers, never on Sopel's own threads
+    bot.memory['weather_engine'] = FetchEngine(workers=bot.config.weather.fetch_workers)
+    # Identical lookups arriving together share a single upstream call
+    bot.memory['weather_inflight'] = SingleFlight()
+
+    # Geocoding results rarely change, so keep them around (and across restarts)
+    geocode_cache = TTLCache(
+        maxsize=bot.config.weather.geocode_cache_size,
+        ttl=bot.config.weather.geocode_cache_ttl,
+        grace=bot.config.weather.geocode_cache_grace,
+        jitter=bot.config.weather.cache_jitter,
+        early=bot.config.weather.cache_early_refresh,
+    )
+    geocode_cache.load(bot.db.get_plugin_value('weather', 'geocode_cache'))
+    bot.memory['weather_geocode_cache'] = geocode_cache
+    # Plugin values changed since they were last written; see save_changes
+    bot.memory['weather_unsaved'] = set()
+
+    # Places answered offline, before asking the geocoder
+    bot.memory['weather_gazetteer'] = None
+    if bot.config.weather.gazetteer_file:
+        try:
+            gazetteer = Gazetteer(bot.config.weather.gazetteer_file)
+        except (OSError, ValueError) as err:
+            LOGGER.warning('Not using the offline gazetteer: %s', err)
+        else:
+            LOGGER.info('Loaded offline gazetteer: %s', gazetteer.describe())
+            bot.memory['weather_gazetteer'] = gazetteer
+
+    # Saved nick locations, so the command hot path never touches the DB
+    nick_locations = NickLocationIndex(bot.db)
+    nick_locations.load()
+    bot.memory['weather_nick_locations'] = nick_locations
+
+    # Normalized provider results, shared by everyone in the same grid cell
+    # Stale entries are still served for a grace period while one refresh runs in the background
+    bot.memory['weather_cache'] = TTLCache(
+        maxsize=bot.config.weather.weather_cache_size,
+        grace=bot.config.weather.weather_cache_grace,
+        jitter=bot.config.weather.cache_jitter,
+        early=bot.config.weather.cache_early_refresh,
+    )
+    # Which of those are asked for most, so they can be refreshed before expiring
+    bot.memory['weather_hot_locations'] = HotLocations()
+    # When each channel last asked for everyone's weather
+    bot.memory['weather_roster_times'] = {}
+    # How many uncached lookups each nick and channel may still make
+    bot.memory['weather_rate_limits'] = RateLimiter(
+        bot.config.weather.rate_limit_nick,
+        bot.config.weather.rate_limit_channel,
+        bot.config.weather.rate_limit_period,
+    )
+
+    # Reply templates only depend on the config, so compile them once
+    bot.memory['weather_renderer'] = Renderer(
+        units=bot.config.weather.units,
+        sunrise_sunset=bot.config.weather.sunrise_sunset,
+    )
+
+    METRICS.reset()
+    METRICS.track_cache('geocode', geocode_cache)
+    METRICS.track_cache('weather', bot.memory['weather_cache'])
+    if http_cache is not None:
+        METRICS.track_cache('http', http_cache)
+
+
+def shutdown(bot):
+    save_changes(bot)
+    bot.memory.pop('weather_unsaved', None)
+    bot.memory.pop('weather_geocode_cache', None)
+    bot.memory.pop('weather_cache', None)
+    bot.memory.pop('weather_hot_locations', None)
+    bot.memory.pop('weather_roster_times', None)
+    bot.memory.pop('weather_renderer', None)
+    bot.memory.pop('weather_nick_locations', None)
+    gazetteer = bot.memory.pop('weather_gazetteer', None)
+    if gazetteer is not None:
+        gazetteer.close()
+    bot.memory.pop('weather_inflight', None)
+    bot.memory.pop('weather_api_keys', None)
+    bot.memory.pop('weather_quota', None)
+    engine = bot.memory.pop('weather_engine', None)
+    if engine is not None:
+        engine.stop()
+    transport.close()
+
 
 # Walk the user through defining variables required
 def configure(config):
@@ -92,116 +286,192 @@ def configure(config):
     )
 
 
-def get_temp(temp):
-    try:
-        temp = float(temp)
-    except (KeyError, TypeError, ValueError):
-        return 'unknown'
-    return u'%d\u00B0C (%d\u00B0F)' % (round(temp), round(1.8 * temp + 32))
-
+def get_geocoords(bot, trigger, target=None):
+    """Return ``(latitude, longitude, location, timezone)`` for the trigger.
 
-def get_humidity(humidity):
-    try:
-        humidity = int(humidity * 100)
-    except (KeyError, TypeError, ValueError):
-        return 'unknown'
-    return "Humidity: %s%%" % humidity
-
-
-def get_wind(speed, bearing):
-    m_s = float(round(speed, 1))
-    kph = int(round(speed * 3.6))
-    mph = int(round(speed * 2.236936))
-    speed = int(round(m_s * 1.94384))
-    bearing = int(bearing)
-
-    if speed < 1:
-        description = 'Calm'
-    elif speed < 4:
-        description = 'Light air'
-    elif speed < 7:
-        description = 'Light breeze'
-    elif speed < 11:
-        description = 'Gentle breeze'
-    elif speed < 16:
-        description = 'Moderate breeze'
-    elif speed < 22:
-        description = 'Fresh breeze'
-    elif speed < 28:
-        description = 'Strong breeze'
-    elif speed < 34:
-        description = 'Near gale'
-    elif speed < 41:
-        description = 'Gale'
-    elif speed < 48:
-        description = 'Strong gale'
-    elif speed < 56:
-        description = 'Storm'
-    elif speed < 64:
-        description = 'Violent storm'
-    else:
-        description = 'Hurricane'
-
-    if (bearing <= 22.5) or (bearing > 337.5):
-        bearing = u'\u2193'
-    elif (bearing > 22.5) and (bearing <= 67.5):
-        bearing = u'\u2199'
-    elif (bearing > 67.5) and (bearing <= 112.5):
-        bearing = u'\u2190'
-    elif (bearing > 112.5) and (bearing <= 157.5):
-        bearing = u'\u2196'
-    elif (bearing > 157.5) and (bearing <= 202.5):
-        bearing = u'\u2191'
-    elif (bearing > 202.5) and (bearing <= 247.5):
-        bearing = u'\u2197'
-    elif (bearing > 247.5) and (bearing <= 292.5):
-        bearing = u'\u2192'
-    elif (bearing > 292.5) and (bearing <= 337.5):
-        bearing = u'\u2198'
-
-    return description + ': ' + str(kph) + 'km/h ' + '(' + str(mph) + 'mph) ' + '(' + bearing + ')'
-
-def convert_timestamp(timestamp, tz):
-    # Partial logic from sopel/tools/time.format_time
-    time = datetime.fromtimestamp(timestamp, pytz.timezone('UTC'))
-    # We only return the time, without a date or timezone.
-    tz = pytz.timezone(tz)
-    return time.astimezone(tz).strftime('%H:%M')
-
-def get_geocoords(bot, trigger):
-    target = trigger.group(2)
+    ``target`` overrides the trigger's argument; ``timezone`` is the one
+    saved with a nick's location, or ``None``.
+    """
+    if target is None:
+        target = trigger.group(2)
+    nick_locations = bot.memory['weather_nick_locations']
     if not target:
-        latitude = bot.db.get_nick_value(trigger.nick, 'latitude')
-        longitude = bot.db.get_nick_value(trigger.nick, 'longitude')
-        location = bot.db.get_nick_value(trigger.nick, 'location')
-
-        if latitude and longitude and location:
-            return latitude, longitude, location
-        else:
+        with METRICS.timed('nick_lookup'):
+            saved = nick_locations.get(trigger.nick)
+        if saved is None:
             raise ValueError
+        return saved + (nick_locations.get_timezone(trigger.nick),)
 
     if bot.config.weather.nick_lookup and ' ' not in target:
-        # Try to look up nickname in DB, if enabled
-        nick = Identifier(target)
-        latitude = bot.db.get_nick_value(nick, 'latitude')
-        longitude = bot.db.get_nick_value(nick, 'longitude')
-        location = bot.db.get_nick_value(nick, 'location')
+        # Try to look up nickname in the saved locations, if enabled
+        with METRICS.timed('nick_lookup'):
+            saved = nick_locations.get(target)
+        if saved is not None:
+            return saved + (nick_locations.get_timezone(target),)
+
+    # Try the offline gazetteer, then geocode location if not a nick or not found in DB
+    found = local_geocode(bot, target)
+    if found is not None:
+        return found
+    with METRICS.timed('geocode'):
+        return geocode(bot, target) + (None,)
+
+
+def local_geocode(bot, query):
+    """Look ``query`` up in the offline gazetteer, if there is one.
+
+    Returns ``(latitude, longitude, location, timezone)``, or ``None`` on a miss.
+    """
+    gazetteer = bot.memory.get('weather_gazetteer')
+    if gazetteer is None:
+        return None
+    with METRICS.timed('gazetteer'):
+        return gazetteer.lookup(query)
+
+
+def geocode(bot, query):
+    """Resolve ``query`` to ``(latitude, longitude, location)``, using the geocode cache."""
+    cache = bot.memory['weather_geocode_cache']
+    key = normalize_query(query)
+    cached, refresh = cache.get_stale(key)
+    if refresh:
+        refresh_in_background(cache, [key], bot.memory['weather_inflight'].do,
+                              ('geocode', key), _geocode_and_store, bot, query, key)
+    if cached is not None:
+        LOGGER.debug('Geocode cache hit for %r (%d hits, %d misses)', key, cache.hits, cache.misses)
+        return tuple(cached)
+
+    LOGGER.debug('Geocode cache miss for %r (%d hits, %d misses)', key, cache.hits, cache.misses)
+    return bot.memory['weather_inflight'].do(('geocode', key), _geocode_and_store, bot, query, key)
 
-        if latitude and longitude and location:
-            return latitude, longitude, location
 
-    # geocode location if not a nick or not found in DB
+def _geocode_and_store(bot, query, key):
+    cache = bot.memory['weather_geocode_cache']
+    result = bot.memory['weather_engine'].call(
+        _geocode_remote, bot, query, timeout=bot.config.weather.fetch_deadline)
+    cache.set(key, result)
+    mark_unsaved(bot, 'geocode_cache')
+    return result
+
+
+def refresh_in_background(cache, keys, func, *args):
+    """Call ``func`` on a thread of its own to refresh ``keys``, which it must store in ``cache``.
+
+    Callers keep being served the stale entries meanwhile. If the refresh
+    fails, the keys are released so a later lookup can try again.
+    """
+    def refresh():
+        try:
+            func(*args)
+        except Exception as err:
+            for key in keys:
+                cache.release(key)
+            LOGGER.warning('Could not refresh %d cached entries: %s', len(keys), err)
+
+    threading.Thread(target=refresh, name='sopel-weather-refresh', daemon=True).start()
+
+
+def save_plugin_value(bot, key, value):
+    with _plugin_value_lock:
+        bot.db.set_plugin_value('weather', key, value)
+
+
+def mark_unsaved(bot, key):
+    """Have the next :func:`save_changes` write plugin value ``key``, one of :data:`SAVED_STATE`."""
+    bot.memory['weather_unsaved'].add(key)
+
+
+@interval(SAVE_INTERVAL)
+def save_changes(bot):
+    """Write the plugin values changed since the last run, rather than on every change."""
+    unsaved = bot.memory.get('weather_unsaved')
+    if not unsaved:
+        return
+    for key in list(unsaved):
+        # Discard first, so a change made while dumping is saved by the next run
+        unsaved.discard(key)
+        save_plugin_value(bot, key, bot.memory[SAVED_STATE[key]].dump())
+
+
+def charge_upstream(bot):
+    """Count the command being handled against its nick's and channel's rate limits.
+
+    Used as a :func:`.transport.sending` hook by :func:`rate_limited`, so only
+    requests actually sent upstream count; HTTP cache hits are free.
+    """
+    ratelimit.charge(bot.memory['weather_rate_limits'])
+
+
+def spend_quota(bot, name, api_key):
+    """Count an upstream call against its API key's budget, marking today's usage unsaved.
+
+    Used as a :func:`.transport.sending` hook, so cached responses cost nothing.
+    """
+    quotas = bot.memory['weather_quota']
+    if quotas.acquire(name, api_key) is not None:
+        mark_unsaved(bot, 'quota_usage')
+
+
+def geocode_many(bot, queries):
+    """Resolve several queries at once, geocoding the cache misses concurrently.
+
+    Returns one ``(latitude, longitude, location)`` per query, or the
+    exception that query failed with.
+    """
+    cache = bot.memory['weather_geocode_cache']
+    keys = [normalize_query(query) for query in queries]
+    results = {}
+    missing = {}
+    for key, query in zip(keys, queries):
+        cached, refresh = cache.get_stale(key)
+        if refresh:
+            refresh_in_background(cache, [key], bot.memory['weather_inflight'].do,
+                                  ('geocode', key), _geocode_and_store, bot, query, key)
+        if cached is None:
+            missing.setdefault(key, query)
+        else:
+            results[key] = tuple(cached)
+
+    if missing:
+        found = bot.memory['weather_engine'].call_all(
+            [functools.partial(_geocode_remote, bot, query) for query in missing.values()],
+            timeout=bot.config.weather.fetch_deadline)
+        for key, result in zip(missing, found):
+            results[key] = result
+            if not isinstance(result, Exception):
+                cache.set(key, result)
+        mark_unsaved(bot, 'geocode_cache')
+        for result in found:
+            if isinstance(result, RateLimited):
+                raise result
+    return [results[key] for key in keys]
+
+
+def _geocode_remote(bot, query):
+    try:
+        return _geocode_request(bot, query)
+    except Exception:
+        METRICS.error('geocoder')
+        raise
+
+
+def _geocode_request(bot, query):
     url = GEOCOORDS_PROVIDERS[bot.config.weather.geocoords_provider]
     data = {
         'key': bot.config.weather.geocoords_api_key,
-        'q': trigger.group(2),
+        'q': query,
         'format': 'json',
         'addressdetails': 1,
         'limit': 1
     }
 
     try:
-        r = requests.get(url, params=data)
+        with transport.sending(functools.partial(
+                spend_quota, bot, GEOCOORDS_QUOTA, bot.config.weather.geocoords_api_key)):
+            r = transport.get(url, params=data)
+    except breaker.CircuitOpenError as err:
+        # Safe to show: only mentions the host
+        raise Exception(str(err))
     except requests.exceptions.RequestException:
         # requests likes to include the full URL in its exceptions, which would
         # mean the API key gets printed to the channel
@@ -238,61 +508,303 @@ def get_geocoords(bot, trigger):
     return latitude, longitude, location
 
 
+def weather_cache_key(bot, kind, latitude, longitude, grid=None):
+    """Build the shared cache key for a provider result near a coordinate pair."""
+    cell = grid_cell(latitude, longitude, grid or bot.config.weather.weather_cache_grid)
+    return (bot.config.weather.weather_provider, kind) + cell
+
+
+def get_report(bot, latitude, longitude, location):
+    """Return current conditions and the daily forecast for the grid cell.
+
+    Both come from a single upstream request, so a ``.weather`` followed by a
+    ``.forecast`` for the same place costs one call.
+    """
+    key = weather_cache_key(bot, 'report', latitude, longitude)
+    bot.memory['weather_hot_locations'].record(key, latitude, longitude, location)
+    report, refresh = bot.memory['weather_cache'].get_stale(key)
+    if refresh:
+        refresh_in_background(bot.memory['weather_cache'], [key], bot.memory['weather_inflight'].do,
+                              key, _fetch_and_store, bot, key, latitude, longitude, location)
+    if report is None and bot.memory['weather_quota'].low(
+            bot.config.weather.weather_provider, bot.config.weather.weather_api_key, bot.config.weather.quota_reserve):
+        # Nearly out of budget: a neighbouring area's result beats spending a call
+        report = bot.memory['weather_cache'].get(
+            weather_cache_key(bot, 'report-coarse', latitude, longitude, grid=bot.config.weather.quota_coarse_grid))
+    if report is None:
+        report = bot.memory['weather_inflight'].do(key, _fetch_and_store, bot, key, latitude, longitude, location)
+    return report
+
+
+def get_reports(bot, points):
+    """Return a report for each ``(latitude, longitude, location)`` point.
+
+    Cache misses are fetched together, in one request if the provider can.
+    """
+    cache = bot.memory['weather_cache']
+    keys = [weather_cache_key(bot, 'report', latitude, longitude) for latitude, longitude, _ in points]
+    reports = {}
+    missing = {}
+    due = {}
+    for key, point in zip(keys, points):
+        bot.memory['weather_hot_locations'].record(key, *point)
+        report, refresh = cache.get_stale(key)
+        if refresh:
+            due[key] = point
+        if report is None:
+            missing.setdefault(key, point)
+        else:
+            reports[key] = report
+
+    if due:
+        refresh_in_background(cache, list(due), _fetch_batch_and_store, bot, list(due.values()))
+    if missing:
+        reports.update(zip(missing, _fetch_batch_and_store(bot, list(missing.values()))))
+    return [reports[key] for key in keys]
+
+
+def _fetch_and_store(bot, key, latitude, longitude, location):
+    fetches = [
+        functools.partial(fetch_report, bot, name, latitude, longitude, location)
+        for name in provider_chain(bot)
+    ]
+    report = bot.memory['weather_engine'].call_hedged(
+        fetches, bot.config.weather.hedge_delay, timeout=bot.config.weather.fetch_deadline,
+        final=(RateLimited,))
+    _store_report(bot, key, latitude, longitude, report)
+    return report
+
+
+def _fetch_batch_and_store(bot, points):
+    """Fetch and cache reports for ``(latitude, longitude, location)`` points, in one request if possible."""
+    fetches = [functools.partial(fetch_reports, bot, name, points) for name in provider_chain(bot)]
+    reports = bot.memory['weather_engine'].call_hedged(
+        fetches, bot.config.weather.hedge_delay, timeout=bot.config.weather.fetch_deadline,
+        final=(RateLimited,))
+    for (latitude, longitude, _), report in zip(points, reports):
+        _store_report(bot, weather_cache_key(bot, 'report', latitude, longitude), latitude, longitude, report)
+    return reports
+
+
+def _store_report(bot, key, latitude, longitude, report):
+    cache = bot.memory['weather_cache']
+    cache.set(key, report, ttl=bot.config.weather.weather_cache_ttl)
+    # Under a kind of its own, as a coarse cell can have the same coordinates as a fine one
+    cache.set(weather_cache_key(bot, 'report-coarse', latitude, longitude, grid=bot.config.weather.quota_coarse_grid),
+              report, ttl=bot.config.weather.weather_cache_ttl)
+    # Forecasts change more slowly, so they may outlive the current conditions
+    cache.set(weather_cache_key(bot, 'forecast', latitude, longitude), report['forecast'],
+              ttl=bot.config.weather.forecast_cache_ttl)
+
+
 def get_forecast(bot, trigger):
     try:
-        latitude, longitude, location = get_geocoords(bot, trigger)
+        latitude, longitude, location, _ = get_geocoords(bot, trigger)
     except ValueError as e:
         bot.reply(str(e))
         return NOLIMIT
 
-    # Open-Meteo
-    if bot.config.weather.weather_provider == 'openmeteo':
-        return openmeteo_forecast(bot, latitude, longitude, location)
-    # OpenWeatherMap
-    elif bot.config.weather.weather_provider == 'openweathermap':
-        return openweathermap_forecast(bot, latitude, longitude, location)
-    # Pirate Weather
-    elif bot.config.weather.weather_provider == 'pirateweather':
-        return pirateweather_forecast(bot, latitude, longitude, location)
-    # Tomorrow.io
-    elif bot.config.weather.weather_provider == 'tomorrow':
-        return tomorrow_forecast(bot, latitude, longitude, location)
-    # Unsupported Provider
-    else:
-        raise Exception('Error: Unsupported Provider')
+    data = bot.memory['weather_cache'].get(weather_cache_key(bot, 'forecast', latitude, longitude))
+    if data is None:
+        data = get_report(bot, latitude, longitude, location)['forecast']
+    # Entries are shared by nearby users, so always report the caller's own place name
+    return data.replace(location=location)
+
+
+def get_hourly(bot, trigger, target, hours):
+    """Return the next ``hours`` of hourly forecast for ``target``.
+
+    The whole series is fetched once per grid cell and cached, so later
+    slices for the same place need no upstream request.
+    """
+    latitude, longitude, location, timezone = get_geocoords(bot, trigger, target)
+    key = weather_cache_key(bot, 'hourly', latitude, longitude)
+    series, refresh = bot.memory['weather_cache'].get_stale(key)
+    if refresh:
+        refresh_in_background(bot.memory['weather_cache'], [key], bot.memory['weather_inflight'].do,
+                              key, _fetch_hourly_and_store, bot, key, latitude, longitude, location)
+    if series is None:
+        series = bot.memory['weather_inflight'].do(key, _fetch_hourly_and_store, bot, key, latitude, longitude, location)
+    # Hours are shown in local time, so prefer our own timezone for the location
+    timezone = timezone or timezones.lookup(latitude, longitude) or series.timezone
+    return series.window(time.time(), hours).replace(location=location, timezone=timezone)
+
+
+def _fetch_hourly_and_store(bot, key, latitude, longitude, location):
+    fetches = [
+        functools.partial(fetch_hourly, bot, name, latitude, longitude, location)
+        for name in provider_chain(bot)
+    ]
+    series = bot.memory['weather_engine'].call_hedged(
+        fetches, bot.config.weather.hedge_delay, timeout=bot.config.weather.fetch_deadline,
+        final=(RateLimited,))
+    bot.memory['weather_cache'].set(key, series, ttl=bot.config.weather.forecast_cache_ttl)
+    return series
 
 
 def get_weather(bot, trigger):
     try:
-        latitude, longitude, location = get_geocoords(bot, trigger)
+        latitude, longitude, location, timezone = get_geocoords(bot, trigger)
     except ValueError as e:
         bot.reply(str(e))
         return NOLIMIT
 
-    # Open-Meteo
-    if bot.config.weather.weather_provider == 'openmeteo':
-        return openmeteo_weather(bot, latitude, longitude, location)
-    # OpenWeatherMap
-    elif bot.config.weather.weather_provider == 'openweathermap':
-        return openweathermap_weather(bot, latitude, longitude, location)
-    # Pirate Weather
-    elif bot.config.weather.weather_provider == 'pirateweather':
-        return pirateweather_weather(bot, latitude, longitude, location)
-    # Tomorrow.io
-    elif bot.config.weather.weather_provider == 'tomorrow':
-        return tomorrow_weather(bot, latitude, longitude, location)
-    # Unsupported Provider
-    else:
+    data = get_report(bot, latitude, longitude, location)['weather']
+    if bot.config.weather.sunrise_sunset:
+        # Prefer our own timezone for the location; the provider's is only a fallback
+        timezone = timezone or timezones.lookup(latitude, longitude)
+        if timezone:
+            return data.replace(location=location, timezone=timezone)
+    return data.replace(location=location)
+
+
+def get_weather_many(bot, targets):
+    """Return weather for each target location or nick, or the error looking it up."""
+    nick_locations = bot.memory['weather_nick_locations']
+    points = [None] * len(targets)
+    queries = {}
+    for index, target in enumerate(targets):
+        if bot.config.weather.nick_lookup and ' ' not in target:
+            points[index] = nick_locations.get(target)
+        if points[index] is None:
+            found = local_geocode(bot, target)
+            if found is not None:
+                points[index] = found[:3]
+        if points[index] is None:
+            queries[index] = target
+
+    if queries:
+        with METRICS.timed('geocode'):
+            points_found = geocode_many(bot, list(queries.values()))
+        for index, point in zip(queries, points_found):
+            points[index] = point
+
+    found = [point for point in points if not isinstance(point, Exception)]
+    reports = iter(get_reports(bot, found) if found else [])
+    return [
+        point if isinstance(point, Exception) else next(reports)['weather'].replace(location=point[2])
+        for point in points
+    ]
+
+
+def provider_chain(bot):
+    """Return the configured provider followed by its fallbacks, in order."""
+    chain = [bot.config.weather.weather_provider]
+    for name in bot.config.weather.fallback_providers:
+        if name not in chain:
+            chain.append(name)
+    return chain
+
+
+def parse_api_keys(entries):
+    """Parse ``name:key`` config entries into a dict of API keys by provider."""
+    keys = {}
+    for entry in entries:
+        name, sep, key = entry.partition(':')
+        if not sep or not name.strip() or not key.strip():
+            raise ValueError('Invalid fallback API key {!r}; expected name:key'.format(entry))
+        keys[name.strip()] = key.strip()
+    return keys
+
+
+def check_fallbacks(primary, fallbacks, api_keys):
+    """Check every fallback provider exists and has the key it needs; return ``api_keys``.
+
+    Raise :exc:`ValueError` for an unknown provider, or one that needs an
+    API key but has none of its own in ``fallback_api_keys``.
+    """
+    for name in list(fallbacks) + list(api_keys):
+        if name not in WEATHER_PROVIDERS:
+            raise ValueError('Unknown fallback provider {!r}; expected one of: {}'.format(
+                name, ', '.join(WEATHER_PROVIDERS)))
+    for name in fallbacks:
+        if name != primary and name not in api_keys and get_provider(name).needs_api_key:
+            raise ValueError('Fallback provider {!r} needs its own key in fallback_api_keys'.format(name))
+    return api_keys
+
+
+def provider_api_key(bot, name):
+    """Return the API key to send to provider ``name``."""
+    if name == bot.config.weather.weather_provider:
+        return bot.config.weather.weather_api_key
+    return bot.memory['weather_api_keys'].get(name, '')
+
+
+def load_provider(name):
+    """Return the named weather provider, loading its module on first use."""
+    try:
+        return get_provider(name)
+    except KeyError:
         raise Exception('Error: Unsupported Provider')
 
 
+@contextmanager
+def _calling_provider(bot, name):
+    """Give provider ``name`` its own API key, and charge its quota for each request it sends in this block."""
+    key = provider_api_key(bot, name)
+    with using_api_key(key), transport.sending(functools.partial(spend_quota, bot, name, key)):
+        yield
+
+
+def fetch_report(bot, name, latitude, longitude, location):
+    provider = load_provider(name)
+    try:
+        with METRICS.timed('provider:{}'.format(name)), _calling_provider(bot, name):
+            return normalize_report(provider.report(bot, latitude, longitude, location))
+    except Exception:
+        METRICS.error(name)
+        raise
+
+
+def fetch_hourly(bot, name, latitude, longitude, location):
+    provider = load_provider(name)
+    if not provider.has_hourly:
+        raise Exception('Error: {} has no hourly forecast'.format(name))
+    try:
+        with METRICS.timed('provider:{}'.format(name)), _calling_provider(bot, name):
+            return provider.hourly(bot, latitude, longitude, location)
+    except Exception:
+        METRICS.error(name)
+        raise
+
+
+def fetch_reports(bot, name, points):
+    provider = load_provider(name)
+    try:
+        with METRICS.timed('provider:{}'.format(name)), _calling_provider(bot, name):
+            return [normalize_report(report) for report in provider.reports(bot, points)]
+    except Exception:
+        METRICS.error(name)
+        raise
+
+
+def rate_limited(func):
+    """Charge the command's uncached lookups to its nick and channel, with a notice once they run out."""
+    @functools.wraps(func)
+    def wrapper(bot, trigger):
+        channel = trigger.sender if str(trigger.sender).startswith(CHANNEL_PREFIXES) else None
+        try:
+            with ratelimit.requested_by(trigger.nick, channel), \
+                    transport.sending(functools.partial(charge_upstream, bot)):
+                return func(bot, trigger)
+        except RateLimited as err:
+            if err.notify:
+                bot.notice('{}. Cached places still answer right away.'.format(err), trigger.nick)
+            return NOLIMIT
+    return wrapper
+
+
 @commands('weather', 'wea')
 @example('.weather')
 @example('.weather London')
 @example('.weather Seattle, US')
 @example('.weather 90210')
+@example('.weather London | Paris | Tokyo')
+@example('.weather #channel')
+@METRICS.timer('command:weather')
+@rate_limited
 def weather_command(bot, trigger):
-    """.weather location - Show the weather at the given location."""
+    """.weather location [| location ...] or #channel - Show the weather at the given location(s)."""
     if bot.config.weather.weather_api_key is None or bot.config.weather.weather_api_key == '':
         return bot.reply("Weather API key missing. Please configure this module.")
     if bot.config.weather.geocoords_api_key is None or bot.config.weather.geocoords_api_key == '':
@@ -300,10 +812,12 @@ def weather_command(bot, trigger):
 
     # Ensure we have a location for the user
     location = trigger.group(2)
+    if location and LOCATION_SEPARATOR in location:
+        return weather_many(bot, trigger)
+    if location and location.startswith(CHANNEL_PREFIXES) and ' ' not in location:
+        return weather_roster(bot, trigger, location)
     if not location:
-        latitude = bot.db.get_nick_value(trigger.nick, 'latitude')
-        longitude = bot.db.get_nick_value(trigger.nick, 'longitude')
-        if not latitude or not longitude:
+        if bot.memory['weather_nick_locations'].get(trigger.nick) is None:
             return bot.say("I don't know where you live. "
                            "Give me a location, like {pfx}{command} London, "
                            "or tell me where you live by saying {pfx}setlocation "
@@ -312,48 +826,125 @@ def weather_command(bot, trigger):
 
     try:
         data = get_weather(bot, trigger)
+    except RateLimited:
+        raise
     except Exception as err:
         bot.reply("Could not get weather: " + str(err))
         LOGGER.debug('Error in weather provider.', exc_info=err)
         return
 
-    weather = u'{location}: {temp}, {condition}, {humidity}'.format(
-        location=data['location'],
-        temp=get_temp(data['temp']),
-        condition=data['condition'],
-        humidity=get_humidity(data['humidity'])
-    )
-    # Some providers don't give us UV Index
-    if 'uvindex' in data.keys():
-        weather += ', UV Index: {uvindex}'.format(uvindex=data['uvindex'])
-    # User wants sunrise/sunset information
-    if bot.config.weather.sunrise_sunset:
-        tz = data['timezone']
-        sr = convert_timestamp(data['sunrise'], tz)
-        ss = convert_timestamp(data['sunset'], tz)
-        weather += ', Sunrise: {sunrise} Sunset: {sunset}'.format(sunrise=sr, sunset=ss)
-    weather += ', {wind}'.format(wind=get_wind(data['wind']['speed'], data['wind']['bearing']))
+    with METRICS.timed('render'):
+        weather = bot.memory['weather_renderer'].weather(data)
     return bot.say(weather)
 
 
+def weather_many(bot, trigger):
+    targets = [target.strip() for target in trigger.group(2).split(LOCATION_SEPARATOR) if target.strip()]
+    if not targets:
+        bot.reply('Give me locations separated by {sep}, like {pfx}{command} London {sep} Paris.'.format(
+            sep=LOCATION_SEPARATOR, pfx=bot.config.core.help_prefix, command=trigger.group(1)))
+        return NOLIMIT
+    if len(targets) > bot.config.weather.max_locations:
+        bot.reply('Give me at most {} locations at once.'.format(bot.config.weather.max_locations))
+        return NOLIMIT
+
+    try:
+        results = get_weather_many(bot, targets)
+    except RateLimited:
+        raise
+    except Exception as err:
+        bot.reply("Could not get weather: " + str(err))
+        LOGGER.debug('Error in weather provider.', exc_info=err)
+        return
+
+    renderer = bot.memory['weather_renderer']
+    with METRICS.timed('render'):
+        summaries = [
+            '{}: {}'.format(target, result) if isinstance(result, Exception) else renderer.summary(result)
+            for target, result in zip(targets, results)
+        ]
+    return bot.say(' | '.join(summaries))
+
+
+def weather_roster(bot, trigger, channel_name):
+    # Listing everyone's weather reveals where they live, just like looking them up one by one
+    if not bot.config.weather.nick_lookup:
+        bot.reply('Looking up the weather of other users is disabled here.')
+        return NOLIMIT
+    channel = bot.channels.get(channel_name)
+    if channel is None:
+        bot.reply("I'm not in {}.".format(channel_name))
+        return NOLIMIT
+    if bot.config.weather.roster_ops_only and not channel.has_privilege(trigger.nick, OP):
+        bot.reply('Only channel operators can ask for the weather of everyone in {}.'.format(channel_name))
+        return NOLIMIT
+
+    # One roster per channel per cooldown; claim the slot before doing any work
+    times = bot.memory['weather_roster_times']
+    key = channel_name.lower()
+    now = time.time()
+    wait = times.get(key, 0) + bot.config.weather.roster_cooldown - now
+    if wait > 0:
+        bot.reply('Try again in {:.0f}s.'.format(wait))
+        return NOLIMIT
+    times[key] = now
+
+    # Everyone sharing a grid cell shares a report
+    nick_locations = bot.memory['weather_nick_locations']
+    cells = {}
+    for nick in channel.users:
+        saved = nick_locations.get(nick)
+        if saved is not None:
+            cell = weather_cache_key(bot, 'report', saved[0], saved[1])
+            cells.setdefault(cell, (saved, []))[1].append(str(nick))
+    if not cells:
+        return bot.reply('Nobody in {} has set a location.'.format(channel_name))
+
+    # Most populated places first, in case the reply gets cut off
+    groups = sorted(cells.values(), key=lambda group: (-len(group[1]), group[0][2]))
+    try:
+        reports = get_reports(bot, [point for point, _ in groups])
+    except RateLimited:
+        raise
+    except Exception as err:
+        bot.reply("Could not get weather: " + str(err))
+        LOGGER.debug('Error in weather provider.', exc_info=err)
+        return
+
+    renderer = bot.memory['weather_renderer']
+    with METRICS.timed('render'):
+        summaries = [
+            '{} ({})'.format(renderer.summary(report['weather'].replace(location=point[2])), ', '.join(sorted(nicks)))
+            for (point, nicks), report in zip(groups, reports)
+        ]
+    return bot.say(' | '.join(summaries))
+
+
 @commands('forecast', 'fc')
 @example('.forecast')
 @example('.forecast London')
 @example('.forecast Seattle, US')
 @example('.forecast 90210')
+@example('.forecast hourly')
+@example('.forecast hourly 12 London')
+@METRICS.timer('command:forecast')
+@rate_limited
 def forecast_command(bot, trigger):
-    """.forecast location - Show the weather forecast for the next 4 days at the given location."""
+    """.forecast [hourly [hours]] location - Show the forecast for the next 4 days, or hour by hour, at the given location."""
     if bot.config.weather.weather_api_key is None or bot.config.weather.weather_api_key == '':
         return bot.reply("Weather API key missing. Please configure this module.")
     if bot.config.weather.geocoords_api_key is None or bot.config.weather.geocoords_api_key == '':
         return bot.reply("GeoCoords API key missing. Please configure this module.")
 
-    # Ensure we have a location for the user
     location = trigger.group(2)
+    hourly = HOURLY_PATTERN.match(location or '')
+    if hourly:
+        hours = min(max(int(hourly.group(1) or HOURLY_DEFAULT_HOURS), 1), HOURLY_MAX_HOURS)
+        location = hourly.group(2)
+
+    # Ensure we have a location for the user
     if not location:
-        latitude = bot.db.get_nick_value(trigger.nick, 'latitude')
-        longitude = bot.db.get_nick_value(trigger.nick, 'longitude')
-        if not latitude or not longitude:
+        if bot.memory['weather_nick_locations'].get(trigger.nick) is None:
             return bot.say("I don't know where you live. "
                            "Give me a location, like {pfx}{command} London, "
                            "or tell me where you live by saying {pfx}setlocation "
@@ -361,19 +952,16 @@ def forecast_command(bot, trigger):
                                                          pfx=bot.config.core.help_prefix))
 
     try:
-        data = get_forecast(bot, trigger)
+        data = get_hourly(bot, trigger, location or '', hours) if hourly else get_forecast(bot, trigger)
+    except RateLimited:
+        raise
     except Exception as err:
         bot.reply("Could not get forecast: " + str(err))
         return
 
-    forecast = '{location}'.format(location=data['location'])
-    for day in data['data']:
-        forecast += ' :: {dow} - {summary} - {high_temp} / {low_temp}'.format(
-            dow=day.get('dow'),
-            summary=day.get('summary'),
-            high_temp=get_temp(day.get('high_temp')),
-            low_temp=get_temp(day.get('low_temp'))
-        )
+    renderer = bot.memory['weather_renderer']
+    with METRICS.timed('render'):
+        forecast = renderer.hourly(data) if hourly else renderer.forecast(data)
     return bot.say(forecast)
 
 
@@ -382,6 +970,8 @@ def forecast_command(bot, trigger):
 @example('.setlocation Seattle, US')
 @example('.setlocation 90210')
 @example('.setlocation w7174408')
+@METRICS.timer('command:setlocation')
+@rate_limited
 def update_location(bot, trigger):
     """Set your location for fetching weather."""
     if bot.config.weather.geocoords_api_key is None or bot.config.weather.geocoords_api_key == '':
@@ -394,15 +984,84 @@ def update_location(bot, trigger):
 
     # Get GeoCoords
     try:
-        latitude, longitude, location = get_geocoords(bot, trigger)
+        latitude, longitude, location, timezone = get_geocoords(bot, trigger)
+    except RateLimited:
+        raise
     except Exception as err:
         # Reply with the error message if geocoding fails
         bot.reply("Could not find location details: " + str(err))
         return
 
-    # Assign Latitude & Longitude to user
-    bot.db.set_nick_value(trigger.nick, 'latitude', latitude)
-    bot.db.set_nick_value(trigger.nick, 'longitude', longitude)
-    bot.db.set_nick_value(trigger.nick, 'location', location)
+    # The timezone of a saved location never changes, so look it up once, here
+    timezone = timezone or timezones.lookup(latitude, longitude)
+
+    # Assign Latitude, Longitude & Timezone to user
+    with METRICS.timed('db_write'):
+        bot.memory['weather_nick_locations'].set(trigger.nick, latitude, longitude, location, timezone)
 
     return bot.reply('I now have you at {}'.format(location))
+
+
+@commands('weatherbreakers')
+@require_admin
+def breakers_command(bot, trigger):
+    """Show the circuit breaker state of each weather upstream (admin only)."""
+    breakers = transport.breakers()
+    if not breakers:
+        return bot.reply('No weather upstreams have been called yet.')
+
+    states = []
+    for upstream in breakers:
+        state = upstream.state
+        summary = '{}: {} ({:.0%} failing)'.format(upstream.name, state, upstream.failure_rate)
+        if state == breaker.OPEN:
+            summary += ', retry in {:.0f}s'.format(upstream.retry_in())
+        states.append(summary)
+    return bot.say(' | '.join(states))
+
+
+@commands('weatherstats')
+@require_owner
+def stats_command(bot, trigger):
+    """Show per-stage latency, upstream errors and cache hit rates (owner only)."""
+    summary = METRICS.summary()
+    gazetteer = bot.memory.get('weather_gazetteer')
+    if gazetteer is not None:
+        summary += ' | gazetteer: ' + gazetteer.describe()
+    return bot.say(summary)
+
+
+@interval(PREFETCH_INTERVAL)
+def prefetch_hot_locations(bot):
+    """Refresh the most looked up locations before their cached weather expires."""
+    hot = bot.memory.get('weather_hot_locations')
+    if hot is None or bot.config.weather.prefetch_locations <= 0:
+        return
+
+    cache = bot.memory['weather_cache']
+    points = [
+        point for key, point in hot.top(bot.config.weather.prefetch_locations)
+        if (cache.expires_in(key) or 0) < 2 * PREFETCH_INTERVAL
+    ]
+    hot.decay()
+    if not points or bot.memory['weather_quota'].low(
+            bot.config.weather.weather_provider, bot.config.weather.weather_api_key, bot.config.weather.quota_reserve):
+        # Nothing due, or the remaining budget is better spent on live lookups
+        return
+
+    try:
+        _fetch_batch_and_store(bot, points)
+    except Exception as err:
+        LOGGER.warning('Could not prefetch weather for %d locations: %s', len(points), err)
+    else:
+        LOGGER.debug('Prefetched weather for %d locations', len(points))
+
+
+@interval(60)
+def write_metrics(bot):
+    """Write the metrics to ``metrics_file`` for Prometheus' textfile collector."""
+    if bot.config.weather.metrics_file:
+        try:
+            METRICS.write_prometheus(bot.config.weather.metrics_file)
+        except OSError as err:
+            LOGGER.warning('Could not write weather metrics: %s', err)
@@ -0,0 +1,110 @@
+# coding=utf-8
+"""Circuit breakers guarding each upstream host."""
+from __future__ import unicode_literals, absolute_import, print_function, division
+
+import threading
+import time
+
+from collections import deque
+
+import requests
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half-open'
+
+DEFAULT_FAILURE_RATE = 0.5
+DEFAULT_MIN_CALLS = 5
+DEFAULT_WINDOW = 20
+DEFAULT_COOLDOWN = 60.0
+
+
+class CircuitOpenError(requests.exceptions.RequestException):
+    """Raised instead of calling an upstream whose circuit is open."""
+
+
+class CircuitBreaker(object):
+    """Track an upstream's recent failures and stop calling it while it is unhealthy.
+
+    The breaker opens once at least ``min_calls`` of the last ``window`` calls
+    have been recorded and ``failure_rate`` of them failed. After ``cooldown``
+    seconds it lets a single probe through (half-open); a successful probe
+    closes it again, a failed one re-opens it.
+    """
+
+    def __init__(self, name, failure_rate=DEFAULT_FAILURE_RATE, min_calls=DEFAULT_MIN_CALLS,
+                 window=DEFAULT_WINDOW, cooldown=DEFAULT_COOLDOWN, clock=time.monotonic):
+        self.name = name
+        self.failure_rate_threshold = failure_rate
+        self.min_calls = min_calls
+        self.cooldown = cooldown
+        self.clock = clock
+        self._results = deque(maxlen=window)
+        self._state = CLOSED
+        self._opened_at = 0.0
+        self._probing = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        with self._lock:
+            if self._state == OPEN and self.clock() - self._opened_at >= self.cooldown:
+                return HALF_OPEN
+            return self._state
+
+    @property
+    def failure_rate(self):
+        with self._lock:
+            if not self._results:
+                return 0.0
+            return self._results.count(False) / len(self._results)
+
+    def retry_in(self):
+        """Seconds until an open circuit lets a probe through."""
+        with self._lock:
+            return max(0.0, self._opened_at + self.cooldown - self.clock())
+
+    def allow(self):
+        """Return whether a call may be made now."""
+        with self._lock:
+            if self._state == CLOSED:
+                return True
+            if self._state == OPEN:
+                if self.clock() - self._opened_at < self.cooldown:
+                    return False
+                self._state = HALF_OPEN
+                self._probing = False
+            # Half-open: only one probe at a time
+            if self._probing:
+                return False
+            self._probing = True
+            return True
+
+    def cancel(self):
+        """Give back a call :meth:`allow` granted but that was never made."""
+        with self._lock:
+            if self._state == HALF_OPEN:
+                self._probing = False
+
+    def record_success(self):
+        with self._lock:
+            if self._state == HALF_OPEN:
+                self._state = CLOSED
+                self._probing = False
+                self._results.clear()
+            self._results.append(True)
+
+    def record_failure(self):
+        with self._lock:
+            if self._state == HALF_OPEN:
+                self._trip()
+                return
+            self._results.append(False)
+            if (len(self._results) >= self.min_calls and
+                    self._results.count(False) / len(self._results) >= self.failure_rate_threshold):
+                self._trip()
+
+    def _trip(self):
+        self._state = OPEN
+        self._opened_at = self.clock()
+        self._probing = False
@@ -0,0 +1,163 @@
+# coding=utf-8
+"""Small in-process caches used by the weather plugin."""
+from __future__ import unicode_literals, absolute_import, print_function, division
+
+import math
+import random
+import threading
+import time
+
+from collections import OrderedDict
+
+
+def normalize_query(query):
+    """Case-fold a location query and collapse its whitespace."""
+    return ' '.join(query.casefold().split())
+
+
+def grid_cell(latitude, longitude, precision):
+    """Snap a coordinate pair onto a grid of ``precision`` degrees."""
+    return (
+        round(round(float(latitude) / precision) * precision, 6),
+        round(round(float(longitude) / precision) * precision, 6),
+    )
+
+
+class TTLCache(object):
+    """A thread-safe LRU mapping whose entries expire after ``ttl`` seconds.
+
+    Expiry times are wall-clock timestamps so that a cache dumped with
+    :meth:`dump` can be restored with :meth:`load` after a restart.
+
+    Expired entries are kept for another ``grace`` seconds, for
+    :meth:`get_stale` to serve while they are refreshed. Each TTL is
+    shortened by up to ``jitter`` of itself at random, so entries filled
+    together don't all expire together; ``early`` is the fraction of the
+    TTL over which :meth:`get_stale` asks for refreshes ahead of expiry.
+    """
+
+    def __init__(self, maxsize=256, ttl=3600, clock=time.time, grace=0, jitter=0, early=0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.clock = clock
+        self.grace = grace
+        self.jitter = jitter
+        self.early = early
+        self.hits = 0
+        self.misses = 0
+        self.stale = 0
+        # Entries are (value, expires, ttl)
+        self._data = OrderedDict()
+        # Keys somebody has been asked to refresh, so only one refresh runs at a time
+        self._refreshing = set()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._data)
+
+    def __contains__(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            return entry is not None and entry[1] > self.clock()
+
+    def get(self, key, default=None):
+        """Return the unexpired value for ``key``, or ``default``."""
+        with self._lock:
+            entry = self._data.get(key)
+            now = self.clock()
+            if entry is None or entry[1] <= now:
+                if entry is not None and entry[1] + self.grace <= now:
+                    self._discard(key)
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def get_stale(self, key, default=None):
+        """Return ``(value, refresh)``, serving entries up to ``grace`` seconds past expiry.
+
+        ``refresh`` is true for exactly one caller while the entry has
+        expired, or is found to be due for an early refresh; that caller
+        should refresh it and :meth:`set` the result, or :meth:`release`
+        the key if the refresh fails.
+        """
+        with self._lock:
+            entry = self._data.get(key)
+            now = self.clock()
+            if entry is None or entry[1] + self.grace <= now:
+                if entry is not None:
+                    self._discard(key)
+                self.misses += 1
+                return default, False
+            value, expires, ttl = entry
+            self._data.move_to_end(key)
+            if expires <= now:
+                self.stale += 1
+                due = True
+            else:
+                self.hits += 1
+                # Probabilistic early expiry: ever more likely as expiry nears
+                due = self.early > 0 and now - self.early * ttl * math.log(1.0 - random.random()) >= expires
+            if due and key not in self._refreshing:
+                self._refreshing.add(key)
+                return value, True
+            return value, False
+
+    def release(self, key):
+        """Give up refreshing ``key``, letting the next :meth:`get_stale` caller try."""
+        with self._lock:
+            self._refreshing.discard(key)
+
+    def expires_in(self, key):
+        """Seconds until ``key`` expires, or ``None`` if it is missing; not counted as a lookup."""
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            remaining = entry[1] - self.clock()
+            return remaining if remaining > 0 else None
+
+    def set(self, key, value, ttl=None):
+        ttl = self.ttl if ttl is None else ttl
+        if self.jitter:
+            ttl *= 1 - self.jitter * random.random()
+        expires = self.clock() + ttl
+        with self._lock:
+            self._data[key] = (value, expires, ttl)
+            self._data.move_to_end(key)
+            self._refreshing.discard(key)
+            self._evict()
+
+    def _discard(self, key):
+        del self._data[key]
+        self._refreshing.discard(key)
+
+    def _evict(self):
+        while len(self._data) > self.maxsize:
+            key, _ = self._data.popitem(last=False)
+            self._refreshing.discard(key)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._refreshing.clear()
+
+    def dump(self):
+        """Return the entries still worth serving as a JSON-serializable dict."""
+        now = self.clock()
+        with self._lock:
+            return {
+                key: [value, expires]
+                for key, (value, expires, _) in self._data.items()
+                if expires + self.grace > now
+            }
+
+    def load(self, entries):
+        """Restore entries previously returned by :meth:`dump`."""
+        now = self.clock()
+        with self._lock:
+            for key, (value, expires) in (entries or {}).items():
+                if expires + self.grace > now:
+                    self._data[key] = (value, expires, self.ttl)
+            self._evict()
@@ -0,0 +1,113 @@
+# coding=utf-8
+"""Upstream fetch engine: a bounded pool of HTTP workers, waited on with deadlines.
+
+Sopel runs every command on its own worker thread. Commands hand their
+upstream calls to the engine's pool and wait on them with a deadline, so a
+slow provider costs a command its deadline at most, and no more than
+``workers`` requests are ever in flight at once. Provider fallbacks are
+hedged: the next provider is started when the previous one fails or is slow.
+"""
+from __future__ import unicode_literals, absolute_import, print_function, division
+
+import concurrent.futures
+import contextvars
+import functools
+import time
+
+DEFAULT_WORKERS = 8
+DEFAULT_DEADLINE = 15.0
+
+
+class FetchTimeout(Exception):
+    """Raised when an upstream call does not finish before its deadline."""
+
+
+def _timed_out(futures):
+    for future in futures:
+        future.cancel()
+    return FetchTimeout('Timed out waiting for the weather service.')
+
+
+class FetchEngine(object):
+    """Run upstream calls on a pool of HTTP workers and wait on them with deadlines.
+
+    Calls run in a copy of the caller's context, so context variables set by
+    the command (such as :func:`.transport.sending` hooks) follow its requests.
+    """
+
+    def __init__(self, workers=DEFAULT_WORKERS):
+        self._executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=workers,
+            thread_name_prefix='weather-fetch',
+        )
+
+    def submit(self, func, *args, **kwargs):
+        """Start blocking ``func`` on a worker; return a :class:`concurrent.futures.Future`."""
+        # One copy per call, as a context can't be entered by two threads at once
+        context = contextvars.copy_context()
+        return self._executor.submit(context.run, functools.partial(func, *args, **kwargs))
+
+    def call(self, func, *args, **kwargs):
+        """Run blocking ``func`` on a worker and wait for it with a deadline."""
+        timeout = kwargs.pop('timeout', DEFAULT_DEADLINE)
+        future = self.submit(func, *args, **kwargs)
+        try:
+            return future.result(timeout)
+        except concurrent.futures.TimeoutError:
+            raise _timed_out([future])
+
+    def call_hedged(self, funcs, delay, timeout=DEFAULT_DEADLINE, final=()):
+        """Return the first successful result of the blocking ``funcs``.
+
+        ``funcs`` are tried in order. The next one is started as soon as the
+        previous one fails, or when nothing has answered ``delay`` seconds
+        after the last start; whichever finishes first successfully wins.
+        A failure of one of the ``final`` exception types is raised at once.
+        """
+        deadline = time.monotonic() + timeout
+        funcs = iter(funcs)
+        pending = set()
+        error = None
+
+        def launch():
+            func = next(funcs, None)
+            if func is not None:
+                pending.add(self.submit(func))
+
+        launch()
+        try:
+            while pending:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise _timed_out(pending)
+                done, pending = concurrent.futures.wait(
+                    pending, timeout=min(delay, remaining), return_when=concurrent.futures.FIRST_COMPLETED)
+                for future in done:
+                    if future.exception() is None:
+                        return future.result()
+                    error = future.exception()
+                    if isinstance(error, final):
+                        raise error
+                launch()
+        finally:
+            # Losers that haven't started yet never will; running ones finish on their own
+            for future in pending:
+                future.cancel()
+
+        raise error
+
+    def call_all(self, funcs, timeout=DEFAULT_DEADLINE):
+        """Run the blocking ``funcs`` concurrently; failures are returned, not raised."""
+        futures = [self.submit(func) for func in funcs]
+        _, not_done = concurrent.futures.wait(futures, timeout=timeout)
+        if not_done:
+            raise _timed_out(not_done)
+        return [future.exception() or future.result() for future in futures]
+
+    def stop(self):
+        """Drop queued calls and release the HTTP workers; calls already running are left to finish."""
+        try:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+        except TypeError:
+            # Python < 3.9
+            self._executor.shutdown(wait=False)
@@ -0,0 +1,351 @@
+# coding=utf-8
+"""Offline gazetteer: GeoNames places compiled into a memory-mapped index.
+
+The index is built once from the GeoNames dumps (``citiesNNN.txt``,
+optionally ``admin1CodesASCII.txt`` for state names and a postal code dump)
+with::
+
+    sopel-weather-gazetteer cities15000.txt --admin1 admin1CodesASCII.txt \\
+        --postal allCountries.txt -o gazetteer.idx
+
+and then opened read-only with :class:`Gazetteer`; pages are only loaded
+as lookups touch them, so even large indexes cost little resident memory.
+"""
+from __future__ import unicode_literals, absolute_import, print_function, division
+
+import argparse
+import io
+import mmap
+import struct
+import zlib
+
+from .cache import normalize_query
+
+MAGIC = b'SWGZ'
+VERSION = 2
+
+# Separates a record's tags; state names may contain spaces
+TAG_SEPARATOR = '\x1f'
+
+# magic, version, then the count and offset of each section
+HEADER = struct.Struct('<4sI' + 'II' * 6)
+# latitude, longitude, population, label, tags (offsets into the string table), timezone id
+RECORD = struct.Struct('<ffIIIH')
+# key offset and length in the string table, record id
+KEY = struct.Struct('<III')
+# n-gram hash, first posting, posting count
+GRAM = struct.Struct('<III')
+POSTING = struct.Struct('<I')
+OFFSET = struct.Struct('<I')
+
+# Shortest query matched by prefix, and the most keys scanned for one
+MIN_PREFIX = 4
+MAX_PREFIX_SCAN = 5000
+# Dice coefficient of n-gram overlap a misspelling must reach
+MIN_SIMILARITY = 0.6
+# How much longer either of a misspelling and its match may be; more than that, and the
+# query is likely a longer name (or one with a state, e.g. "Paris Texas") we don't know
+MAX_LENGTH_RATIO = 1.25
+
+
+def ngrams(key):
+    """Trigrams of ``key``, padded so the first and last letters count too."""
+    padded = ' {} '.format(key)
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def _gram_hash(gram):
+    return zlib.crc32(gram.encode('utf-8'))
+
+
+def _read_tsv(path):
+    with io.open(path, encoding='utf-8') as f:
+        for line in f:
+            if line.strip() and not line.startswith('#'):
+                yield line.rstrip('\n').split('\t')
+
+
+def build(cities, output, admin1=None, postal=None):
+    """Compile GeoNames dumps into an index file at ``output``; return its statistics."""
+    states = {}
+    if admin1:
+        for row in _read_tsv(admin1):
+            states[row[0]] = row[1]
+
+    places = []
+    keys = []
+    for row in _read_tsv(cities):
+        name, ascii_name, latitude, longitude = row[1], row[2], row[4], row[5]
+        country, state_code, population, timezone = row[8], row[10], row[14], row[17]
+        state = states.get('{}.{}'.format(country, state_code))
+        label = ', '.join(part for part in (name, state, country) if part)
+        record = len(places)
+        places.append((latitude, longitude, int(population or 0), label, country, {state_code, state}, timezone))
+        for key in {normalize_query(name), normalize_query(ascii_name)}:
+            if key:
+                keys.append((key, record, True))
+
+    if postal:
+        for row in _read_tsv(postal):
+            country, code, place, state, state_code, latitude, longitude = (
+                row[0], row[1], row[2], row[3], row[4], row[9], row[10])
+            if not latitude or not longitude:
+                continue
+            label = ', '.join(part for part in (place, state, country) if part)
+            record = len(places)
+            places.append((latitude, longitude, 0, label, country, {state_code, state}, ''))
+            keys.append((normalize_query(code), record, False))
+
+    strings = bytearray()
+    string_offsets = {}
+
+    def add_string(value, terminated=True):
+        data = value.encode('utf-8') + (b'\0' if terminated else b'')
+        offset = string_offsets.get(data)
+        if offset is None:
+            offset = string_offsets[data] = len(strings)
+            strings.extend(data)
+        return offset
+
+    timezones = {'': 0}
+    timezone_table = bytearray(OFFSET.pack(add_string('')))
+    records = bytearray()
+    for latitude, longitude, population, label, country, tags, timezone in places:
+        if timezone not in timezones:
+            timezones[timezone] = len(timezones)
+            timezone_table.extend(OFFSET.pack(add_string(timezone)))
+        # Country code first, then whatever else a query may narrow the place down by
+        tags = TAG_SEPARATOR.join([normalize_query(country)] + sorted(normalize_query(tag) for tag in tags if tag))
+        records.extend(RECORD.pack(float(latitude), float(longitude), population,
+                                   add_string(label), add_string(tags), timezones[timezone]))
+
+    # Keys sorted bytewise, as the lookup's binary search compares them
+    keys.sort(key=lambda entry: (entry[0].encode('utf-8'), -places[entry[1]][2]))
+    key_table = bytearray()
+    grams = {}
+    previous = None
+    for index, (key, record, is_name) in enumerate(keys):
+        data = key.encode('utf-8')
+        key_table.extend(KEY.pack(add_string(key, terminated=False), len(data), record))
+        # Typo matching only covers place names, and each distinct name once
+        if is_name and key != previous:
+            for gram in ngrams(key):
+                grams.setdefault(_gram_hash(gram), []).append(index)
+        previous = key
+
+    gram_table = bytearray()
+    postings = bytearray()
+    posting_count = 0
+    for gram_hash in sorted(grams):
+        entries = grams[gram_hash]
+        gram_table.extend(GRAM.pack(gram_hash, posting_count, len(entries)))
+        for entry in entries:
+            postings.extend(POSTING.pack(entry))
+        posting_count += len(entries)
+
+    sections = [
+        (len(places), records),
+        (len(keys), key_table),
+        (len(grams), gram_table),
+        (posting_count, postings),
+        (len(timezones), timezone_table),
+        (len(strings), strings),
+    ]
+    header = [MAGIC, VERSION]
+    offset = HEADER.size
+    for count, data in sections:
+        header.extend((count, offset))
+        offset += len(data)
+
+    with open(output, 'wb') as f:
+        f.write(HEADER.pack(*header))
+        for _, data in sections:
+            f.write(data)
+
+    return {'places': len(places), 'keys': len(keys), 'ngrams': len(grams), 'bytes': offset}
+
+
+class Gazetteer(object):
+    """Look places up by name or postal code in an index built by :func:`build`."""
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        fields = HEADER.unpack_from(self._mm, 0)
+        if fields[0] != MAGIC or fields[1] != VERSION:
+            self._mm.close()
+            raise ValueError('{} is not a sopel-weather gazetteer (version {})'.format(path, VERSION))
+        (self._records, self._records_at, self._keys, self._keys_at, self._grams, self._grams_at,
+         self._postings, self._postings_at, self._timezones, self._timezones_at,
+         self._strings, self._strings_at) = fields[2:]
+
+    def __len__(self):
+        return self._records
+
+    def close(self):
+        self._mm.close()
+
+    def memory_usage(self):
+        """Bytes mapped by each section of the index."""
+        return {
+            'records': self._records * RECORD.size,
+            'keys': self._keys * KEY.size,
+            'ngrams': self._grams * GRAM.size + self._postings * POSTING.size,
+            'strings': self._strings,
+            'total': len(self._mm),
+        }
+
+    def describe(self):
+        return '{} places, {} names, {:.1f} MiB mapped'.format(
+            self._records, self._keys, len(self._mm) / (1024 * 1024))
+
+    def _string(self, offset):
+        start = self._strings_at + offset
+        return self._mm[start:self._mm.find(b'\0', start)].decode('utf-8')
+
+    def _key(self, index):
+        offset, length, record = KEY.unpack_from(self._mm, self._keys_at + index * KEY.size)
+        start = self._strings_at + offset
+        return self._mm[start:start + length], record
+
+    def _record(self, index):
+        latitude, longitude, population, label, tags, timezone = RECORD.unpack_from(
+            self._mm, self._records_at + index * RECORD.size)
+        if timezone:
+            timezone = self._string(OFFSET.unpack_from(self._mm, self._timezones_at + timezone * OFFSET.size)[0])
+        return {
+            'latitude': latitude,
+            'longitude': longitude,
+            'population': population,
+            'label': label,
+            'tags': tags,
+            'timezone': timezone or None,
+        }
+
+    def _lower_bound(self, data):
+        low, high = 0, self._keys
+        while low < high:
+            middle = (low + high) // 2
+            if self._key(middle)[0] < data:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def _matches(self, data, prefix=False, limit=None):
+        """Records whose key equals (or starts with) ``data``."""
+        index = self._lower_bound(data)
+        end = min(self._keys, index + limit) if limit else self._keys
+        while index < end:
+            key, record = self._key(index)
+            if key != data and not (prefix and key.startswith(data)):
+                break
+            yield record
+            index += 1
+
+    def _similar(self, name):
+        """The first key index of the indexed name most like ``name``, or ``None``."""
+        grams = ngrams(name)
+        counts = {}
+        for gram in grams:
+            gram_hash = _gram_hash(gram)
+            low, high = 0, self._grams
+            while low < high:
+                middle = (low + high) // 2
+                if GRAM.unpack_from(self._mm, self._grams_at + middle * GRAM.size)[0] < gram_hash:
+                    low = middle + 1
+                else:
+                    high = middle
+            if low == self._grams:
+                continue
+            found, first, count = GRAM.unpack_from(self._mm, self._grams_at + low * GRAM.size)
+            if found != gram_hash:
+                continue
+            for posting in range(first, first + count):
+                key = POSTING.unpack_from(self._mm, self._postings_at + posting * POSTING.size)[0]
+                counts[key] = counts.get(key, 0) + 1
+
+        best, best_score = None, MIN_SIMILARITY
+        for key, common in counts.items():
+            # Cheap upper bound before decoding the candidate
+            if 2 * common / (len(grams) + common) < best_score:
+                continue
+            candidate = self._key(key)[0].decode('utf-8')
+            if max(len(name), len(candidate)) > MAX_LENGTH_RATIO * min(len(name), len(candidate)):
+                continue
+            score = 2 * common / (len(grams) + len(ngrams(candidate)))
+            if score > best_score:
+                best, best_score = candidate, score
+        return best
+
+    def _best(self, records, qualifiers, places_only=False):
+        best = None
+        countries = set()
+        for index in records:
+            record = self._record(index)
+            if places_only and not record['population']:
+                continue
+            tags = self._string(record['tags']).split(TAG_SEPARATOR)
+            if not all(qualifier in tags for qualifier in qualifiers):
+                continue
+            if not record['population']:
+                # Postal codes have no population; only their country can settle a tie
+                countries.add(tags[0])
+            if best is None or record['population'] > best['population']:
+                best = record
+        if best is not None and not best['population'] and len(countries) > 1:
+            return None
+        return best
+
+    def lookup(self, query):
+        """Return ``(latitude, longitude, location, timezone)`` for ``query``, or ``None``.
+
+        Exact names and postal codes are tried first, then name prefixes,
+        then the closest name of about the same length by n-gram similarity;
+        anything else is left to the geocoder. Anything after the first
+        comma (a state or country code, say) must match the place found.
+        """
+        parts = [part.strip() for part in normalize_query(query).split(',')]
+        name, qualifiers = parts[0], [part for part in parts[1:] if part]
+        if not name:
+            return None
+        data = name.encode('utf-8')
+
+        record = self._best(self._matches(data), qualifiers)
+        if record is None and len(name) >= MIN_PREFIX:
+            record = self._best(self._matches(data, prefix=True, limit=MAX_PREFIX_SCAN), qualifiers,
+                                places_only=True)
+        if record is None and len(name) >= MIN_PREFIX:
+            similar = self._similar(name)
+            if similar is not None:
+                record = self._best(self._matches(similar.encode('utf-8')), qualifiers, places_only=True)
+        if record is None:
+            return None
+
+        return ('{:.4f}'.format(record['latitude']), '{:.4f}'.format(record['longitude']),
+                self._string(record['label']), record['timezone'])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Build the sopel-weather offline gazetteer from GeoNames dumps.')
+    parser.add_argument('cities', help='GeoNames cities dump, e.g. cities15000.txt')
+    parser.add_argument('--admin1', help='GeoNames admin1CodesASCII.txt, for state and region names')
+    parser.add_argument('--postal', help='GeoNames postal code dump, e.g. allCountries.txt')
+    parser.add_argument('-o', '--output', default='gazetteer.idx', help='index file to write')
+    args = parser.parse_args(argv)
+
+    build(args.cities, args.output, admin1=args.admin1, postal=args.postal)
+    gazetteer = Gazetteer(args.output)
+    try:
+        print('Wrote {}: {}'.format(args.output, gazetteer.describe()))
+        for section, size in sorted(gazetteer.memory_usage().items()):
+            print('  {:<8} {:>12,} bytes'.format(section, size))
+    finally:
+        gazetteer.close()
+    # The console script exits with what we return, so report success
+    return 0
+
+
+if __name__ == '__main__':
+    main()
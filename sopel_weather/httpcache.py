@@ -0,0 +1,168 @@
+# coding=utf-8
+"""SQLite-backed HTTP response cache that survives restarts.
+
+Responses are stored compressed, keyed by their normalized URL with API keys
+removed, and kept as long as ``Cache-Control``/``Expires`` allow. Stale
+entries with an ``ETag`` or ``Last-Modified`` are revalidated with a
+conditional request instead of being downloaded again.
+"""
+from __future__ import unicode_literals, absolute_import, print_function, division
+
+import json
+import sqlite3
+import threading
+import time
+import zlib
+
+from email.utils import parsedate_to_datetime
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+# Query parameters carrying credentials; never part of a cache key
+SECRET_PARAMS = frozenset(('key', 'apikey', 'appid', 'api_key', 'token'))
+# Stale entries are dropped this long after expiring, validators or not
+DEFAULT_MAX_STALE = 7 * 24 * 60 * 60
+REDACTED = '-'
+
+
+def cache_key(url, params=None, secrets=()):
+    """Normalize a request into a cache key without credentials.
+
+    ``secrets`` are values to blank wherever they appear, for APIs that put
+    the key in the URL path.
+    """
+    parts = urlsplit(url)
+    query = parse_qsl(parts.query) + sorted((params or {}).items())
+    query = sorted((name, str(value)) for name, value in query if name.lower() not in SECRET_PARAMS)
+    path = parts.path
+    for secret in secrets:
+        if secret:
+            path = path.replace(secret, REDACTED)
+    return urlunsplit((parts.scheme.lower(), parts.netloc.lower(), path, urlencode(query), ''))
+
+
+def freshness(headers, now=None):
+    """Seconds ``headers`` allow a response to be reused for, or ``None`` if it must not be stored."""
+    now = time.time() if now is None else now
+    directives = {}
+    for directive in headers.get('Cache-Control', '').split(','):
+        name, _, value = directive.strip().partition('=')
+        directives[name.lower()] = value.strip('"')
+
+    if 'no-store' in directives or 'private' in directives:
+        return None
+    if 'no-cache' in directives:
+        return 0
+    if 'max-age' in directives:
+        try:
+            return max(0, int(directives['max-age']) - int(headers.get('Age', 0)))
+        except ValueError:
+            return 0
+    if 'Expires' in headers:
+        try:
+            return max(0, parsedate_to_datetime(headers['Expires']).timestamp() - now)
+        except (TypeError, ValueError):
+            return 0
+    return 0
+
+
+class CachedResponse(object):
+    __slots__ = ('status', 'headers', 'body', 'etag', 'last_modified', 'expires')
+
+    def __init__(self, status, headers, body, etag, last_modified, expires):
+        self.status = status
+        self.headers = headers
+        self.body = body
+        self.etag = etag
+        self.last_modified = last_modified
+        self.expires = expires
+
+    def fresh(self, now=None):
+        return self.expires > (time.time() if now is None else now)
+
+    def validators(self):
+        """Conditional request headers for revalidating this response."""
+        headers = {}
+        if self.etag:
+            headers['If-None-Match'] = self.etag
+        if self.last_modified:
+            headers['If-Modified-Since'] = self.last_modified
+        return headers
+
+
+class ResponseCache(object):
+    """Store successful responses in SQLite, compressed with zlib."""
+
+    def __init__(self, path, max_stale=DEFAULT_MAX_STALE, clock=time.time):
+        self.path = path
+        self.max_stale = max_stale
+        self.clock = clock
+        self.hits = 0
+        self.misses = 0
+        self.revalidated = 0
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        with self._db:
+            self._db.execute(
+                'CREATE TABLE IF NOT EXISTS responses ('
+                'key TEXT PRIMARY KEY, status INTEGER, headers TEXT, body BLOB, '
+                'etag TEXT, last_modified TEXT, expires REAL)'
+            )
+        self.prune()
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+    def __len__(self):
+        with self._lock:
+            return self._db.execute('SELECT COUNT(*) FROM responses').fetchone()[0]
+
+    def get(self, key):
+        """Return the stored response for ``key``, fresh or stale, or ``None``.
+
+        Only fresh responses count as hits.
+        """
+        with self._lock:
+            row = self._db.execute(
+                'SELECT status, headers, body, etag, last_modified, expires FROM responses WHERE key = ?',
+                (key,)).fetchone()
+            if row is None or row[5] <= self.clock():
+                self.misses += 1
+            else:
+                self.hits += 1
+        if row is None:
+            return None
+        status, headers, body, etag, last_modified, expires = row
+        return CachedResponse(status, json.loads(headers), zlib.decompress(body), etag, last_modified, expires)
+
+    def set(self, key, status, headers, body):
+        """Store a response if its headers allow it; return whether it was stored."""
+        lifetime = freshness(headers, self.clock())
+        etag = headers.get('ETag')
+        last_modified = headers.get('Last-Modified')
+        if lifetime is None or not (lifetime or etag or last_modified):
+            return False
+        # Only what a reader of the cached response needs
+        kept = {name: headers[name] for name in ('Content-Type', 'Date') if name in headers}
+        with self._lock, self._db:
+            self._db.execute(
+                'REPLACE INTO responses (key, status, headers, body, etag, last_modified, expires) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?)',
+                (key, status, json.dumps(kept), zlib.compress(body), etag, last_modified, self.clock() + lifetime))
+        return True
+
+    def refresh(self, key, headers):
+        """Extend a stale entry after the upstream confirmed it (``304 Not Modified``)."""
+        lifetime = freshness(headers, self.clock()) or 0
+        with self._lock, self._db:
+            self.revalidated += 1
+            self._db.execute('UPDATE responses SET expires = ? WHERE key = ?', (self.clock() + lifetime, key))
+
+    def prune(self):
+        """Forget entries that expired more than ``max_stale`` seconds ago."""
+        with self._lock, self._db:
+            self._db.execute('DELETE FROM responses WHERE expires < ?', (self.clock() - self.max_stale,))
+
+    def clear(self):
+        with self._lock, self._db:
+            self._db.execute('DELETE FROM responses')
@@ -0,0 +1,99 @@
+# coding=utf-8
+"""In-memory index of the locations users saved with ``.setlocation``."""
+from __future__ import unicode_literals, absolute_import, print_function, division
+
+import json
+import threading
+
+from sqlalchemy import select
+
+from sopel.db import Nicknames, NickValues
+
+LOCATION_KEYS = ('latitude', 'longitude', 'location')
+# Saved since timezones were looked up at .setlocation time; older entries lack it.
+# Not 'timezone', which belongs to Sopel's own .settz
+TIMEZONE_KEY = 'weather_timezone'
+
+
+class NickLocationIndex(object):
+    """Map nicks (and their aliases) to a saved ``(latitude, longitude, location)``
+    and, where known, the location's IANA timezone.
+
+    The index is filled from the database once, then kept current by
+    :meth:`set`, so command handlers never need a database round trip to
+    find out where someone lives.
+    """
+
+    def __init__(self, db):
+        self.db = db
+        self._slugs = {}
+        self._locations = {}
+        self._timezones = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._locations)
+
+    def _slug(self, nick):
+        return self.db.make_identifier(nick).lower()
+
+    def load(self):
+        """(Re)build the index from every saved nick location in the database."""
+        query = (
+            select(Nicknames.slug, NickValues.nick_id, NickValues.key, NickValues.value)
+            .join(Nicknames, Nicknames.nick_id == NickValues.nick_id)
+            .where(NickValues.key.in_(LOCATION_KEYS + (TIMEZONE_KEY,)))
+        )
+        slugs = {}
+        values = {}
+        with self.db.session() as session:
+            for slug, nick_id, key, value in session.execute(query):
+                slugs[slug] = nick_id
+                try:
+                    value = json.loads(value)
+                except (TypeError, ValueError):
+                    pass
+                values.setdefault(nick_id, {})[key] = value
+
+        locations = {}
+        timezones = {}
+        for nick_id, saved in values.items():
+            if all(saved.get(key) for key in LOCATION_KEYS):
+                locations[nick_id] = tuple(saved[key] for key in LOCATION_KEYS)
+                if saved.get(TIMEZONE_KEY):
+                    timezones[nick_id] = saved[TIMEZONE_KEY]
+
+        with self._lock:
+            self._slugs = {slug: nick_id for slug, nick_id in slugs.items() if nick_id in locations}
+            self._locations = locations
+            self._timezones = timezones
+
+    def get(self, nick):
+        """Return the saved location for ``nick``, or ``None``."""
+        with self._lock:
+            nick_id = self._slugs.get(self._slug(nick))
+            return self._locations.get(nick_id)
+
+    def get_timezone(self, nick):
+        """Return the timezone saved with ``nick``'s location, or ``None``."""
+        with self._lock:
+            nick_id = self._slugs.get(self._slug(nick))
+            return self._timezones.get(nick_id)
+
+    def set(self, nick, latitude, longitude, location, timezone=None):
+        """Save ``nick``'s location (and its timezone, if known) to the database and the index."""
+        self.db.set_nick_value(nick, 'latitude', latitude)
+        self.db.set_nick_value(nick, 'longitude', longitude)
+        self.db.set_nick_value(nick, 'location', location)
+        if timezone:
+            self.db.set_nick_value(nick, TIMEZONE_KEY, timezone)
+        else:
+            self.db.delete_nick_value(nick, TIMEZONE_KEY)
+        nick_id = self.db.get_nick_id(nick)
+        with self._lock:
+            self._slugs[self._slug(nick)] = nick_id
+            self._locations[nick_id] = (latitude, longitude, location)
+            if timezone:
+                self._timezones[nick_id] = timezone
+            else:
+                self._timezones.pop(nick_id, None)
@@ -0,0 +1,131 @@
+# coding=utf-8
+"""Normalized weather records produced by every provider.
+
+Plain ``__slots__`` classes rather than dicts: thousands of cached reports
+cost a fraction of the memory, and a misspelt field is an ``AttributeError``
+instead of a silent ``KeyError`` at render time.
+"""
+from __future__ import unicode_literals, absolute_import, print_function, division
+
+from array import array
+from bisect import bisect_right
+
+
+class _Record(object):
+    __slots__ = ()
+
+    def __eq__(self, other):
+        return type(other) is type(self) and all(
+            getattr(self, name) == getattr(other, name) for name in self.__slots__)
+
+    def __ne__(self, other):
+        return not self == other
+
+    __hash__ = None
+
+    def __repr__(self):
+        return '{}({})'.format(type(self).__name__, ', '.join(
+            '{}={!r}'.format(name, getattr(self, name)) for name in self.__slots__))
+
+    def replace(self, **changes):
+        """Return a copy with ``changes`` applied; records are shared through the caches, so never mutate one."""
+        values = {name: getattr(self, name) for name in self.__slots__}
+        values.update(changes)
+        return type(self)(**values)
+
+
+class WeatherReport(_Record):
+    """Current conditions: temperatures in °C, wind speed in m/s, humidity from 0 to 1."""
+
+    __slots__ = ('location', 'temp', 'condition', 'humidity', 'wind_speed', 'wind_bearing',
+                 'uvindex', 'timezone', 'sunrise', 'sunset')
+
+    def __init__(self, location, temp, condition, humidity, wind_speed, wind_bearing,
+                 uvindex=None, timezone=None, sunrise=None, sunset=None):
+        self.location = location
+        self.temp = temp
+        self.condition = condition
+        self.humidity = humidity
+        self.wind_speed = wind_speed
+        self.wind_bearing = wind_bearing
+        # Not every provider reports these
+        self.uvindex = uvindex
+        self.timezone = timezone
+        # Unix timestamps, only filled in when sunrise_sunset is enabled
+        self.sunrise = sunrise
+        self.sunset = sunset
+
+    @classmethod
+    def from_dict(cls, data):
+        """Build a report from the dict format providers returned before these records existed."""
+        return cls(data['location'], data['temp'], data['condition'], data['humidity'],
+                   data['wind']['speed'], data['wind']['bearing'], uvindex=data.get('uvindex'),
+                   timezone=data.get('timezone'), sunrise=data.get('sunrise'), sunset=data.get('sunset'))
+
+
+class ForecastDay(_Record):
+    """One day of a forecast; temperatures in °C."""
+
+    __slots__ = ('dow', 'summary', 'high_temp', 'low_temp')
+
+    def __init__(self, dow, summary, high_temp, low_temp):
+        self.dow = dow
+        self.summary = summary
+        self.high_temp = high_temp
+        self.low_temp = low_temp
+
+
+class Forecast(_Record):
+    """The daily forecast for a location."""
+
+    __slots__ = ('location', 'days')
+
+    def __init__(self, location, days):
+        self.location = location
+        self.days = days
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data['location'], [
+            ForecastDay(day.get('dow'), day.get('summary'), day.get('high_temp'), day.get('low_temp'))
+            for day in data['data']
+        ])
+
+
+class HourlySeries(_Record):
+    """An hourly forecast stored as parallel columns, one entry per hour.
+
+    ``times`` holds Unix timestamps; ``temp`` (°C), ``precipitation`` (mm)
+    and ``wind_speed`` (m/s) are 4-byte float arrays, so a day of hours is
+    a few hundred bytes however many slices are taken from it.
+    """
+
+    __slots__ = ('location', 'timezone', 'times', 'temp', 'precipitation', 'wind_speed')
+
+    def __init__(self, location, timezone, times, temp, precipitation, wind_speed):
+        self.location = location
+        self.timezone = timezone
+        self.times = array('q', times)
+        self.temp = array('f', temp)
+        self.precipitation = array('f', precipitation)
+        self.wind_speed = array('f', wind_speed)
+
+    def __len__(self):
+        return len(self.times)
+
+    def window(self, start, hours):
+        """Return the ``hours`` entries from the one covering ``start`` onwards."""
+        first = max(bisect_right(self.times, start) - 1, 0)
+        last = first + hours
+        return HourlySeries(self.location, self.timezone, self.times[first:last], self.temp[first:last],
+                            self.precipitation[first:last], self.wind_speed[first:last])
+
+
+def normalize_report(report):
+    """Accept reports whose parts are still plain dicts, e.g. from third-party providers."""
+    weather, forecast = report['weather'], report['forecast']
+    if isinstance(weather, dict):
+        weather = WeatherReport.from_dict(weather)
+    if isinstance(forecast, dict):
+        forecast = Forecast.from_dict(forecast)
+    return {'weather': weather, 'forecast': forecast}
@@ -0,0 +1,55 @@
+# coding=utf-8
+"""Ranking of frequently queried locations, for background refreshes."""
+from __future__ import unicode_literals, absolute_import, print_function, division
+
+import heapq
+import threading
+
+DEFAULT_MAXSIZE = 1024
+DEFAULT_DECAY = 0.5
+
+
+class HotLocations(object):
+    """Count lookups per weather cache key, weighted towards recent traffic.
+
+    Every :meth:`decay` scales the counts down, so a location stays near the
+    top only while people keep asking for it; counts that drop below one
+    lookup are forgotten.
+    """
+
+    def __init__(self, maxsize=DEFAULT_MAXSIZE, decay=DEFAULT_DECAY):
+        self.maxsize = maxsize
+        self.factor = decay
+        self._counts = {}
+        self._points = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._counts)
+
+    def record(self, key, latitude, longitude, location):
+        """Count one lookup of ``key``, remembering a point inside it."""
+        with self._lock:
+            if key not in self._counts:
+                if len(self._counts) >= self.maxsize:
+                    # Full until the next decay; a new location is not hot yet anyway
+                    return
+                self._counts[key] = 0
+            self._counts[key] += 1
+            self._points[key] = (latitude, longitude, location)
+
+    def top(self, n):
+        """Return the ``n`` most looked up ``(key, (latitude, longitude, location))`` pairs."""
+        with self._lock:
+            keys = heapq.nlargest(n, self._counts, key=self._counts.__getitem__)
+            return [(key, self._points[key]) for key in keys]
+
+    def decay(self):
+        with self._lock:
+            for key in list(self._counts):
+                count = self._counts[key] * self.factor
+                if count < 1:
+                    del self._counts[key]
+                    del self._points[key]
+                else:
+                    self._counts[key] = count
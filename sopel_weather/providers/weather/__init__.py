@@ -0,0 +1,171 @@
+# coding=utf-8
+"""Weather provider registry.
+
+Built-in providers live in this package; third-party packages can add their
+own by exposing a :class:`WeatherProvider` instance under the
+``sopel_weather.providers`` entry point group, e.g.::
+
+    [project.entry-points."sopel_weather.providers"]
+    myweather = "my_package.weather:PROVIDER"
+
+Provider modules are only imported when a provider is first used.
+"""
+from __future__ import unicode_literals, absolute_import, print_function, division
+
+import contextvars
+import importlib
+import threading
+
+from contextlib import contextmanager
+from importlib import metadata
+
+ENTRY_POINT_GROUP = 'sopel_weather.providers'
+
+BUILTIN_PROVIDERS = {
+    'openmeteo': 'sopel_weather.providers.weather.openmeteo:PROVIDER',
+    'openweathermap': 'sopel_weather.providers.weather.openweathermap:PROVIDER',
+    'pirateweather': 'sopel_weather.providers.weather.pirateweather:PROVIDER',
+    'tomorrow': 'sopel_weather.providers.weather.tomorrow:PROVIDER',
+}
+
+# Hours of hourly forecast fetched at once; replies take slices of them
+HOURLY_HOURS = 24
+
+_loaded = {}
+_lock = threading.Lock()
+
+# The key of the provider being called, when it isn't ``weather_api_key``
+_api_key = contextvars.ContextVar('sopel_weather_api_key', default=None)
+
+
+class WeatherProvider(object):
+    """A weather provider returning normalized current conditions and forecasts.
+
+    Either pass ``weather``, ``forecast`` and (optionally) ``report``
+    callables taking ``(bot, latitude, longitude, location)``, or subclass and
+    override the methods of the same names; a provider needs ``report``, or
+    both ``weather`` and ``forecast``, and is refused with :exc:`TypeError`
+    otherwise. ``report`` returns
+    ``{'weather': ..., 'forecast': ...}``; providers whose API can return both
+    in one response should implement it with a single request.
+
+    ``weather`` returns a :class:`~sopel_weather.model.WeatherReport` and
+    ``forecast`` a :class:`~sopel_weather.model.Forecast`. The plain dicts
+    providers used to return are still accepted and converted.
+
+    Providers whose API accepts several coordinates at once can also pass
+    ``reports``, taking ``(bot, points)`` with ``points`` a list of
+    ``(latitude, longitude, location)`` and returning one report per point.
+
+    Providers with an hourly forecast can pass ``hourly``, taking the same
+    arguments as ``weather`` and returning a
+    :class:`~sopel_weather.model.HourlySeries` of the next
+    :data:`HOURLY_HOURS` hours.
+
+    Providers should send the key returned by :func:`api_key`, so they can be
+    used as a fallback with a key of their own. Pass ``needs_api_key=False``
+    if the API takes no key at all.
+    """
+
+    def __init__(self, name, weather=None, forecast=None, report=None, reports=None, hourly=None,
+                 needs_api_key=True):
+        self.name = name
+        self.needs_api_key = needs_api_key
+        self._weather = weather
+        self._forecast = forecast
+        self._report = report
+        self._reports = reports
+        self._hourly = hourly
+        if not (self._implements('report') or (self._implements('weather') and self._implements('forecast'))):
+            raise TypeError('Weather provider {!r} needs report, or both weather and forecast'.format(name))
+
+    def _implements(self, method):
+        """Whether ``method`` was passed as a callable or overridden by a subclass."""
+        return (getattr(self, '_' + method) is not None
+                or getattr(type(self), method) is not getattr(WeatherProvider, method))
+
+    @property
+    def batched(self):
+        """Whether :meth:`reports` fetches every point in one request."""
+        return self._reports is not None
+
+    @property
+    def has_hourly(self):
+        """Whether :meth:`hourly` is implemented."""
+        return self._implements('hourly')
+
+    def weather(self, bot, latitude, longitude, location):
+        if self._weather is None:
+            # Only report was given, which the constructor made sure of
+            return self.report(bot, latitude, longitude, location)['weather']
+        return self._weather(bot, latitude, longitude, location)
+
+    def forecast(self, bot, latitude, longitude, location):
+        if self._forecast is None:
+            return self.report(bot, latitude, longitude, location)['forecast']
+        return self._forecast(bot, latitude, longitude, location)
+
+    def hourly(self, bot, latitude, longitude, location):
+        if self._hourly is None:
+            # Callers check has_hourly first
+            raise NotImplementedError('{} has no hourly forecast'.format(self.name))
+        return self._hourly(bot, latitude, longitude, location)
+
+    def report(self, bot, latitude, longitude, location):
+        if self._report is None:
+            return {
+                'weather': self.weather(bot, latitude, longitude, location),
+                'forecast': self.forecast(bot, latitude, longitude, location),
+            }
+        return self._report(bot, latitude, longitude, location)
+
+    def reports(self, bot, points):
+        if self._reports is None:
+            return [self.report(bot, latitude, longitude, location) for latitude, longitude, location in points]
+        return self._reports(bot, points)
+
+
+def api_key(bot):
+    """Return the API key the provider being called should send."""
+    key = _api_key.get()
+    return bot.config.weather.weather_api_key if key is None else key
+
+
+@contextmanager
+def using_api_key(key):
+    """Make :func:`api_key` return ``key`` for the provider calls in this block."""
+    token = _api_key.set(key)
+    try:
+        yield
+    finally:
+        _api_key.reset(token)
+
+
+def _entry_points():
+    entry_points = metadata.entry_points()
+    if hasattr(entry_points, 'select'):
+        return entry_points.select(group=ENTRY_POINT_GROUP)
+    # Python < 3.10
+    return entry_points.get(ENTRY_POINT_GROUP, [])
+
+
+def provider_specs():
+    """Map every known provider name to its ``module:attribute`` spec."""
+    specs = dict(BUILTIN_PROVIDERS)
+    for entry_point in _entry_points():
+        specs.setdefault(entry_point.name, entry_point.value)
+    return specs
+
+
+def get_provider(name):
+    """Return the provider registered as ``name``, importing it on first use."""
+    with _lock:
+        provider = _loaded.get(name)
+        if provider is None:
+            spec = provider_specs().get(name)
+            if spec is None:
+                raise KeyError(name)
+            module_name, _, attr = spec.partition(':')
+            provider = getattr(importlib.import_module(module_name), attr)
+            _loaded[name] = provider
+    return provider
@@ -1,7 +1,16 @@
 # coding=utf-8
+from datetime import datetime
+
 import requests
 
-from datetime import datetime
+from sopel.tools import get_logger
+
+from . import HOURLY_HOURS, WeatherProvider
+from ... import transport
+from ...model import Forecast, ForecastDay, HourlySeries, WeatherReport
+from ...stats import METRICS
+
+LOGGER = get_logger('weather')
 
 
 API_ENDPOINT = 'https://api.open-meteo.com/v1/forecast'
@@ -41,78 +50,138 @@ WEATHERCODE_MAP = {
 }
 
 
-def openmeteo_forecast(bot, latitude, longitude, location):
-    params = {
-        'latitude': latitude,
-        'longitude': longitude,
-        'daily': 'temperature_2m_min,temperature_2m_max,weathercode',
-        'timeformat': 'unixtime',
-        'timezone': 'auto',
-    }
+# Only the fields we render; sunrise and sunset only when they are shown
+CURRENT_FIELDS = 'temperature_2m,relative_humidity_2m,weather_code,wind_speed_10m,wind_direction_10m'
+FORECAST_FIELDS = 'temperature_2m_min,temperature_2m_max,weathercode'
+SUN_FIELDS = 'sunrise,sunset'
+HOURLY_FIELDS = 'temperature_2m,precipitation,wind_speed_10m'
+FORECAST_DAYS = 4
+# Coordinates per request; Open-Meteo takes comma-separated lists of them
+BATCH_SIZE = 100
+
+
+def _request(latitude, longitude, params):
+    params = dict(params, latitude=latitude, longitude=longitude, timeformat='unixtime', timezone='auto')
 
     try:
-        r = requests.get(API_ENDPOINT, params=params)
-    except:
+        r = transport.get(API_ENDPOINT, params=params)
+    except requests.exceptions.RequestException as err:
+        # Only the type: requests' messages include the URL, and with it the API key
+        LOGGER.warning('openmeteo request failed: %s', type(err).__name__)
         raise Exception("An Error Occurred. Check Logs For More Information.")
 
-    data = r.json()
-    if r.status_code != 200 or data.get('error') == 'true':
+    with METRICS.timed('json'):
+        data = r.json()
+    # Several coordinates give back a list of results; errors are always a single object
+    if r.status_code != 200 or (isinstance(data, dict) and data.get('error') == 'true'):
         raise Exception('Error: {}'.format(data['reason']))
+    return data
 
-    weather_data = {'location': location, 'data': []}
-    data = data['daily']
-    for day in range(4):
-        condition = data['weathercode'][day]
-        condition = WEATHERCODE_MAP.get(condition, 'WMO code {}'.format(condition))
 
-        weather_data['data'].append({
-            'dow': datetime.fromtimestamp(data['time'][day]).strftime('%A'),
-            'summary': condition,
-            'high_temp': data['temperature_2m_max'][day],
-            'low_temp': data['temperature_2m_min'][day],
-        })
+def _weather_params(bot, daily=None):
+    params = {'current': CURRENT_FIELDS, 'wind_speed_unit': 'ms'}
+    daily = [daily] if daily else []
+    if bot.config.weather.sunrise_sunset:
+        daily.append(SUN_FIELDS)
+    if daily:
+        params['daily'] = ','.join(daily)
+        params['forecast_days'] = FORECAST_DAYS if FORECAST_FIELDS in daily else 1
+    return params
 
-    return weather_data
 
+def _parse_forecast(data, location):
+    days = []
+    data = data['daily']
+    for day in range(FORECAST_DAYS):
+        condition = data['weathercode'][day]
+        condition = WEATHERCODE_MAP.get(condition, 'WMO code {}'.format(condition))
 
-def openmeteo_weather(bot, latitude, longitude, location):
-    params = {
-        'latitude': latitude,
-        'longitude': longitude,
-        'current': 'temperature_2m,relative_humidity_2m,precipitation,weather_code,wind_speed_10m,wind_direction_10m',
-        'wind_speed_unit': 'ms',
-        'daily': 'sunrise,sunset',
-        'forecast_days': 1,
-        'timeformat': 'unixtime',
-        'timezone': 'auto',
-    }
+        days.append(ForecastDay(
+            datetime.fromtimestamp(data['time'][day]).strftime('%A'),
+            condition,
+            data['temperature_2m_max'][day],
+            data['temperature_2m_min'][day],
+        ))
 
-    try:
-        r = requests.get(API_ENDPOINT, params=params)
-    except:
-        raise Exception("An Error Occurred. Check Logs For More Information.")
+    return Forecast(location, days)
 
-    data = r.json()
-    if r.status_code != 200 or data.get('error') == 'true':
-        raise Exception('Error: {}'.format(data['reason']))
 
-    condition = data['current']['weather_code']
+def _parse_weather(bot, data, location):
+    current = data['current']
+    condition = current['weather_code']
     condition = WEATHERCODE_MAP.get(condition, 'WMO code {}'.format(condition))
 
-    weather_data = {
-        'location': location,
-        'temp': data['current']['temperature_2m'],
-        'condition': condition,
-        'humidity': data['current']['relative_humidity_2m'] / 100.0,  # normalize to decimal percentage
-        'wind': {
-            'speed': data['current']['wind_speed_10m'],
-            'bearing': data['current']['wind_direction_10m'],
-        },
-        'timezone': data['timezone'],
-    }
+    weather_data = WeatherReport(
+        location,
+        current['temperature_2m'],
+        condition,
+        current['relative_humidity_2m'] / 100.0,  # normalize to decimal percentage
+        current['wind_speed_10m'],
+        current['wind_direction_10m'],
+        timezone=data['timezone'],
+    )
 
     if bot.config.weather.sunrise_sunset:
-        weather_data['sunrise'] = data['daily']['sunrise'][0]
-        weather_data['sunset'] = data['daily']['sunset'][0]
+        weather_data.sunrise = data['daily']['sunrise'][0]
+        weather_data.sunset = data['daily']['sunset'][0]
 
     return weather_data
+
+
+def _parse_hourly(data, location):
+    hourly = data['hourly']
+    return HourlySeries(location, data['timezone'], hourly['time'], hourly['temperature_2m'],
+                        hourly['precipitation'], hourly['wind_speed_10m'])
+
+
+def openmeteo_forecast(bot, latitude, longitude, location):
+    data = _request(latitude, longitude, {'daily': FORECAST_FIELDS, 'forecast_days': FORECAST_DAYS})
+    return _parse_forecast(data, location)
+
+
+def openmeteo_weather(bot, latitude, longitude, location):
+    data = _request(latitude, longitude, _weather_params(bot))
+    return _parse_weather(bot, data, location)
+
+
+def openmeteo_hourly(bot, latitude, longitude, location):
+    data = _request(latitude, longitude,
+                    {'hourly': HOURLY_FIELDS, 'forecast_hours': HOURLY_HOURS, 'wind_speed_unit': 'ms'})
+    return _parse_hourly(data, location)
+
+
+def openmeteo_report(bot, latitude, longitude, location):
+    """Fetch current conditions and the daily forecast in a single request.
+
+    This is what the commands use, so the daily block is always requested.
+    """
+    data = _request(latitude, longitude, _weather_params(bot, daily=FORECAST_FIELDS))
+    with METRICS.timed('normalize'):
+        return {
+            'weather': _parse_weather(bot, data, location),
+            'forecast': _parse_forecast(data, location),
+        }
+
+
+def openmeteo_reports(bot, points):
+    """Fetch reports for many points, up to ``BATCH_SIZE`` of them per request."""
+    params = _weather_params(bot, daily=FORECAST_FIELDS)
+    reports = []
+    for start in range(0, len(points), BATCH_SIZE):
+        batch = points[start:start + BATCH_SIZE]
+        results = _request(','.join(str(point[0]) for point in batch),
+                           ','.join(str(point[1]) for point in batch), params)
+        if not isinstance(results, list):
+            results = [results]
+        with METRICS.timed('normalize'):
+            for data, (_, _, location) in zip(results, batch):
+                reports.append({
+                    'weather': _parse_weather(bot, data, location),
+                    'forecast': _parse_forecast(data, location),
+                })
+    return reports
+
+
+PROVIDER = WeatherProvider('openmeteo', weather=openmeteo_weather, forecast=openmeteo_forecast,
+                           report=openmeteo_report, reports=openmeteo_reports, hourly=openmeteo_hourly,
+                           needs_api_key=False)
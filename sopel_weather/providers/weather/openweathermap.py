@@ -1,66 +1,119 @@
-# coding=utf-8
-import requests
-
-from datetime import datetime
-
-
-API_ENDPOINT = 'https://api.openweathermap.org/data/2.5/onecall'
-
-
-def openweathermap_forecast(bot, latitude, longitude, location):
-    params = {
-        'appid': bot.config.weather.weather_api_key,
-        'lat': latitude,
-        'lon': longitude,
-        'exclude': 'current,minutely,hourly',
-        'units': 'metric'
-    }
-    try:
-        r = requests.get(API_ENDPOINT, params=params)
-    except:
-        raise Exception("An Error Occurred. Check Logs For More Information.")
-    data = r.json()
-    if r.status_code != 200:
-        raise Exception('Error: {}'.format(data['message']))
-    else:
-        weather_data = {'location': location, 'data': []}
-        for day in data['daily'][0:4]:
-            weather_data['data'].append({
-                'dow': datetime.fromtimestamp(day['dt']).strftime('%A'),
-                'summary': day['weather'][0]['main'],
-                'high_temp': day['temp']['max'],
-                'low_temp': day['temp']['min']
-            })
-        return weather_data
-
-
-def openweathermap_weather(bot, latitude, longitude, location):
-    params = {
-        'appid': bot.config.weather.weather_api_key,
-        'lat': latitude,
-        'lon': longitude,
-        'exclude': 'minutely,hourly',
-        'units': 'metric'
-    }
-    try:
-        r = requests.get(API_ENDPOINT, params=params)
-    except:
-        raise Exception("An Error Occurred. Check Logs For More Information.")
-    data = r.json()
-    if r.status_code != 200:
-        raise Exception('Error: {}'.format(data['message']))
-    else:
-        weather_data = {
-            'location': location,
-            'temp': data['current']['temp'],
-            'condition': data['current']['weather'][0]['main'],
-            'humidity': float(data['current']['humidity'] / 100),  # Normalize this to decimal percentage
-            'wind': {'speed': data['current']['wind_speed'], 'bearing': data['current']['wind_deg']},
-            'timezone': data['timezone']
-        }
-
-        if bot.config.weather.sunrise_sunset:
-            weather_data['sunrise'] = data['current']['sunrise']
-            weather_data['sunset'] = data['current']['sunset']
-
-        return weather_data
+# coding=utf-8
+from datetime import datetime
+
+import requests
+
+from sopel.tools import get_logger
+
+from . import api_key, HOURLY_HOURS, WeatherProvider
+from ... import transport
+from ...model import Forecast, ForecastDay, HourlySeries, WeatherReport
+from ...stats import METRICS
+
+LOGGER = get_logger('weather')
+
+
+API_ENDPOINT = 'https://api.openweathermap.org/data/2.5/onecall'
+
+# One Call blocks to leave out; 'current' already carries today's sunrise and sunset
+WEATHER_EXCLUDE = 'minutely,hourly,daily,alerts'
+FORECAST_EXCLUDE = 'current,minutely,hourly,alerts'
+REPORT_EXCLUDE = 'minutely,hourly,alerts'
+HOURLY_EXCLUDE = 'current,minutely,daily,alerts'
+
+
+def _request(bot, latitude, longitude, exclude):
+    params = {
+        'appid': api_key(bot),
+        'lat': latitude,
+        'lon': longitude,
+        'exclude': exclude,
+        'units': 'metric'
+    }
+    try:
+        r = transport.get(API_ENDPOINT, params=params)
+    except requests.exceptions.RequestException as err:
+        # Only the type: requests' messages include the URL, and with it the API key
+        LOGGER.warning('openweathermap request failed: %s', type(err).__name__)
+        raise Exception("An Error Occurred. Check Logs For More Information.")
+    with METRICS.timed('json'):
+        data = r.json()
+    if r.status_code != 200:
+        raise Exception('Error: {}'.format(data['message']))
+    return data
+
+
+def _parse_forecast(data, location):
+    return Forecast(location, [
+        ForecastDay(
+            datetime.fromtimestamp(day['dt']).strftime('%A'),
+            day['weather'][0]['main'],
+            day['temp']['max'],
+            day['temp']['min'],
+        )
+        for day in data['daily'][0:4]
+    ])
+
+
+def _parse_weather(bot, data, location):
+    current = data['current']
+    weather_data = WeatherReport(
+        location,
+        current['temp'],
+        current['weather'][0]['main'],
+        float(current['humidity'] / 100),  # Normalize this to decimal percentage
+        current['wind_speed'],
+        current['wind_deg'],
+        timezone=data['timezone'],
+    )
+
+    if bot.config.weather.sunrise_sunset:
+        weather_data.sunrise = current['sunrise']
+        weather_data.sunset = current['sunset']
+
+    return weather_data
+
+
+def _parse_hourly(data, location):
+    hours = data['hourly'][:HOURLY_HOURS]
+    return HourlySeries(
+        location,
+        data['timezone'],
+        [hour['dt'] for hour in hours],
+        [hour['temp'] for hour in hours],
+        # Only present for hours with rain or snow
+        [hour.get('rain', {}).get('1h', 0) + hour.get('snow', {}).get('1h', 0) for hour in hours],
+        [hour['wind_speed'] for hour in hours],
+    )
+
+
+def openweathermap_forecast(bot, latitude, longitude, location):
+    data = _request(bot, latitude, longitude, FORECAST_EXCLUDE)
+    return _parse_forecast(data, location)
+
+
+def openweathermap_weather(bot, latitude, longitude, location):
+    data = _request(bot, latitude, longitude, WEATHER_EXCLUDE)
+    return _parse_weather(bot, data, location)
+
+
+def openweathermap_hourly(bot, latitude, longitude, location):
+    data = _request(bot, latitude, longitude, HOURLY_EXCLUDE)
+    return _parse_hourly(data, location)
+
+
+def openweathermap_report(bot, latitude, longitude, location):
+    """Fetch current conditions and the daily forecast in a single request.
+
+    This is what the commands use, so the daily block is always requested.
+    """
+    data = _request(bot, latitude, longitude, REPORT_EXCLUDE)
+    with METRICS.timed('normalize'):
+        return {
+            'weather': _parse_weather(bot, data, location),
+            'forecast': _parse_forecast(data, location),
+        }
+
+
+PROVIDER = WeatherProvider('openweathermap', weather=openweathermap_weather, forecast=openweathermap_forecast,
+                           report=openweathermap_report, hourly=openweathermap_hourly)
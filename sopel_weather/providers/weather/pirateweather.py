@@ -1,70 +1,115 @@
-# coding=utf-8
-import requests
-
-from datetime import datetime
-
-
-def pirateweather_forecast(bot, latitude, longitude, location):
-    url = 'https://api.pirateweather.net/forecast/{}/{},{}'.format(
-        bot.config.weather.weather_api_key,
-        latitude,
-        longitude
-    )
-
-    params = {
-        'exclude': 'currently,minutely,hourly,alerts,flags',  # Exclude extra data we don't want/need
-        'units': 'si'
-    }
-    try:
-        r = requests.get(url, params=params)
-    except:
-        raise Exception("An Error Occurred. Check Logs For More Information.")
-    data = r.json()
-    if r.status_code != 200:
-        raise Exception('Error: {}'.format(data['error']))
-    else:
-        weather_data = {'location': location, 'data': []}
-        for day in data['daily']['data'][0:4]:
-            weather_data['data'].append({
-                'dow': datetime.fromtimestamp(day['time']).strftime('%A'),
-                'summary': day['summary'].strip('.'),
-                'high_temp': day['temperatureHigh'],
-                'low_temp': day['temperatureLow']
-            })
-        return weather_data
-
-
-def pirateweather_weather(bot, latitude, longitude, location):
-    url = 'https://api.pirateweather.net/forecast/{}/{},{}'.format(
-        bot.config.weather.weather_api_key,
-        latitude,
-        longitude
-    )
-
-    params = {
-        'exclude': 'minutely,hourly,alerts,flags',  # Exclude extra data we don't want/need
-        'units': 'si',
-    }
-    try:
-        r = requests.get(url, params=params)
-    except:
-        raise Exception("An Error Occurred. Check Logs For More Information.")
-    data = r.json()
-    if r.status_code != 200:
-        raise Exception('Error: {}'.format(data['error']))
-    else:
-        weather_data = {
-            'location': location,
-            'temp': data['currently']['temperature'],
-            'condition': data['currently']['summary'],
-            'humidity': data['currently']['humidity'],
-            'wind': {'speed': data['currently']['windSpeed'], 'bearing': data['currently']['windBearing']},
-            'uvindex': data['currently']['uvIndex'],
-            'timezone': data['timezone'],
-        }
-
-        if bot.config.weather.sunrise_sunset:
-            weather_data['sunrise'] = data['daily']['data'][0]['sunriseTime']
-            weather_data['sunset'] = data['daily']['data'][0]['sunsetTime']
-
-        return weather_data
+# coding=utf-8
+from datetime import datetime
+
+import requests
+
+from sopel.tools import get_logger
+
+from . import api_key, HOURLY_HOURS, WeatherProvider
+from ... import transport
+from ...model import Forecast, ForecastDay, HourlySeries, WeatherReport
+from ...stats import METRICS
+
+LOGGER = get_logger('weather')
+
+# Blocks we never render; 'daily' is only needed for forecasts and sunrise/sunset
+EXCLUDE = 'minutely,hourly,alerts,flags'
+HOURLY_EXCLUDE = 'currently,minutely,daily,alerts,flags'
+
+
+def _request(bot, latitude, longitude, exclude):
+    key = api_key(bot)
+    url = 'https://api.pirateweather.net/forecast/{}/{},{}'.format(
+        key,
+        latitude,
+        longitude
+    )
+
+    params = {
+        'exclude': exclude,  # Exclude extra data we don't want/need
+        'units': 'si',
+    }
+    try:
+        r = transport.get(url, params=params, secrets=(key,))
+    except requests.exceptions.RequestException as err:
+        # Only the type: requests' messages include the URL, and with it the API key
+        LOGGER.warning('pirateweather request failed: %s', type(err).__name__)
+        raise Exception("An Error Occurred. Check Logs For More Information.")
+    with METRICS.timed('json'):
+        data = r.json()
+    if r.status_code != 200:
+        raise Exception('Error: {}'.format(data['error']))
+    return data
+
+
+def _parse_forecast(data, location):
+    return Forecast(location, [
+        ForecastDay(
+            datetime.fromtimestamp(day['time']).strftime('%A'),
+            day['summary'].strip('.'),
+            day['temperatureHigh'],
+            day['temperatureLow'],
+        )
+        for day in data['daily']['data'][0:4]
+    ])
+
+
+def _parse_weather(bot, data, location):
+    current = data['currently']
+    weather_data = WeatherReport(
+        location,
+        current['temperature'],
+        current['summary'],
+        current['humidity'],
+        current['windSpeed'],
+        current['windBearing'],
+        uvindex=current['uvIndex'],
+        timezone=data['timezone'],
+    )
+
+    if bot.config.weather.sunrise_sunset:
+        weather_data.sunrise = data['daily']['data'][0]['sunriseTime']
+        weather_data.sunset = data['daily']['data'][0]['sunsetTime']
+
+    return weather_data
+
+
+def _parse_hourly(data, location):
+    hours = data['hourly']['data'][:HOURLY_HOURS]
+    # With SI units, precipIntensity is in mm/h: the millimetres falling that hour
+    return HourlySeries(location, data['timezone'], [hour['time'] for hour in hours],
+                        [hour['temperature'] for hour in hours], [hour['precipIntensity'] for hour in hours],
+                        [hour['windSpeed'] for hour in hours])
+
+
+def pirateweather_forecast(bot, latitude, longitude, location):
+    data = _request(bot, latitude, longitude, 'currently,' + EXCLUDE)
+    return _parse_forecast(data, location)
+
+
+def pirateweather_weather(bot, latitude, longitude, location):
+    exclude = EXCLUDE if bot.config.weather.sunrise_sunset else EXCLUDE + ',daily'
+    data = _request(bot, latitude, longitude, exclude)
+    return _parse_weather(bot, data, location)
+
+
+def pirateweather_hourly(bot, latitude, longitude, location):
+    data = _request(bot, latitude, longitude, HOURLY_EXCLUDE)
+    return _parse_hourly(data, location)
+
+
+def pirateweather_report(bot, latitude, longitude, location):
+    """Fetch current conditions and the daily forecast in a single request.
+
+    This is what the commands use, so the daily block is always requested.
+    """
+    data = _request(bot, latitude, longitude, EXCLUDE)
+    with METRICS.timed('normalize'):
+        return {
+            'weather': _parse_weather(bot, data, location),
+            'forecast': _parse_forecast(data, location),
+        }
+
+
+PROVIDER = WeatherProvider('pirateweather', weather=pirateweather_weather, forecast=pirateweather_forecast,
+                           report=pirateweather_report, hourly=pirateweather_hourly)
@@ -1,11 +1,25 @@
 # coding=utf-8
+from datetime import datetime
+
 import requests
 
-from datetime import datetime
+from sopel.tools import get_logger
+
+from . import api_key, HOURLY_HOURS, WeatherProvider
+from ... import transport
+from ...model import Forecast, ForecastDay, HourlySeries, WeatherReport
+from ...stats import METRICS
+
+LOGGER = get_logger('weather')
 
 
 API_ENDPOINT = 'https://api.tomorrow.io/v4/weather/forecast'
 
+# Current conditions are read from the first minutely step; days come from the daily steps
+CURRENT_TIMESTEP = '1m'
+DAILY_TIMESTEP = '1d'
+HOURLY_TIMESTEP = '1h'
+
 # Tomorrow.io weather codes
 # https://docs.tomorrow.io/reference/data-layers-weather-codes
 WEATHER_CODES = {
@@ -36,76 +50,63 @@ WEATHER_CODES = {
 }
 
 
-def tomorrow_forecast(bot, latitude, longitude, location):
+def _request(bot, latitude, longitude, timesteps):
     params = {
         'location': '{},{}'.format(latitude, longitude),
-        'apikey': bot.config.weather.weather_api_key,
+        'apikey': api_key(bot),
         'units': 'metric',
-        'timesteps': 'daily',
+        'timesteps': timesteps,
     }
 
     try:
-        r = requests.get(API_ENDPOINT, params=params)
-    except:
+        r = transport.get(API_ENDPOINT, params=params)
+    except requests.exceptions.RequestException as err:
+        # Only the type: requests' messages include the URL, and with it the API key
+        LOGGER.warning('tomorrow request failed: %s', type(err).__name__)
         raise Exception("An Error Occurred. Check Logs For More Information.")
 
-    data = r.json()
+    with METRICS.timed('json'):
+        data = r.json()
     if r.status_code != 200:
         error_msg = data.get('message', data.get('error', 'Unknown error'))
         raise Exception('Error: {}'.format(error_msg))
+    return data
+
 
-    weather_data = {'location': location, 'data': []}
+def _parse_forecast(data, location):
+    days = []
 
     daily_data = data['timelines']['daily']
     for day in daily_data[:4]:
         weather_code = day['values'].get('weatherCodeMax', 0)
         condition = WEATHER_CODES.get(weather_code, 'Unknown')
 
-        weather_data['data'].append({
-            'dow': datetime.fromisoformat(day['time'].replace('Z', '+00:00')).strftime('%A'),
-            'summary': condition,
-            'high_temp': day['values']['temperatureMax'],
-            'low_temp': day['values']['temperatureMin'],
-        })
-
-    return weather_data
-
+        days.append(ForecastDay(
+            datetime.fromisoformat(day['time'].replace('Z', '+00:00')).strftime('%A'),
+            condition,
+            day['values']['temperatureMax'],
+            day['values']['temperatureMin'],
+        ))
 
-def tomorrow_weather(bot, latitude, longitude, location):
-    params = {
-        'location': '{},{}'.format(latitude, longitude),
-        'apikey': bot.config.weather.weather_api_key,
-        'units': 'metric',
-        'timesteps': 'current,daily',
-    }
+    return Forecast(location, days)
 
-    try:
-        r = requests.get(API_ENDPOINT, params=params)
-    except:
-        raise Exception("An Error Occurred. Check Logs For More Information.")
-
-    data = r.json()
-    if r.status_code != 200:
-        error_msg = data.get('message', data.get('error', 'Unknown error'))
-        raise Exception('Error: {}'.format(error_msg))
 
+def _parse_weather(bot, data, location):
     current = data['timelines']['minutely'][0]['values']
     weather_code = current.get('weatherCode', 0)
     condition = WEATHER_CODES.get(weather_code, 'Unknown')
 
     # Wind speed from Tomorrow.io is in m/s when using metric units
-    weather_data = {
-        'location': location,
-        'temp': current['temperature'],
-        'condition': condition,
-        'humidity': current['humidity'] / 100.0,  # normalize to decimal percentage
-        'wind': {
-            'speed': current['windSpeed'],
-            'bearing': current['windDirection'],
-        },
-        'uvindex': current.get('uvIndex'),
-        'timezone': data['location'].get('timezone', 'UTC'),
-    }
+    weather_data = WeatherReport(
+        location,
+        current['temperature'],
+        condition,
+        current['humidity'] / 100.0,  # normalize to decimal percentage
+        current['windSpeed'],
+        current['windDirection'],
+        uvindex=current.get('uvIndex'),
+        timezone=data['location'].get('timezone', 'UTC'),
+    )
 
     if bot.config.weather.sunrise_sunset:
         daily = data['timelines']['daily'][0]['values']
@@ -113,10 +114,58 @@ def tomorrow_weather(bot, latitude, longitude, location):
         sunrise_str = daily.get('sunriseTime', '')
         sunset_str = daily.get('sunsetTime', '')
         if sunrise_str:
-            weather_data['sunrise'] = int(datetime.fromisoformat(
+            weather_data.sunrise = int(datetime.fromisoformat(
                 sunrise_str.replace('Z', '+00:00')).timestamp())
         if sunset_str:
-            weather_data['sunset'] = int(datetime.fromisoformat(
+            weather_data.sunset = int(datetime.fromisoformat(
                 sunset_str.replace('Z', '+00:00')).timestamp())
 
     return weather_data
+
+
+def _parse_hourly(data, location):
+    hours = data['timelines']['hourly'][:HOURLY_HOURS]
+    return HourlySeries(
+        location,
+        data['location'].get('timezone', 'UTC'),
+        [int(datetime.fromisoformat(hour['time'].replace('Z', '+00:00')).timestamp()) for hour in hours],
+        [hour['values']['temperature'] for hour in hours],
+        # mm/h, so the millimetres falling that hour
+        [hour['values'].get('precipitationIntensity', 0) for hour in hours],
+        [hour['values']['windSpeed'] for hour in hours],
+    )
+
+
+def tomorrow_forecast(bot, latitude, longitude, location):
+    data = _request(bot, latitude, longitude, DAILY_TIMESTEP)
+    return _parse_forecast(data, location)
+
+
+def tomorrow_weather(bot, latitude, longitude, location):
+    timesteps = [CURRENT_TIMESTEP]
+    if bot.config.weather.sunrise_sunset:
+        timesteps.append(DAILY_TIMESTEP)
+    data = _request(bot, latitude, longitude, ','.join(timesteps))
+    return _parse_weather(bot, data, location)
+
+
+def tomorrow_hourly(bot, latitude, longitude, location):
+    data = _request(bot, latitude, longitude, HOURLY_TIMESTEP)
+    return _parse_hourly(data, location)
+
+
+def tomorrow_report(bot, latitude, longitude, location):
+    """Fetch current conditions and the daily forecast in a single request.
+
+    This is what the commands use, so the daily block is always requested.
+    """
+    data = _request(bot, latitude, longitude, '{},{}'.format(CURRENT_TIMESTEP, DAILY_TIMESTEP))
+    with METRICS.timed('normalize'):
+        return {
+            'weather': _parse_weather(bot, data, location),
+            'forecast': _parse_forecast(data, location),
+        }
+
+
+PROVIDER = WeatherProvider('tomorrow', weather=tomorrow_weather, forecast=tomorrow_forecast,
+                           report=tomorrow_report, hourly=tomorrow_hourly)
@@ -0,0 +1,184 @@
+# coding=utf-8
+"""API quota tracking: per-key token buckets and daily call budgets."""
+from __future__ import unicode_literals, absolute_import, print_function, division
+
+import hashlib
+import threading
+import time
+
+from datetime import datetime, timezone
+
+# Free-tier limits as ``name: (calls per day, calls per second)``; 0 means unlimited
+DEFAULT_LIMITS = {
+    'locationiq': (5000, 2),
+    'openweathermap': (1000, 1),
+    'pirateweather': (650, 2),
+    'tomorrow': (500, 3),
+}
+DEFAULT_MAX_WAIT = 1.0
+DEFAULT_RESERVE = 0.1
+
+
+class QuotaExceeded(Exception):
+    """Raised instead of calling an upstream whose budget is used up."""
+
+
+def parse_limits(entries):
+    """Parse ``name:per_day:per_second`` config entries over :data:`DEFAULT_LIMITS`."""
+    limits = dict(DEFAULT_LIMITS)
+    for entry in entries:
+        try:
+            name, per_day, per_second = entry.split(':')
+            limits[name.strip()] = (int(per_day), float(per_second))
+        except ValueError:
+            raise ValueError('Invalid quota limit {!r}; expected name:per_day:per_second'.format(entry))
+    return limits
+
+
+def _utc_today():
+    return datetime.now(timezone.utc).strftime('%Y-%m-%d')
+
+
+class TokenBucket(object):
+    """Pace calls to ``rate`` per second, allowing bursts of ``capacity``."""
+
+    def __init__(self, rate, capacity=None, clock=time.monotonic):
+        self.rate = rate
+        self.capacity = capacity or max(1.0, rate)
+        self.clock = clock
+        self._tokens = self.capacity
+        self._updated = clock()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = self.clock()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def wait_time(self):
+        """Seconds until a token is available, without taking it."""
+        with self._lock:
+            self._refill()
+            return max(0.0, (1 - self._tokens) / self.rate)
+
+    def acquire(self, max_wait=0):
+        """Take a token, sleeping up to ``max_wait`` seconds for one; return success."""
+        with self._lock:
+            self._refill()
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return True
+            wait = (1 - self._tokens) / self.rate
+            if wait > max_wait:
+                return False
+            # Reserve the token now so concurrent callers queue up behind us
+            self._tokens -= 1
+        time.sleep(wait)
+        return True
+
+
+class Quota(object):
+    """Daily budget and pacing for one API key of one upstream."""
+
+    def __init__(self, name, per_day, per_second, today=_utc_today):
+        self.name = name
+        self.per_day = per_day
+        self.bucket = TokenBucket(per_second) if per_second else None
+        self.today = today
+        self.day = today()
+        self.used = 0
+        self._lock = threading.Lock()
+
+    def _roll(self):
+        day = self.today()
+        if day != self.day:
+            self.day = day
+            self.used = 0
+
+    @property
+    def remaining(self):
+        """Calls left today, or ``None`` if there is no daily budget."""
+        with self._lock:
+            self._roll()
+            if not self.per_day:
+                return None
+            return max(0, self.per_day - self.used)
+
+    def low(self, reserve):
+        """Return whether no more than ``reserve`` of today's budget is left."""
+        remaining = self.remaining
+        return remaining is not None and remaining <= self.per_day * reserve
+
+    def acquire(self, max_wait=DEFAULT_MAX_WAIT):
+        """Count one call against the budget, pacing it if needed."""
+        with self._lock:
+            self._roll()
+            if self.per_day and self.used >= self.per_day:
+                raise QuotaExceeded('Daily {} quota used up'.format(self.name))
+        if self.bucket is not None and not self.bucket.acquire(max_wait):
+            raise QuotaExceeded('{} rate limit reached, try again shortly'.format(self.name))
+        with self._lock:
+            self._roll()
+            self.used += 1
+
+
+class QuotaManager(object):
+    """Hand out one :class:`Quota` per (upstream, API key) pair.
+
+    Keys are only ever stored as a short hash, so usage counts can be
+    persisted with :meth:`dump` and restored with :meth:`load`.
+    """
+
+    def __init__(self, limits=None, max_wait=DEFAULT_MAX_WAIT, today=_utc_today):
+        self.limits = DEFAULT_LIMITS if limits is None else limits
+        self.max_wait = max_wait
+        self.today = today
+        self._quotas = {}
+        self._saved = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def quota_id(name, api_key):
+        digest = hashlib.sha256((api_key or '').encode('utf-8')).hexdigest()
+        return '{}:{}'.format(name, digest[:12])
+
+    def get(self, name, api_key):
+        """Return the quota for ``name`` used with ``api_key``, or ``None`` if unlimited."""
+        if name not in self.limits:
+            return None
+        quota_id = self.quota_id(name, api_key)
+        with self._lock:
+            quota = self._quotas.get(quota_id)
+            if quota is None:
+                per_day, per_second = self.limits[name]
+                quota = self._quotas[quota_id] = Quota(name, per_day, per_second, today=self.today)
+                day, used = self._saved.pop(quota_id, (None, 0))
+                if day == quota.day:
+                    quota.used = used
+        return quota
+
+    def acquire(self, name, api_key):
+        """Count one call to ``name`` with ``api_key``; raise :class:`QuotaExceeded` if over budget.
+
+        Returns the quota that was charged, or ``None`` if ``name`` is unlimited.
+        """
+        quota = self.get(name, api_key)
+        if quota is not None:
+            quota.acquire(self.max_wait)
+        return quota
+
+    def low(self, name, api_key, reserve=DEFAULT_RESERVE):
+        quota = self.get(name, api_key)
+        return quota is not None and quota.low(reserve)
+
+    def dump(self):
+        """Return today's usage counts as a JSON-serializable dict."""
+        with self._lock:
+            usage = dict(self._saved)
+            usage.update({quota_id: [quota.day, quota.used] for quota_id, quota in self._quotas.items()})
+        return usage
+
+    def load(self, usage):
+        """Restore usage counts previously returned by :meth:`dump`."""
+        with self._lock:
+            self._saved.update(usage or {})
@@ -0,0 +1,111 @@
+# coding=utf-8
+"""Per-nick and per-channel limits on commands that reach an upstream API.
+
+Commands run inside :func:`requested_by`, and :func:`charge` is hooked
+into the transport so it only runs for requests actually sent upstream;
+replies served from the in-memory or HTTP cache never count against anyone.
+"""
+from __future__ import unicode_literals, absolute_import, print_function, division
+
+import contextvars
+import threading
+import time
+
+from collections import OrderedDict
+from contextlib import contextmanager
+
+from .quota import TokenBucket
+
+DEFAULT_MAXSIZE = 1024
+
+# The command being handled, as [nick, channel, charged]; engine workers run
+# in copies of the command's context, so they all share the same list
+_requester = contextvars.ContextVar('sopel_weather_requester', default=None)
+_charge_lock = threading.Lock()
+
+
+class RateLimited(Exception):
+    """Raised instead of letting a command make another upstream request."""
+
+    def __init__(self, scope, retry_after, notify=True):
+        super(RateLimited, self).__init__('Too many lookups from this {}; try again in {:.0f}s'.format(
+            scope, retry_after))
+        self.scope = scope
+        self.retry_after = retry_after
+        # Only the first refusal of a streak is worth telling the user about
+        self.notify = notify
+
+
+class RateLimiter(object):
+    """Token buckets per nick and per channel, created on first use.
+
+    Each nick may make ``nick_limit`` upstream requests and each channel
+    ``channel_limit``, refilled evenly over ``period`` seconds; a limit of
+    ``0`` disables that scope. Only the ``maxsize`` most recently seen
+    buckets are kept.
+    """
+
+    def __init__(self, nick_limit, channel_limit, period, maxsize=DEFAULT_MAXSIZE, clock=time.monotonic):
+        self.limits = {'nick': nick_limit, 'channel': channel_limit}
+        self.period = period
+        self.maxsize = maxsize
+        self.clock = clock
+        self._buckets = OrderedDict()
+        self._noticed = set()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._buckets)
+
+    def _bucket(self, key):
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            limit = self.limits[key[0]]
+            bucket = self._buckets[key] = TokenBucket(limit / self.period, limit, clock=self.clock)
+            if len(self._buckets) > self.maxsize:
+                oldest, _ = self._buckets.popitem(last=False)
+                self._noticed.discard(oldest)
+        else:
+            self._buckets.move_to_end(key)
+        return bucket
+
+    def acquire(self, nick, channel=None):
+        """Take one request from ``nick`` and ``channel``; raise :class:`RateLimited` if either is used up."""
+        keys = [(scope, name) for scope, name in (('nick', nick), ('channel', channel))
+                if name is not None and self.limits[scope] > 0]
+        with self._lock:
+            buckets = [(key, self._bucket(key)) for key in keys]
+            # Check every scope before taking from any, so a refusal costs nothing
+            for key, bucket in buckets:
+                wait = bucket.wait_time()
+                if wait > 0:
+                    notify = key not in self._noticed
+                    self._noticed.add(key)
+                    raise RateLimited(key[0], wait, notify)
+            for key, bucket in buckets:
+                bucket.acquire()
+                self._noticed.discard(key)
+
+
+@contextmanager
+def requested_by(nick, channel=None):
+    """Attribute the upstream requests made in this context to ``nick`` in ``channel``."""
+    token = _requester.set([nick, channel, False])
+    try:
+        yield
+    finally:
+        _requester.reset(token)
+
+
+def charge(limiter):
+    """Count the current command against ``limiter``, once however many lookups it makes.
+
+    Work outside :func:`requested_by`, such as background prefetches, is free.
+    """
+    requester = _requester.get()
+    if requester is None:
+        return
+    with _charge_lock:
+        if not requester[2]:
+            limiter.acquire(requester[0], requester[1])
+            requester[2] = True
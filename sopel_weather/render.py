@@ -0,0 +1,169 @@
+# coding=utf-8
+"""Table-driven rendering of weather and forecast replies."""
+from __future__ import unicode_literals, absolute_import, print_function, division
+
+from bisect import bisect_right
+from datetime import datetime
+
+from .timezones import get_zone
+
+# Upper bounds (exclusive, in knots) of Beaufort forces 0-11; anything faster is force 12
+BEAUFORT_KNOTS = (1, 4, 7, 11, 16, 22, 28, 34, 41, 48, 56, 64)
+BEAUFORT_NAMES = (
+    'Calm', 'Light air', 'Light breeze', 'Gentle breeze', 'Moderate breeze', 'Fresh breeze', 'Strong breeze',
+    'Near gale', 'Gale', 'Strong gale', 'Storm', 'Violent storm', 'Hurricane',
+)
+
+# Arrows point the way the wind blows, i.e. away from the bearing it comes from
+COMPASS_ARROWS = (u'↓', u'↙', u'←', u'↖', u'↑', u'↗', u'→', u'↘')
+# Whole-degree lookup table; sector 0 covers 338-22 degrees, sector 1 23-67, and so on
+ARROW_BY_DEGREE = tuple(COMPASS_ARROWS[((degree + 22) // 45) % 8] for degree in range(360))
+
+UNIT_SETS = ('both', 'metric', 'imperial')
+
+
+def _temp_both(temp):
+    return u'%d°C (%d°F)' % (round(temp), round(1.8 * temp + 32))
+
+
+def _temp_metric(temp):
+    return u'%d°C' % round(temp)
+
+
+def _temp_imperial(temp):
+    return u'%d°F' % round(1.8 * temp + 32)
+
+
+def _wind_both(speed):
+    return '%dkm/h (%dmph)' % (round(speed * 3.6), round(speed * 2.236936))
+
+
+def _wind_metric(speed):
+    return '%dkm/h' % round(speed * 3.6)
+
+
+def _wind_imperial(speed):
+    return '%dmph' % round(speed * 2.236936)
+
+
+def _precipitation_both(amount):
+    return '%.1fmm (%.2fin)' % (amount, amount / 25.4)
+
+
+def _precipitation_metric(amount):
+    return '%.1fmm' % amount
+
+
+def _precipitation_imperial(amount):
+    return '%.2fin' % (amount / 25.4)
+
+
+TEMPERATURE_FORMATS = {'both': _temp_both, 'metric': _temp_metric, 'imperial': _temp_imperial}
+WIND_FORMATS = {'both': _wind_both, 'metric': _wind_metric, 'imperial': _wind_imperial}
+PRECIPITATION_FORMATS = {
+    'both': _precipitation_both, 'metric': _precipitation_metric, 'imperial': _precipitation_imperial,
+}
+# Less than this many mm in an hour isn't worth mentioning
+MIN_PRECIPITATION = 0.05
+# Bytes of reply text that fit on one IRC line, leaving room for the
+# ``:nick!user@host PRIVMSG #channel :`` prefix within the 512-byte limit
+LINE_BYTES = 400
+
+
+def beaufort(speed):
+    """Describe a wind ``speed`` in m/s on the Beaufort scale."""
+    knots = int(round(float(round(speed, 1)) * 1.94384))
+    return BEAUFORT_NAMES[bisect_right(BEAUFORT_KNOTS, knots)]
+
+
+def compass_arrow(bearing):
+    """Return the arrow for a wind coming from ``bearing`` degrees."""
+    return ARROW_BY_DEGREE[int(bearing) % 360]
+
+
+def get_temp(temp, units='both'):
+    try:
+        temp = float(temp)
+    except (KeyError, TypeError, ValueError):
+        return 'unknown'
+    return TEMPERATURE_FORMATS[units](temp)
+
+
+def get_humidity(humidity):
+    try:
+        humidity = int(humidity * 100)
+    except (KeyError, TypeError, ValueError):
+        return 'unknown'
+    return "Humidity: %s%%" % humidity
+
+
+def get_wind(speed, bearing, units='both'):
+    return '%s: %s (%s)' % (beaufort(speed), WIND_FORMATS[units](speed), compass_arrow(bearing))
+
+
+def convert_timestamp(timestamp, tz):
+    # We only return the time, without a date or timezone.
+    return datetime.fromtimestamp(timestamp, get_zone(tz)).strftime('%H:%M')
+
+
+class Renderer(object):
+    """Render replies with templates compiled once for a unit set and config."""
+
+    def __init__(self, units='both', sunrise_sunset=False):
+        self.units = units
+        self.sunrise_sunset = sunrise_sunset
+        self._temp = TEMPERATURE_FORMATS[units]
+        self._wind = WIND_FORMATS[units]
+        self._precipitation = PRECIPITATION_FORMATS[units]
+        self._weather_template = u'%s: %s, %s, %s%s' + (', Sunrise: %s Sunset: %s' if sunrise_sunset else '') + ', %s'
+
+    def temp(self, temp):
+        try:
+            return self._temp(float(temp))
+        except (KeyError, TypeError, ValueError):
+            return 'unknown'
+
+    def wind(self, speed, bearing):
+        return '%s: %s (%s)' % (beaufort(speed), self._wind(speed), compass_arrow(bearing))
+
+    def weather(self, data):
+        """Render a :class:`~.model.WeatherReport` as one reply line."""
+        # Some providers don't give us UV Index
+        uvindex = ', UV Index: %s' % data.uvindex if data.uvindex is not None else ''
+        values = [data.location, self.temp(data.temp), data.condition, get_humidity(data.humidity), uvindex]
+        if self.sunrise_sunset:
+            values.append(convert_timestamp(data.sunrise, data.timezone))
+            values.append(convert_timestamp(data.sunset, data.timezone))
+        values.append(self.wind(data.wind_speed, data.wind_bearing))
+        return self._weather_template % tuple(values)
+
+    def summary(self, data):
+        """Render a :class:`~.model.WeatherReport` as a short ``location: temp, condition`` item."""
+        return '%s: %s, %s' % (data.location, self.temp(data.temp), data.condition)
+
+    def forecast(self, data):
+        """Render a :class:`~.model.Forecast`, every day in one pass."""
+        temp = self.temp
+        return ' :: '.join([data.location] + [
+            '%s - %s - %s / %s' % (day.dow, day.summary, temp(day.high_temp), temp(day.low_temp))
+            for day in data.days
+        ])
+
+    def hourly(self, data, max_bytes=LINE_BYTES):
+        """Render a :class:`~.model.HourlySeries`, one item per hour.
+
+        Hours that would take the reply past ``max_bytes`` of UTF-8 are left
+        out, so it always fits on one line; the first hour is always shown.
+        """
+        temp, wind, precipitation = self.temp, self._wind, self._precipitation
+        reply = data.location
+        size = len(reply.encode('utf-8'))
+        for index, (time, hour_temp, amount, speed) in enumerate(
+                zip(data.times, data.temp, data.precipitation, data.wind_speed)):
+            item = ' :: %s %s, %s%s' % (convert_timestamp(time, data.timezone), temp(hour_temp),
+                                        precipitation(amount) + ', ' if amount >= MIN_PRECIPITATION else '', wind(speed))
+            size += len(item.encode('utf-8'))
+            if index and size > max_bytes:
+                break
+            reply += item
+        return reply
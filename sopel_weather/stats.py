@@ -0,0 +1,174 @@
+# coding=utf-8
+"""Per-stage latency histograms, error counts and cache hit rates."""
+from __future__ import unicode_literals, absolute_import, print_function, division
+
+import functools
+import os
+import threading
+import time
+
+from bisect import bisect_left
+from collections import deque
+
+# Upper bounds, in seconds, of the histogram buckets
+BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+RECENT_SAMPLES = 512
+
+
+class Histogram(object):
+    """Cumulative latency histogram, plus a window of recent samples for percentiles."""
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.recent = deque(maxlen=RECENT_SAMPLES)
+
+    def observe(self, seconds):
+        self.counts[bisect_left(BUCKETS, seconds)] += 1
+        self.count += 1
+        self.total += seconds
+        self.recent.append(seconds)
+
+    def percentile(self, fraction):
+        samples = sorted(self.recent)
+        if not samples:
+            return 0.0
+        return samples[min(len(samples) - 1, int(fraction * len(samples)))]
+
+
+class _Timer(object):
+    # A plain context manager: cheaper than @contextmanager on the command hot path
+    __slots__ = ('metrics', 'stage', 'start')
+
+    def __init__(self, metrics, stage):
+        self.metrics = metrics
+        self.stage = stage
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+
+    def __exit__(self, *exc_info):
+        self.metrics.observe(self.stage, time.perf_counter() - self.start)
+
+
+class Metrics(object):
+    """Collect stage timings, upstream errors and cache statistics."""
+
+    def __init__(self):
+        self.histograms = {}
+        self.errors = {}
+        self.received = {}
+        self.caches = {}
+        self._lock = threading.Lock()
+
+    def reset(self):
+        with self._lock:
+            self.histograms.clear()
+            self.errors.clear()
+            self.received.clear()
+            self.caches.clear()
+
+    def observe(self, stage, seconds):
+        with self._lock:
+            histogram = self.histograms.get(stage)
+            if histogram is None:
+                histogram = self.histograms[stage] = Histogram()
+            histogram.observe(seconds)
+
+    def timed(self, stage):
+        """Time the body of a ``with`` block as ``stage``."""
+        return _Timer(self, stage)
+
+    def timer(self, stage):
+        """Decorator timing every call of the decorated function as ``stage``."""
+        def decorator(func):
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                with self.timed(stage):
+                    return func(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def error(self, upstream):
+        with self._lock:
+            self.errors[upstream] = self.errors.get(upstream, 0) + 1
+
+    def receive(self, upstream, size):
+        """Count ``size`` bytes of response body from ``upstream``."""
+        with self._lock:
+            self.received[upstream] = self.received.get(upstream, 0) + size
+
+    def track_cache(self, name, cache):
+        """Report ``cache``'s hit and miss counters under ``name``."""
+        with self._lock:
+            self.caches[name] = cache
+
+    def summary(self):
+        """One-line human-readable summary, for IRC."""
+        with self._lock:
+            parts = [
+                '{}: p50 {:.0f}ms p95 {:.0f}ms (n={})'.format(
+                    stage, histogram.percentile(0.5) * 1000, histogram.percentile(0.95) * 1000, histogram.count)
+                for stage, histogram in sorted(self.histograms.items())
+            ]
+            if self.errors:
+                parts.append('errors: ' + ', '.join(
+                    '{}={}'.format(upstream, count) for upstream, count in sorted(self.errors.items())))
+            if self.received:
+                parts.append('received: ' + ', '.join(
+                    '{}={:.1f}KiB'.format(upstream, size / 1024) for upstream, size in sorted(self.received.items())))
+            for name, cache in sorted(self.caches.items()):
+                # Stale entries served while they are refreshed count as hits here
+                served = cache.hits + getattr(cache, 'stale', 0)
+                lookups = served + cache.misses
+                parts.append('{} cache: {:.0%} of {} hit'.format(
+                    name, served / lookups if lookups else 0, lookups))
+        return ' | '.join(parts) or 'No weather lookups yet.'
+
+    def prometheus(self):
+        """Render the metrics in the Prometheus text exposition format."""
+        lines = [
+            '# HELP sopel_weather_stage_seconds Time spent in each stage of a weather lookup.',
+            '# TYPE sopel_weather_stage_seconds histogram',
+        ]
+        with self._lock:
+            for stage, histogram in sorted(self.histograms.items()):
+                cumulative = 0
+                for bound, count in zip(BUCKETS + ('+Inf',), histogram.counts):
+                    cumulative += count
+                    lines.append('sopel_weather_stage_seconds_bucket{{stage="{}",le="{}"}} {}'.format(
+                        stage, bound, cumulative))
+                lines.append('sopel_weather_stage_seconds_sum{{stage="{}"}} {}'.format(stage, histogram.total))
+                lines.append('sopel_weather_stage_seconds_count{{stage="{}"}} {}'.format(stage, histogram.count))
+
+            lines.append('# HELP sopel_weather_upstream_errors_total Failed calls to each upstream.')
+            lines.append('# TYPE sopel_weather_upstream_errors_total counter')
+            for upstream, count in sorted(self.errors.items()):
+                lines.append('sopel_weather_upstream_errors_total{{upstream="{}"}} {}'.format(upstream, count))
+
+            lines.append('# HELP sopel_weather_response_bytes_total Response body bytes received from each upstream.')
+            lines.append('# TYPE sopel_weather_response_bytes_total counter')
+            for upstream, size in sorted(self.received.items()):
+                lines.append('sopel_weather_response_bytes_total{{upstream="{}"}} {}'.format(upstream, size))
+
+            lines.append('# HELP sopel_weather_cache_lookups_total Cache lookups by result.')
+            lines.append('# TYPE sopel_weather_cache_lookups_total counter')
+            for name, cache in sorted(self.caches.items()):
+                lines.append('sopel_weather_cache_lookups_total{{cache="{}",result="hit"}} {}'.format(name, cache.hits))
+                lines.append('sopel_weather_cache_lookups_total{{cache="{}",result="miss"}} {}'.format(
+                    name, cache.misses))
+                if hasattr(cache, 'stale'):
+                    lines.append('sopel_weather_cache_lookups_total{{cache="{}",result="stale"}} {}'.format(
+                        name, cache.stale))
+        return '\n'.join(lines) + '\n'
+
+    def write_prometheus(self, path):
+        """Atomically write :meth:`prometheus` output to ``path``."""
+        tmp = '{}.tmp'.format(path)
+        with open(tmp, 'w') as f:
+            f.write(self.prometheus())
+        os.replace(tmp, path)
+
+
+METRICS = Metrics()
@@ -0,0 +1,46 @@
+# coding=utf-8
+"""Offline coordinate to timezone lookup and cached ``zoneinfo`` zones."""
+from __future__ import unicode_literals, absolute_import, print_function, division
+
+import functools
+import threading
+
+try:
+    from zoneinfo import ZoneInfo
+except ImportError:  # Python < 3.9
+    from backports.zoneinfo import ZoneInfo
+
+try:
+    from timezonefinder import TimezoneFinder
+except ImportError:
+    TimezoneFinder = None
+
+_finder = None
+_lock = threading.Lock()
+
+
+@functools.lru_cache(maxsize=None)
+def get_zone(name):
+    """Return the ``ZoneInfo`` for IANA timezone ``name``, built once per name."""
+    return ZoneInfo(name)
+
+
+def _get_finder():
+    global _finder
+    with _lock:
+        if _finder is None and TimezoneFinder is not None:
+            _finder = TimezoneFinder(in_memory=True)
+        return _finder
+
+
+@functools.lru_cache(maxsize=1024)
+def lookup(latitude, longitude):
+    """Return the IANA timezone name at a point, or ``None``.
+
+    ``None`` also means the optional ``timezonefinder`` package is not
+    installed, in which case callers fall back to the provider's timezone.
+    """
+    finder = _get_finder()
+    if finder is None:
+        return None
+    return finder.timezone_at(lat=float(latitude), lng=float(longitude))
@@ -0,0 +1,183 @@
+# coding=utf-8
+"""Shared HTTP sessions for the weather providers and the geocoder.
+
+Every upstream host gets its own keep-alive :class:`requests.Session` with a
+bounded connection pool, and every request carries a (connect, read) timeout
+so a stalled upstream cannot hang a bot thread forever. Each host also has a
+:class:`~.breaker.CircuitBreaker`, so a failing upstream is not waited on
+again until it has had time to recover. An optional
+:class:`~.httpcache.ResponseCache` answers or revalidates repeated requests,
+and hooks registered with :func:`sending` only run for requests that are
+actually sent.
+"""
+from __future__ import unicode_literals, absolute_import, print_function, division
+
+import contextvars
+import threading
+
+from contextlib import contextmanager
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from .breaker import CircuitBreaker, CircuitOpenError
+from .httpcache import cache_key
+from .stats import METRICS
+
+DEFAULT_POOL_SIZE = 4
+DEFAULT_CONNECT_TIMEOUT = 3.05
+DEFAULT_READ_TIMEOUT = 10.0
+
+_settings = {
+    'pool_size': DEFAULT_POOL_SIZE,
+    'timeout': (DEFAULT_CONNECT_TIMEOUT, DEFAULT_READ_TIMEOUT),
+    'breaker': {},
+    'cache': None,
+}
+_sessions = {}
+_breakers = {}
+_lock = threading.Lock()
+# Called before each request that goes out, e.g. to charge a quota
+_send_hooks = contextvars.ContextVar('sopel_weather_send_hooks', default=())
+
+
+@contextmanager
+def sending(hook):
+    """Call ``hook()`` before every request sent in this context, revalidations included.
+
+    Responses answered from the cache never run it. A hook may raise to
+    stop the request.
+    """
+    token = _send_hooks.set(_send_hooks.get() + (hook,))
+    try:
+        yield
+    finally:
+        _send_hooks.reset(token)
+
+
+def configure(pool_size=DEFAULT_POOL_SIZE,
+              connect_timeout=DEFAULT_CONNECT_TIMEOUT,
+              read_timeout=DEFAULT_READ_TIMEOUT,
+              cache=None,
+              **breaker_settings):
+    """Apply pool, timeout, response cache and circuit breaker settings, dropping any existing sessions.
+
+    Extra keyword arguments are passed to every :class:`~.breaker.CircuitBreaker`.
+    """
+    close()
+    with _lock:
+        _settings['pool_size'] = pool_size
+        _settings['timeout'] = (connect_timeout, read_timeout)
+        _settings['breaker'] = breaker_settings
+        _settings['cache'] = cache
+
+
+def close():
+    """Close every pooled session and the response cache, and forget circuit breaker state."""
+    with _lock:
+        sessions = list(_sessions.values())
+        _sessions.clear()
+        _breakers.clear()
+        cache, _settings['cache'] = _settings['cache'], None
+    for session in sessions:
+        session.close()
+    if cache is not None:
+        cache.close()
+
+
+def get_session(url):
+    """Return the shared session for ``url``'s host, creating it if needed."""
+    host = urlsplit(url).netloc
+    with _lock:
+        session = _sessions.get(host)
+        if session is None:
+            adapter = HTTPAdapter(
+                pool_connections=1,
+                pool_maxsize=_settings['pool_size'],
+                pool_block=True,
+            )
+            session = requests.Session()
+            session.mount('https://', adapter)
+            session.mount('http://', adapter)
+            _sessions[host] = session
+    return session
+
+
+def get_breaker(url):
+    """Return the circuit breaker for ``url``'s host, creating it if needed."""
+    host = urlsplit(url).netloc
+    with _lock:
+        breaker = _breakers.get(host)
+        if breaker is None:
+            breaker = _breakers[host] = CircuitBreaker(host, **_settings['breaker'])
+    return breaker
+
+
+def breakers():
+    """Return every upstream's circuit breaker, sorted by host."""
+    with _lock:
+        return [_breakers[host] for host in sorted(_breakers)]
+
+
+def _from_cache(url, cached):
+    r = requests.models.Response()
+    r.status_code = cached.status
+    r.headers.update(cached.headers)
+    r._content = cached.body
+    r.url = url
+    return r
+
+
+def get(url, params=None, secrets=(), **kwargs):
+    """Send a GET request through the pooled session for ``url``'s host.
+
+    With a response cache configured, fresh cached responses are returned
+    without a request and stale ones are revalidated; ``secrets`` are values
+    (API keys in the URL path) to keep out of the cache key.
+
+    Raises :class:`~.breaker.CircuitOpenError` without calling the upstream
+    while its circuit is open. Connection errors, timeouts and 5xx responses
+    count as failures.
+    """
+    cache = _settings['cache']
+    cached = None
+    if cache is not None:
+        key = cache_key(url, params, secrets)
+        cached = cache.get(key)
+        if cached is not None:
+            if cached.fresh(cache.clock()):
+                return _from_cache(url, cached)
+            kwargs['headers'] = dict(kwargs.get('headers') or {}, **cached.validators())
+
+    breaker = get_breaker(url)
+    if not breaker.allow():
+        raise CircuitOpenError('{} is unavailable; retrying in {:.0f}s'.format(breaker.name, breaker.retry_in()))
+    try:
+        for hook in _send_hooks.get():
+            hook()
+    except Exception:
+        breaker.cancel()
+        raise
+
+    kwargs.setdefault('timeout', _settings['timeout'])
+    try:
+        with METRICS.timed('http:{}'.format(breaker.name)):
+            r = get_session(url).get(url, params=params, **kwargs)
+    except requests.exceptions.RequestException:
+        breaker.record_failure()
+        raise
+
+    METRICS.receive(breaker.name, len(r.content))
+    if r.status_code >= 500:
+        breaker.record_failure()
+    else:
+        breaker.record_success()
+
+    if cache is not None:
+        if r.status_code == 304 and cached is not None:
+            cache.refresh(key, r.headers)
+            return _from_cache(url, cached)
+        if r.status_code == 200:
+            cache.set(key, r.status_code, r.headers, r.content)
+    return r
@@ -0,0 +1,86 @@
+# coding=utf-8
+"""Fixtures and helpers shared by the sopel-weather tests"""
+from __future__ import unicode_literals, absolute_import, print_function, division
+
+import pytest
+
+import sopel_weather as weather
+
+
+TMP_CONFIG = """
+[core]
+owner = testnick
+nick = TestBot
+enable = coretasks
+"""
+
+
+@pytest.fixture
+def db(configfactory):
+    """A real, temporary Sopel database."""
+    from sopel.db import SopelDB
+
+    return SopelDB(configfactory('default.cfg', TMP_CONFIG))
+
+
+def make_bot(db):
+    """Build a bot with the weather plugin set up against ``db``."""
+    class Bot:
+        class Config:
+            class Weather:
+                geocoords_provider = 'locationiq_us'
+                geocoords_api_key = 'test-geo-key'
+                gazetteer_file = ''
+                nick_lookup = False
+                geocode_cache_size = 2
+                geocode_cache_ttl = 3600
+                geocode_cache_grace = 0
+                weather_provider = 'openmeteo'
+                weather_api_key = 'test-api-key'
+                fallback_providers = []
+                fallback_api_keys = []
+                hedge_delay = 2.0
+                sunrise_sunset = False
+                units = 'both'
+                weather_cache_size = 16
+                weather_cache_grid = 0.1
+                weather_cache_ttl = 600
+                forecast_cache_ttl = 3600
+                weather_cache_grace = 0
+                cache_jitter = 0.0
+                cache_early_refresh = 0.0
+                http_pool_size = 4
+                http_connect_timeout = 3.05
+                http_read_timeout = 10.0
+                http_cache_file = ''
+                breaker_failure_rate = 0.5
+                breaker_min_calls = 5
+                breaker_cooldown = 60.0
+                quota_limits = []
+                quota_max_wait = 1.0
+                quota_reserve = 0.1
+                quota_coarse_grid = 0.5
+                fetch_workers = 2
+                fetch_deadline = 5.0
+                prefetch_locations = 10
+                max_locations = 5
+                roster_cooldown = 300
+                roster_ops_only = False
+                rate_limit_nick = 5
+                rate_limit_channel = 15
+                rate_limit_period = 300
+            weather = Weather()
+
+            class Core:
+                help_prefix = '.'
+            core = Core()
+
+            def define_section(self, name, cls):
+                pass
+        config = Config()
+
+    bot = Bot()
+    bot.db = db
+    bot.memory = {}
+    weather.setup(bot)
+    return bot
@@ -0,0 +1,274 @@
+# coding=utf-8
+"""Microbenchmarks for sopel-weather's formatting and parsing hot paths.
+
+Run with ``pytest tests/test_benchmarks.py``. To compare a change, save a
+run of the base commit with ``--benchmark-save=base`` on the same machine,
+then run the change with ``--benchmark-compare --benchmark-compare-fail=mean:25%``.
+"""
+from __future__ import unicode_literals, absolute_import, print_function, division
+
+import json
+
+import pytest
+import requests_mock
+
+import sopel_weather as weather
+from sopel_weather.model import Forecast, ForecastDay, WeatherReport
+from sopel_weather.ratelimit import RateLimiter
+from sopel_weather.providers.weather import openmeteo, openweathermap, pirateweather, tomorrow
+
+from conftest import make_bot
+from test_weather import MockBotWithSunrise
+
+pytest.importorskip('pytest_benchmark')
+
+START = 1704672000  # 2024-01-08T00:00:00Z
+DAY = 24 * 60 * 60
+
+
+# =============================================================================
+# Realistic, full-size provider payloads
+# =============================================================================
+
+def openmeteo_payload():
+    return {
+        "latitude": 47.6, "longitude": -122.32, "generationtime_ms": 0.12,
+        "utc_offset_seconds": -28800, "timezone": "America/Los_Angeles",
+        "timezone_abbreviation": "PST", "elevation": 56.0,
+        "current_units": {
+            "time": "unixtime", "interval": "seconds", "temperature_2m": "°C",
+            "relative_humidity_2m": "%", "precipitation": "mm", "weather_code": "wmo code",
+            "wind_speed_10m": "m/s", "wind_direction_10m": "°",
+        },
+        "current": {
+            "time": START + 43200, "interval": 900, "temperature_2m": 12.5,
+            "relative_humidity_2m": 75, "precipitation": 0.0, "weather_code": 2,
+            "wind_speed_10m": 5.2, "wind_direction_10m": 180,
+        },
+        "daily_units": {
+            "time": "unixtime", "temperature_2m_min": "°C", "temperature_2m_max": "°C",
+            "weathercode": "wmo code", "sunrise": "unixtime", "sunset": "unixtime",
+        },
+        "daily": {
+            "time": [START + DAY * i for i in range(4)],
+            "temperature_2m_min": [5.0, 6.0, 4.5, 7.0],
+            "temperature_2m_max": [12.0, 14.0, 11.5, 15.0],
+            "weathercode": [2, 61, 3, 0],
+            "sunrise": [START + DAY * i + 57600 for i in range(4)],
+            "sunset": [START + DAY * i + 88200 for i in range(4)],
+        },
+    }
+
+
+def openweathermap_payload():
+    def conditions(main):
+        return [{"id": 803, "main": main, "description": "broken clouds", "icon": "04d"}]
+
+    return {
+        "lat": 47.6, "lon": -122.33, "timezone": "America/Los_Angeles", "timezone_offset": -28800,
+        "current": {
+            "dt": START + 43200, "sunrise": START + 57600, "sunset": START + 88200, "temp": 12.5,
+            "feels_like": 11.8, "pressure": 1021, "humidity": 75, "dew_point": 8.1, "uvi": 1.2,
+            "clouds": 75, "visibility": 10000, "wind_speed": 5.2, "wind_deg": 180, "wind_gust": 8.4,
+            "weather": conditions("Clouds"),
+        },
+        "daily": [{
+            "dt": START + DAY * i + 72000, "sunrise": START + DAY * i + 57600,
+            "sunset": START + DAY * i + 88200, "moonrise": START + DAY * i + 40000,
+            "moonset": START + DAY * i + 70000, "moon_phase": 0.9,
+            "summary": "Expect a day of partly cloudy with rain",
+            "temp": {"day": 11.0, "min": 5.0 + i, "max": 12.0 + i, "night": 6.0, "eve": 9.0, "morn": 5.5},
+            "feels_like": {"day": 10.0, "night": 5.0, "eve": 8.0, "morn": 4.0},
+            "pressure": 1020, "humidity": 80, "dew_point": 7.0, "wind_speed": 6.1, "wind_deg": 200,
+            "wind_gust": 11.2, "weather": conditions("Rain"), "clouds": 90, "pop": 0.8,
+            "rain": 3.2, "uvi": 1.5,
+        } for i in range(8)],
+    }
+
+
+def pirateweather_payload():
+    return {
+        "latitude": 47.6, "longitude": -122.33, "timezone": "America/Los_Angeles", "offset": -8.0,
+        "elevation": 56,
+        "currently": {
+            "time": START + 43200, "summary": "Partly Cloudy", "icon": "partly-cloudy-day",
+            "nearestStormDistance": 0, "nearestStormBearing": 0, "precipIntensity": 0.0,
+            "precipProbability": 0.0, "precipIntensityError": 0.0, "precipType": "none",
+            "temperature": 15.0, "apparentTemperature": 14.2, "dewPoint": 8.5, "humidity": 0.65,
+            "pressure": 1019.5, "windSpeed": 4.5, "windGust": 7.8, "windBearing": 270,
+            "cloudCover": 0.45, "uvIndex": 3, "visibility": 16.09, "ozone": 310.2,
+        },
+        "daily": {
+            "summary": "Light rain throughout the week.",
+            "icon": "rain",
+            "data": [{
+                "time": START + DAY * i, "summary": "Partly cloudy until afternoon.",
+                "icon": "partly-cloudy-day", "sunriseTime": START + DAY * i + 57600,
+                "sunsetTime": START + DAY * i + 88200, "moonPhase": 0.9, "precipIntensity": 0.1,
+                "precipIntensityMax": 0.6, "precipIntensityMaxTime": START + DAY * i + 50000,
+                "precipProbability": 0.4, "precipAccumulation": 1.2, "precipType": "rain",
+                "temperatureHigh": 12.0 + i, "temperatureHighTime": START + DAY * i + 79200,
+                "temperatureLow": 5.0 + i, "temperatureLowTime": START + DAY * i + 140000,
+                "apparentTemperatureHigh": 11.0, "apparentTemperatureLow": 3.0, "dewPoint": 6.0,
+                "humidity": 0.82, "pressure": 1018.0, "windSpeed": 5.1, "windGust": 9.9,
+                "windBearing": 190, "cloudCover": 0.7, "uvIndex": 2, "uvIndexTime": START + DAY * i + 72000,
+                "visibility": 14.0, "temperatureMin": 4.5, "temperatureMax": 12.5,
+            } for i in range(8)],
+        },
+    }
+
+
+def tomorrow_payload():
+    values = {
+        "cloudBase": 0.8, "cloudCeiling": 1.2, "cloudCover": 75, "dewPoint": 8.1, "freezingRainIntensity": 0,
+        "humidity": 75, "precipitationProbability": 10, "pressureSurfaceLevel": 1010.2, "rainIntensity": 0,
+        "sleetIntensity": 0, "snowIntensity": 0, "temperature": 12.5, "temperatureApparent": 11.9,
+        "uvHealthConcern": 0, "uvIndex": 2, "visibility": 16, "weatherCode": 1101, "windDirection": 180,
+        "windGust": 8.1, "windSpeed": 5.2,
+    }
+    return {
+        "location": {"lat": 47.6, "lon": -122.33, "name": "Seattle", "type": "administrative",
+                     "timezone": "America/Los_Angeles"},
+        "timelines": {
+            "minutely": [{"time": "2024-01-08T12:{:02d}:00Z".format(i), "values": dict(values)}
+                         for i in range(60)],
+            "daily": [{
+                "time": "2024-01-{:02d}T00:00:00Z".format(8 + i),
+                "values": dict(
+                    (("{}{}".format(key, suffix), value)
+                     for key, value in values.items()
+                     for suffix in ("Avg", "Max", "Min")
+                     if key != "weatherCode"),
+                    sunriseTime="2024-01-{:02d}T15:55:00Z".format(8 + i),
+                    sunsetTime="2024-01-{:02d}T00:30:00Z".format(9 + i),
+                    temperatureMax=12.0 + i, temperatureMin=5.0 + i, weatherCodeMax=1101, weatherCodeMin=1000,
+                ),
+            } for i in range(6)],
+        },
+    }
+
+
+PROVIDER_PAYLOADS = [
+    ('openmeteo', openmeteo, openmeteo_payload),
+    ('openweathermap', openweathermap, openweathermap_payload),
+    ('pirateweather', pirateweather, pirateweather_payload),
+    ('tomorrow', tomorrow, tomorrow_payload),
+]
+
+
+# =============================================================================
+# Formatter Benchmarks
+# =============================================================================
+
+def test_bench_get_temp(benchmark):
+    assert benchmark(weather.get_temp, 12.5) == '12°C (54°F)'
+
+
+def test_bench_get_humidity(benchmark):
+    assert benchmark(weather.get_humidity, 0.75) == 'Humidity: 75%'
+
+
+def test_bench_get_wind(benchmark):
+    assert 'Gentle breeze' in benchmark(weather.get_wind, 4.0, 135)
+
+
+def test_bench_convert_timestamp(benchmark):
+    assert benchmark(weather.convert_timestamp, START + 57600, 'America/Los_Angeles') == '08:00'
+
+
+WEATHER_DATA = WeatherReport(
+    'Seattle, WA, US', 12.5, 'Partly cloudy', 0.75, 4.0, 135, uvindex=2, timezone='America/Los_Angeles',
+    sunrise=START + 57600, sunset=START + 88200,
+)
+FORECAST_DATA = Forecast('Seattle, WA, US', [
+    ForecastDay('Monday', 'Partly cloudy', 12.0 + i, 5.0 + i) for i in range(4)
+])
+
+
+def test_bench_render_weather(benchmark):
+    from sopel_weather.render import Renderer
+
+    assert benchmark(Renderer(sunrise_sunset=True).weather, WEATHER_DATA).startswith('Seattle')
+
+
+def test_bench_render_forecast(benchmark):
+    from sopel_weather.render import Renderer
+
+    assert benchmark(Renderer().forecast, FORECAST_DATA).count(' :: ') == 4
+
+
+# =============================================================================
+# Provider Parsing Benchmarks
+# =============================================================================
+
+@pytest.mark.parametrize('name, module, payload', PROVIDER_PAYLOADS, ids=[p[0] for p in PROVIDER_PAYLOADS])
+def test_bench_provider_parse(benchmark, name, module, payload):
+    """JSON body to normalized weather and forecast records."""
+    body = json.dumps(payload())
+    bot = MockBotWithSunrise()
+
+    def parse():
+        data = json.loads(body)
+        return (module._parse_weather(bot, data, 'Seattle, WA, US'),
+                module._parse_forecast(data, 'Seattle, WA, US'))
+
+    current, forecast = benchmark(parse)
+    assert current.sunrise is not None
+    assert len(forecast.days) == 4
+
+
+# =============================================================================
+# End-to-end Command Benchmarks
+# =============================================================================
+
+def make_command_bot(db, output):
+    bot = make_bot(db)
+    bot.config.core = type('Core', (), {'help_prefix': '.'})()
+    bot.say = output.append
+    bot.reply = output.append
+    bot.memory['weather_nick_locations'].set('Alice', '47.6', '-122.33', 'Seattle, WA, US')
+    return bot
+
+
+class Trigger:
+    nick = 'Alice'
+    sender = '#channel'
+
+    def __init__(self, command):
+        self.command = command
+
+    def group(self, index):
+        return self.command if index == 1 else None
+
+
+@pytest.mark.parametrize('command', ['weather', 'forecast'])
+def test_bench_command_render(benchmark, db, command):
+    """Reply rendering from a warm cache."""
+    output = []
+    bot = make_command_bot(db, output)
+    handler = weather.weather_command if command == 'weather' else weather.forecast_command
+
+    with requests_mock.mock() as m:
+        m.get('https://api.open-meteo.com/v1/forecast', json=openmeteo_payload())
+        handler(bot, Trigger(command))
+        benchmark(handler, bot, Trigger(command))
+        assert m.call_count == 1
+
+    assert output[-1].startswith('Seattle, WA, US')
+
+
+@pytest.mark.parametrize('command', ['weather', 'forecast'])
+def test_bench_command_cold(benchmark, db, command):
+    """Full command path: fetch, parse, cache fill and render."""
+    output = []
+    bot = make_command_bot(db, output)
+    # Every round is a cache miss, which would otherwise run into the per-nick limit
+    bot.memory['weather_rate_limits'] = RateLimiter(0, 0, 300)
+    handler = weather.weather_command if command == 'weather' else weather.forecast_command
+
+    with requests_mock.mock() as m:
+        m.get('https://api.open-meteo.com/v1/forecast', json=openmeteo_payload())
+        benchmark.pedantic(handler, args=(bot, Trigger(command)),
+                           setup=bot.memory['weather_cache'].clear, rounds=200)
+
+    assert output[-1].startswith('Seattle, WA, US')
@@ -2,10 +2,13 @@
 """Tests for sopel-weather"""
 from __future__ import unicode_literals, absolute_import, print_function, division
 
+import time
+
 import pytest
 import requests_mock
 
 import sopel_weather as weather
+from conftest import make_bot
 from sopel_weather.providers.weather.openmeteo import openmeteo_forecast, openmeteo_weather
 from sopel_weather.providers.weather.pirateweather import pirateweather_forecast, pirateweather_weather
 from sopel_weather.providers.weather.tomorrow import tomorrow_forecast, tomorrow_weather
@@ -114,13 +117,13 @@ def test_openmeteo_weather():
         m.get('https://api.open-meteo.com/v1/forecast', json=mock_response)
         result = openmeteo_weather(MockBot(), '47.6', '-122.33', 'Seattle, WA, US')
 
-        assert result['location'] == 'Seattle, WA, US'
-        assert result['temp'] == 12.5
-        assert result['condition'] == 'Partly cloudy'
-        assert result['humidity'] == 0.75
-        assert result['wind']['speed'] == 5.2
-        assert result['wind']['bearing'] == 180
-        assert result['timezone'] == 'America/Los_Angeles'
+        assert result.location == 'Seattle, WA, US'
+        assert result.temp == 12.5
+        assert result.condition == 'Partly cloudy'
+        assert result.humidity == 0.75
+        assert result.wind_speed == 5.2
+        assert result.wind_bearing == 180
+        assert result.timezone == 'America/Los_Angeles'
 
 
 def test_openmeteo_forecast():
@@ -141,12 +144,12 @@ def test_openmeteo_forecast():
         m.get('https://api.open-meteo.com/v1/forecast', json=mock_response)
         result = openmeteo_forecast(MockBot(), '47.6', '-122.33', 'Seattle, WA, US')
 
-        assert result['location'] == 'Seattle, WA, US'
-        assert len(result['data']) == 4
-        assert result['data'][0]['summary'] == 'Partly cloudy'
-        assert result['data'][0]['high_temp'] == 12.0
-        assert result['data'][0]['low_temp'] == 5.0
-        assert result['data'][1]['summary'] == 'Light rain'
+        assert result.location == 'Seattle, WA, US'
+        assert len(result.days) == 4
+        assert result.days[0].summary == 'Partly cloudy'
+        assert result.days[0].high_temp == 12.0
+        assert result.days[0].low_temp == 5.0
+        assert result.days[1].summary == 'Light rain'
 
 
 def test_openmeteo_error():
@@ -192,14 +195,14 @@ def test_pirateweather_weather():
         m.get(requests_mock.ANY, json=mock_response)
         result = pirateweather_weather(MockBot(), '47.6', '-122.33', 'Seattle, WA, US')
 
-        assert result['location'] == 'Seattle, WA, US'
-        assert result['temp'] == 15.0
-        assert result['condition'] == 'Partly Cloudy'
-        assert result['humidity'] == 0.65
-        assert result['wind']['speed'] == 4.5
-        assert result['wind']['bearing'] == 270
-        assert result['uvindex'] == 3
-        assert result['timezone'] == 'America/Los_Angeles'
+        assert result.location == 'Seattle, WA, US'
+        assert result.temp == 15.0
+        assert result.condition == 'Partly Cloudy'
+        assert result.humidity == 0.65
+        assert result.wind_speed == 4.5
+        assert result.wind_bearing == 270
+        assert result.uvindex == 3
+        assert result.timezone == 'America/Los_Angeles'
 
 
 def test_pirateweather_forecast():
@@ -220,12 +223,12 @@ def test_pirateweather_forecast():
         m.get(requests_mock.ANY, json=mock_response)
         result = pirateweather_forecast(MockBot(), '47.6', '-122.33', 'Seattle, WA, US')
 
-        assert result['location'] == 'Seattle, WA, US'
-        assert len(result['data']) == 4
-        assert result['data'][0]['summary'] == 'Partly cloudy'
-        assert result['data'][0]['high_temp'] == 12.0
-        assert result['data'][0]['low_temp'] == 5.0
-        assert result['data'][1]['summary'] == 'Rain'
+        assert result.location == 'Seattle, WA, US'
+        assert len(result.days) == 4
+        assert result.days[0].summary == 'Partly cloudy'
+        assert result.days[0].high_temp == 12.0
+        assert result.days[0].low_temp == 5.0
+        assert result.days[1].summary == 'Rain'
 
 
 def test_pirateweather_error():
@@ -281,14 +284,14 @@ def test_tomorrow_weather():
         m.get('https://api.tomorrow.io/v4/weather/forecast', json=mock_response)
         result = tomorrow_weather(MockBot(), '47.6', '-122.33', 'Seattle, WA, US')
 
-        assert result['location'] == 'Seattle, WA, US'
-        assert result['temp'] == 12.5
-        assert result['condition'] == 'Partly Cloudy'
-        assert result['humidity'] == 0.75
-        assert result['wind']['speed'] == 5.2
-        assert result['wind']['bearing'] == 180
-        assert result['uvindex'] == 2
-        assert result['timezone'] == 'America/Los_Angeles'
+        assert result.location == 'Seattle, WA, US'
+        assert result.temp == 12.5
+        assert result.condition == 'Partly Cloudy'
+        assert result.humidity == 0.75
+        assert result.wind_speed == 5.2
+        assert result.wind_bearing == 180
+        assert result.uvindex == 2
+        assert result.timezone == 'America/Los_Angeles'
 
 
 def test_tomorrow_weather_with_sunrise():
@@ -328,10 +331,8 @@ def test_tomorrow_weather_with_sunrise():
         m.get('https://api.tomorrow.io/v4/weather/forecast', json=mock_response)
         result = tomorrow_weather(MockBotWithSunrise(), '47.6', '-122.33', 'Seattle, WA, US')
 
-        assert 'sunrise' in result
-        assert 'sunset' in result
-        assert isinstance(result['sunrise'], int)
-        assert isinstance(result['sunset'], int)
+        assert isinstance(result.sunrise, int)
+        assert isinstance(result.sunset, int)
 
 
 def test_tomorrow_forecast():
@@ -384,14 +385,14 @@ def test_tomorrow_forecast():
         m.get('https://api.tomorrow.io/v4/weather/forecast', json=mock_response)
         result = tomorrow_forecast(MockBot(), '47.6', '-122.33', 'Seattle, WA, US')
 
-        assert result['location'] == 'Seattle, WA, US'
-        assert len(result['data']) == 4
-        assert result['data'][0]['summary'] == 'Partly Cloudy'
-        assert result['data'][0]['high_temp'] == 12.0
-        assert result['data'][0]['low_temp'] == 5.0
-        assert result['data'][1]['summary'] == 'Rain'
-        assert result['data'][2]['summary'] == 'Cloudy'
-        assert result['data'][3]['summary'] == 'Clear'
+        assert result.location == 'Seattle, WA, US'
+        assert len(result.days) == 4
+        assert result.days[0].summary == 'Partly Cloudy'
+        assert result.days[0].high_temp == 12.0
+        assert result.days[0].low_temp == 5.0
+        assert result.days[1].summary == 'Rain'
+        assert result.days[2].summary == 'Cloudy'
+        assert result.days[3].summary == 'Clear'
 
 
 def test_tomorrow_error():
@@ -419,3 +420,1616 @@ def test_tomorrow_weather_codes():
     assert WEATHER_CODES[2000] == 'Fog'
     assert WEATHER_CODES[6001] == 'Freezing Rain'
     assert WEATHER_CODES[7000] == 'Ice Pellets'
+
+
+# =============================================================================
+# Geocoding Cache Tests
+# =============================================================================
+
+LOCATIONIQ_RESPONSE = [{
+    "lat": "47.6038321",
+    "lon": "-122.330062",
+    "address": {
+        "city": "Seattle",
+        "state": "Washington",
+        "country_code": "us"
+    }
+}]
+
+
+def test_normalize_query():
+    """Test geocode cache key normalization."""
+    from sopel_weather.cache import normalize_query
+
+    assert normalize_query('  Seattle,   WA ') == 'seattle, wa'
+    assert normalize_query('LONDON') == normalize_query('london')
+
+
+def test_ttl_cache_expiry_and_lru():
+    """Test TTL cache expiry and size bound."""
+    from sopel_weather.cache import TTLCache
+
+    now = [1000.0]
+    cache = TTLCache(maxsize=2, ttl=10, clock=lambda: now[0])
+    cache.set('a', 1)
+    cache.set('b', 2)
+    assert cache.get('a') == 1
+    cache.set('c', 3)  # evicts 'b', the least recently used
+    assert cache.get('b') is None
+    assert cache.get('c') == 3
+    now[0] += 11
+    assert cache.get('a') is None
+    assert (cache.hits, cache.misses) == (2, 2)
+
+
+def test_ttl_cache_stale_while_revalidate():
+    """Test expired entries are served within the grace window, with one refresh claim at a time."""
+    from sopel_weather.cache import TTLCache
+
+    now = [1000.0]
+    cache = TTLCache(ttl=10, grace=5, clock=lambda: now[0])
+    cache.set('a', 1)
+    assert cache.get_stale('a') == (1, False)
+
+    now[0] += 12
+    assert cache.get('a') is None
+    assert cache.get_stale('a') == (1, True)
+    assert cache.get_stale('a') == (1, False)
+    cache.release('a')
+    assert cache.get_stale('a') == (1, True)
+    assert 'a' in cache.dump()
+
+    cache.set('a', 2)
+    assert cache.get_stale('a') == (2, False)
+    now[0] += 16
+    assert cache.get_stale('a') == (None, False)
+    assert cache.dump() == {}
+    assert (cache.hits, cache.stale) == (2, 3)
+
+
+def test_ttl_cache_jitter_and_early_refresh():
+    """Test jitter only shortens TTLs and early refreshes get likelier towards expiry."""
+    from sopel_weather.cache import TTLCache
+
+    now = [1000.0]
+    cache = TTLCache(maxsize=100, ttl=100, clock=lambda: now[0], grace=30, jitter=0.2, early=0.1)
+    for key in range(100):
+        cache.set(key, key)
+    lifetimes = [cache.expires_in(key) for key in range(100)]
+    assert all(80 <= lifetime <= 100 for lifetime in lifetimes)
+    assert len(set(lifetimes)) > 50
+
+    def refreshed():
+        due = sum(cache.get_stale(key)[1] for key in range(100))
+        for key in range(100):
+            cache.release(key)
+        return due
+
+    assert refreshed() < 5
+    now[0] += 79
+    assert refreshed() > 10
+    now[0] += 20
+    assert refreshed() > 90
+
+
+def test_geocode_cache_hits(db):
+    """Test repeated geocoding of the same place is served from cache."""
+    bot = make_bot(db)
+
+    with requests_mock.mock() as m:
+        m.get('https://us1.locationiq.com/v1/search.php', json=LOCATIONIQ_RESPONSE)
+        first = weather.geocode(bot, 'Seattle')
+        second = weather.geocode(bot, '  seattle ')
+
+        assert m.call_count == 1
+
+    assert first == second == ('47.6038321', '-122.330062', 'Seattle, Washington, US')
+    cache = bot.memory['weather_geocode_cache']
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_geocode_cache_persists(db):
+    """Test the geocode cache survives a plugin reload."""
+    bot = make_bot(db)
+
+    with requests_mock.mock() as m:
+        m.get('https://us1.locationiq.com/v1/search.php', json=LOCATIONIQ_RESPONSE)
+        weather.geocode(bot, 'Seattle')
+    weather.shutdown(bot)
+
+    bot = make_bot(db)
+    with requests_mock.mock() as m:
+        result = weather.geocode(bot, 'SEATTLE')
+        assert m.call_count == 0
+    assert result[2] == 'Seattle, Washington, US'
+
+
+def test_geocode_cache_saved_on_interval(db):
+    """Test lookups only mark the geocode cache, which the interval job then writes once."""
+    bot = make_bot(db)
+
+    with requests_mock.mock() as m:
+        m.get('https://us1.locationiq.com/v1/search.php', json=locationiq_by_query)
+        weather.geocode(bot, 'Seattle')
+        weather.geocode_many(bot, ['London', 'Paris'])
+    assert db.get_plugin_value('weather', 'geocode_cache') is None
+
+    weather.save_changes(bot)
+    assert len(db.get_plugin_value('weather', 'geocode_cache')) == 2  # geocode_cache_size
+    assert not bot.memory['weather_unsaved']
+
+    db.delete_plugin_value('weather', 'geocode_cache')
+    weather.save_changes(bot)
+    assert db.get_plugin_value('weather', 'geocode_cache') is None
+
+
+# =============================================================================
+# Weather Cache Tests
+# =============================================================================
+
+OPENMETEO_CURRENT_RESPONSE = {
+    "timezone": "America/Los_Angeles",
+    "current": {
+        "temperature_2m": 12.5,
+        "relative_humidity_2m": 75,
+        "precipitation": 0,
+        "weather_code": 2,
+        "wind_speed_10m": 5.2,
+        "wind_direction_10m": 180
+    },
+    "daily": {
+        "sunrise": [1704722400],
+        "sunset": [1704756000]
+    }
+}
+
+
+def test_grid_cell():
+    """Test coordinates snap onto the cache grid."""
+    from sopel_weather.cache import grid_cell
+
+    assert grid_cell('47.6038', '-122.3300', 0.1) == (47.6, -122.3)
+    assert grid_cell(47.61, -122.34, 0.1) == grid_cell(47.58, -122.27, 0.1)
+
+
+OPENMETEO_REPORT_RESPONSE = dict(OPENMETEO_CURRENT_RESPONSE, daily={
+    "time": [1704672000, 1704758400, 1704844800, 1704931200],
+    "temperature_2m_min": [5.0, 6.0, 4.5, 7.0],
+    "temperature_2m_max": [12.0, 14.0, 11.5, 15.0],
+    "weathercode": [2, 61, 3, 0],
+    "sunrise": [1704722400, 1704808800, 1704895200, 1704981600],
+    "sunset": [1704756000, 1704842400, 1704928800, 1705015200],
+})
+
+
+def test_weather_cache_shared_by_grid_cell(db):
+    """Test nearby lookups share one provider call but keep their own names."""
+    bot = make_bot(db)
+
+    with requests_mock.mock() as m:
+        m.get('https://api.open-meteo.com/v1/forecast', json=OPENMETEO_REPORT_RESPONSE)
+        first = weather.get_report(bot, '47.61', '-122.33', 'Seattle, WA, US')
+        second = weather.get_report(bot, '47.58', '-122.31', 'Downtown Seattle')
+
+        assert m.call_count == 1
+
+    assert second is first
+    assert first['weather'].temp == 12.5
+
+
+def test_openmeteo_report_single_request():
+    """Test the combined fetch returns both current conditions and forecast."""
+    from sopel_weather.providers.weather.openmeteo import openmeteo_report
+
+    with requests_mock.mock() as m:
+        m.get('https://api.open-meteo.com/v1/forecast', json=OPENMETEO_REPORT_RESPONSE)
+        report = openmeteo_report(MockBot(), '47.6', '-122.33', 'Seattle, WA, US')
+
+        assert m.call_count == 1
+        assert m.request_history[0].qs['forecast_days'] == ['4']
+
+    assert report['weather'].condition == 'Partly cloudy'
+    assert len(report['forecast'].days) == 4
+    assert report['forecast'].days[1].summary == 'Light rain'
+
+
+class MockTrigger:
+    """Mock trigger for a command sent by ``nick`` with argument ``arg``."""
+    def __init__(self, nick, arg=None, command='weather'):
+        self.nick = nick
+        self.sender = '#channel'
+        self._groups = {1: command, 2: arg}
+
+    def group(self, index):
+        return self._groups[index]
+
+
+def test_weather_then_forecast_one_request(db):
+    """Test .weather followed by .forecast costs one upstream call."""
+    bot = make_bot(db)
+    bot.memory['weather_nick_locations'].set('Alice', '47.6', '-122.33', 'Seattle, WA, US')
+
+    with requests_mock.mock() as m:
+        m.get('https://api.open-meteo.com/v1/forecast', json=OPENMETEO_REPORT_RESPONSE)
+        current = weather.get_weather(bot, MockTrigger('Alice'))
+        forecast = weather.get_forecast(bot, MockTrigger('Alice', command='forecast'))
+
+        assert m.call_count == 1
+
+    assert current.location == forecast.location == 'Seattle, WA, US'
+    assert forecast.days[0].high_temp == 12.0
+
+
+# =============================================================================
+# HTTP Transport Tests
+# =============================================================================
+
+def test_transport_sessions_per_host():
+    """Test one pooled session is reused per upstream host."""
+    from sopel_weather import transport
+
+    transport.configure()
+    first = transport.get_session('https://api.open-meteo.com/v1/forecast')
+    second = transport.get_session('https://api.open-meteo.com/v1/other')
+    other = transport.get_session('https://us1.locationiq.com/v1/search.php')
+
+    assert first is second
+    assert first is not other
+    transport.close()
+
+
+def test_transport_timeouts():
+    """Test configured timeouts are applied to every request."""
+    from sopel_weather import transport
+
+    transport.configure(connect_timeout=1.5, read_timeout=4.0)
+    with requests_mock.mock() as m:
+        m.get('https://api.open-meteo.com/v1/forecast', json=OPENMETEO_CURRENT_RESPONSE)
+        openmeteo_weather(MockBot(), '47.6', '-122.33', 'Seattle, WA, US')
+
+        assert m.request_history[0].timeout == (1.5, 4.0)
+    transport.configure()
+
+
+# =============================================================================
+# Nick Location Index Tests
+# =============================================================================
+
+def test_nick_location_index_loads_from_db(db):
+    """Test saved locations, including aliases, are loaded at setup."""
+    db.set_nick_value('Alice', 'latitude', '47.6')
+    db.set_nick_value('Alice', 'longitude', '-122.33')
+    db.set_nick_value('Alice', 'location', 'Seattle, WA, US')
+    db.alias_nick('Alice', 'Alice_away')
+    db.set_nick_value('Bob', 'latitude', '51.5')  # incomplete, ignored
+
+    bot = make_bot(db)
+    index = bot.memory['weather_nick_locations']
+
+    assert index.get('alice') == ('47.6', '-122.33', 'Seattle, WA, US')
+    assert index.get('Alice_away') == ('47.6', '-122.33', 'Seattle, WA, US')
+    assert index.get('Bob') is None
+    assert index.get('Carol') is None
+
+
+def test_nick_location_index_write_through(db):
+    """Test setting a location updates both the index and the database."""
+    bot = make_bot(db)
+    index = bot.memory['weather_nick_locations']
+
+    index.set('Carol', '51.5', '-0.12', 'London, England, GB')
+
+    assert index.get('CAROL') == ('51.5', '-0.12', 'London, England, GB')
+    assert db.get_nick_value('Carol', 'location') == 'London, England, GB'
+
+
+# =============================================================================
+# Fetch Engine Tests
+# =============================================================================
+
+def test_fetch_engine_call():
+    """Test blocking calls run on the engine and return their result."""
+    import threading
+    from sopel_weather.engine import FetchEngine
+
+    engine = FetchEngine(workers=2)
+    try:
+        caller = threading.current_thread()
+        assert engine.call(lambda x: (x * 2, threading.current_thread() is caller), 21) == (42, False)
+    finally:
+        engine.stop()
+
+
+def test_fetch_engine_deadline():
+    """Test callers stop waiting once the deadline passes."""
+    import threading
+    from sopel_weather.engine import FetchEngine, FetchTimeout
+
+    engine = FetchEngine(workers=1)
+    release = threading.Event()
+    try:
+        with pytest.raises(FetchTimeout):
+            engine.call(release.wait, 5, timeout=0.05)
+    finally:
+        release.set()
+        engine.stop()
+
+
+# =============================================================================
+# Provider Registry Tests
+# =============================================================================
+
+def test_provider_registry_builtins():
+    """Test built-in providers are registered and dispatch to their functions."""
+    from sopel_weather.providers.weather import get_provider
+
+    assert weather.WEATHER_PROVIDERS == ['openmeteo', 'openweathermap', 'pirateweather', 'tomorrow']
+    provider = get_provider('openmeteo')
+    assert provider is get_provider('openmeteo')
+
+    with requests_mock.mock() as m:
+        m.get('https://api.open-meteo.com/v1/forecast', json=OPENMETEO_CURRENT_RESPONSE)
+        result = provider.weather(MockBot(), '47.6', '-122.33', 'Seattle, WA, US')
+    assert result.condition == 'Partly cloudy'
+
+
+def test_provider_registry_entry_points(monkeypatch):
+    """Test third-party providers are discovered through entry points."""
+    from importlib.metadata import EntryPoint
+    from sopel_weather.providers import weather as registry
+
+    entry_point = EntryPoint('dummy', 'dummy_weather.provider:PROVIDER', registry.ENTRY_POINT_GROUP)
+    monkeypatch.setattr(registry, '_entry_points', lambda: [entry_point])
+    assert 'dummy' in registry.provider_specs()
+
+    with pytest.raises(KeyError):
+        registry.get_provider('does-not-exist')
+
+
+# =============================================================================
+# Single-Flight Tests
+# =============================================================================
+
+def test_single_flight_shares_result():
+    """Test concurrent callers with the same key share one call."""
+    import threading
+    from sopel_weather.coalesce import SingleFlight
+
+    flight = SingleFlight()
+    started = threading.Event()
+    release = threading.Event()
+    calls = []
+
+    def slow_lookup():
+        calls.append(1)
+        started.set()
+        release.wait(5)
+        return 'result'
+
+    results = []
+    leader = threading.Thread(target=lambda: results.append(flight.do('key', slow_lookup)))
+    leader.start()
+    started.wait(5)
+    followers = [threading.Thread(target=lambda: results.append(flight.do('key', slow_lookup)))
+                 for _ in range(3)]
+    for thread in followers:
+        thread.start()
+    time.sleep(0.1)  # let the followers queue up behind the leader
+    release.set()
+    for thread in [leader] + followers:
+        thread.join(5)
+
+    assert calls == [1]
+    assert results == ['result'] * 4
+
+
+def test_single_flight_shares_error():
+    """Test followers receive the leader's exception."""
+    import threading
+    from sopel_weather.coalesce import SingleFlight
+
+    flight = SingleFlight()
+    started = threading.Event()
+    release = threading.Event()
+
+    def failing_lookup():
+        started.set()
+        release.wait(5)
+        raise ValueError('upstream down')
+
+    errors = []
+
+    def call():
+        try:
+            flight.do('key', failing_lookup)
+        except ValueError as err:
+            errors.append(str(err))
+
+    leader = threading.Thread(target=call)
+    leader.start()
+    started.wait(5)
+    follower = threading.Thread(target=call)
+    follower.start()
+    release.set()
+    leader.join(5)
+    follower.join(5)
+
+    assert errors == ['upstream down', 'upstream down']
+
+
+# =============================================================================
+# Provider Failover Tests
+# =============================================================================
+
+def test_engine_hedge_fails_over():
+    """Test a failing provider falls through to the next one immediately."""
+    from sopel_weather.engine import FetchEngine
+
+    def broken():
+        raise Exception('Error: down')
+
+    engine = FetchEngine(workers=2)
+    try:
+        assert engine.call_hedged([broken, lambda: 'fallback'], delay=10, timeout=1) == 'fallback'
+        with pytest.raises(Exception, match='down'):
+            engine.call_hedged([broken], delay=10, timeout=1)
+        with pytest.raises(Exception, match='down'):
+            engine.call_hedged([broken, lambda: 'fallback'], delay=10, timeout=1, final=(Exception,))
+    finally:
+        engine.stop()
+
+
+def test_engine_hedge_on_slow_primary():
+    """Test a slow primary is hedged and the faster answer wins."""
+    import threading
+    from sopel_weather.engine import FetchEngine
+
+    release = threading.Event()
+
+    def slow():
+        release.wait(5)
+        return 'primary'
+
+    engine = FetchEngine(workers=2)
+    try:
+        assert engine.call_hedged([slow, lambda: 'fallback'], delay=0.05, timeout=1) == 'fallback'
+    finally:
+        release.set()
+        engine.stop()
+
+
+def test_report_falls_back_to_next_provider(db):
+    """Test get_report uses the fallback provider when the primary fails."""
+    bot = make_bot(db)
+    bot.config.weather.weather_provider = 'tomorrow'
+    bot.config.weather.fallback_providers = ['openmeteo']
+
+    with requests_mock.mock() as m:
+        m.get('https://api.tomorrow.io/v4/weather/forecast', json={'message': 'Too Many Calls'}, status_code=429)
+        m.get('https://api.open-meteo.com/v1/forecast', json=OPENMETEO_REPORT_RESPONSE)
+        report = weather.get_report(bot, '47.6', '-122.33', 'Seattle, WA, US')
+
+    assert report['weather'].condition == 'Partly cloudy'
+
+
+def test_fallback_provider_sends_its_own_key(db):
+    """Test a fallback is sent its own API key and charged to that key's quota."""
+    bot = make_bot(db)
+    bot.memory['weather_api_keys'] = {'tomorrow': 'tomorrow-key'}
+    bot.config.weather.weather_provider = 'pirateweather'
+    bot.config.weather.fallback_providers = ['tomorrow']
+
+    with requests_mock.mock() as m:
+        m.get(requests_mock.ANY, status_code=500, json={'message': 'Internal error'})
+        with pytest.raises(Exception):
+            weather.get_report(bot, '47.6', '-122.33', 'Seattle, WA, US')
+
+        queries = {request.hostname: request for request in m.request_history}
+        assert queries['api.pirateweather.net'].path.startswith('/forecast/test-api-key/')
+        assert queries['api.tomorrow.io'].qs['apikey'] == ['tomorrow-key']
+
+    assert bot.memory['weather_quota'].get('tomorrow', 'tomorrow-key').used == 1
+    assert bot.memory['weather_quota'].get('tomorrow', 'test-api-key').used == 0
+
+
+@pytest.mark.parametrize('fallbacks, api_keys, message', [
+    (['openmeteo', 'pirateweather'], [], "'pirateweather' needs its own key"),
+    (['darksky'], [], "Unknown fallback provider 'darksky'"),
+    ([], ['darksky:abc'], "Unknown fallback provider 'darksky'"),
+    (['tomorrow'], ['tomorrow'], 'expected name:key'),
+])
+def test_fallback_providers_checked_at_setup(fallbacks, api_keys, message):
+    """Test unknown fallbacks, and keyed ones without their own key, are refused."""
+    with pytest.raises(ValueError, match=message):
+        weather.check_fallbacks('tomorrow', fallbacks, weather.parse_api_keys(api_keys))
+
+
+def test_fallback_providers_accepted():
+    """Test keyless fallbacks, keyed ones with a key, and the main provider itself pass the check."""
+    api_keys = weather.parse_api_keys(['pirateweather: abc'])
+    assert weather.check_fallbacks('tomorrow', ['openmeteo', 'pirateweather', 'tomorrow'], api_keys) == {
+        'pirateweather': 'abc'}
+
+
+# =============================================================================
+# Circuit Breaker Tests
+# =============================================================================
+
+def test_circuit_breaker_states():
+    """Test the breaker opens on failures, then probes and closes."""
+    from sopel_weather.breaker import CircuitBreaker, CLOSED, HALF_OPEN, OPEN
+
+    now = [0.0]
+    breaker = CircuitBreaker('api.example.com', failure_rate=0.5, min_calls=4, cooldown=30,
+                             clock=lambda: now[0])
+    breaker.record_success()
+    breaker.record_failure()
+    breaker.record_failure()
+    assert breaker.state == CLOSED  # not enough calls yet
+    breaker.record_failure()
+    assert breaker.state == OPEN
+    assert not breaker.allow()
+
+    now[0] += 30
+    assert breaker.state == HALF_OPEN
+    assert breaker.allow()
+    assert not breaker.allow()  # only one probe at a time
+    breaker.record_failure()
+    assert breaker.state == OPEN
+
+    now[0] += 30
+    assert breaker.allow()
+    breaker.record_success()
+    assert breaker.state == CLOSED
+    assert breaker.failure_rate == 0.0
+
+
+def test_transport_circuit_fails_fast():
+    """Test an open circuit stops calls to that host only."""
+    from sopel_weather import transport
+    from sopel_weather.breaker import CircuitOpenError
+
+    transport.configure(min_calls=2, cooldown=60)
+    try:
+        with requests_mock.mock() as m:
+            m.get('https://api.open-meteo.com/v1/forecast', status_code=503, json={'reason': 'down'})
+            m.get('https://us1.locationiq.com/v1/search.php', json=LOCATIONIQ_RESPONSE)
+            transport.get('https://api.open-meteo.com/v1/forecast')
+            transport.get('https://api.open-meteo.com/v1/forecast')
+
+            with pytest.raises(CircuitOpenError):
+                transport.get('https://api.open-meteo.com/v1/forecast')
+            assert m.call_count == 2
+
+            assert transport.get('https://us1.locationiq.com/v1/search.php').status_code == 200
+    finally:
+        transport.configure()
+
+
+# =============================================================================
+# Quota Tests
+# =============================================================================
+
+def test_token_bucket_paces_calls():
+    """Test the token bucket allows a burst, then refuses or waits."""
+    from sopel_weather.quota import TokenBucket
+
+    now = [0.0]
+    bucket = TokenBucket(rate=2, clock=lambda: now[0])
+    assert bucket.acquire()
+    assert bucket.acquire()
+    assert not bucket.acquire(max_wait=0.1)  # next token is 0.5s away
+    now[0] += 0.5
+    assert bucket.acquire()
+
+
+def test_quota_daily_budget_persists():
+    """Test daily usage is counted per key, persisted and reset each day."""
+    from sopel_weather.quota import QuotaExceeded, QuotaManager, parse_limits
+
+    day = ['2024-01-08']
+    limits = parse_limits(['locationiq:2:0'])
+    quotas = QuotaManager(limits, today=lambda: day[0])
+    quotas.acquire('locationiq', 'key-a')
+    quotas.acquire('locationiq', 'key-b')
+    assert quotas.get('locationiq', 'key-a').remaining == 1
+    assert quotas.low('locationiq', 'key-a', reserve=0.5)
+    assert quotas.acquire('openmeteo', 'dummy') is None  # unlimited
+    assert 'key-a' not in str(quotas.dump())
+
+    restored = QuotaManager(limits, today=lambda: day[0])
+    restored.load(quotas.dump())
+    restored.acquire('locationiq', 'key-a')
+    with pytest.raises(QuotaExceeded):
+        restored.acquire('locationiq', 'key-a')
+
+    day[0] = '2024-01-09'
+    assert restored.get('locationiq', 'key-a').remaining == 2
+
+
+def test_report_uses_coarse_cache_when_quota_low(db):
+    """Test a nearly spent budget serves a neighbouring cached result."""
+    from sopel_weather.quota import QuotaManager, parse_limits
+
+    bot = make_bot(db)
+    bot.memory['weather_quota'] = QuotaManager(parse_limits(['openmeteo:10:0']))
+
+    with requests_mock.mock() as m:
+        m.get('https://api.open-meteo.com/v1/forecast', json=OPENMETEO_REPORT_RESPONSE)
+        first = weather.get_report(bot, '47.61', '-122.33', 'Seattle, WA, US')
+        for _ in range(9):
+            bot.memory['weather_quota'].acquire('openmeteo', 'test-api-key')
+        # Different fine cell, same coarse cell
+        nearby = weather.get_report(bot, '47.45', '-122.30', 'SeaTac, WA, US')
+
+        assert m.call_count == 1
+
+    assert nearby is first
+
+
+def test_coarse_cache_not_served_as_fine_cell(db):
+    """Test a coarse-grid entry is not a normal hit for the fine cell at the same coordinates."""
+    bot = make_bot(db)
+
+    with requests_mock.mock() as m:
+        m.get('https://api.open-meteo.com/v1/forecast', json=OPENMETEO_REPORT_RESPONSE)
+        seattle = weather.get_report(bot, '47.6', '-122.33', 'Seattle, WA, US')
+        # This fine cell is the one Seattle's coarse cell snaps to
+        assert weather.weather_cache_key(bot, 'report', '47.52', '-122.48')[2:] == weather.weather_cache_key(
+            bot, 'report', '47.6', '-122.33', grid=bot.config.weather.quota_coarse_grid)[2:]
+        elsewhere = weather.get_report(bot, '47.52', '-122.48', 'Elsewhere, WA, US')
+
+        assert m.call_count == 2
+
+    assert elsewhere is not seattle
+
+
+def test_quota_exceeded_reaches_the_user(db):
+    """Test a budget refused by the send hook is reported as such, not as a transport error."""
+    from sopel_weather.quota import QuotaManager, parse_limits
+
+    bot = make_bot(db)
+    bot.memory['weather_quota'] = QuotaManager(parse_limits(['openmeteo:1:0']))
+    bot.memory['weather_nick_locations'].set('Alice', '47.6', '-122.33', 'Seattle, WA, US')
+    bot.memory['weather_quota'].acquire('openmeteo', 'test-api-key')
+    replies = []
+    bot.reply = replies.append
+
+    with requests_mock.mock() as m:
+        m.get('https://api.open-meteo.com/v1/forecast', json=OPENMETEO_REPORT_RESPONSE)
+        weather.weather_command(bot, MockTrigger('Alice'))
+        assert m.call_count == 0
+
+    assert replies == ['Could not get weather: Daily openmeteo quota used up']
+
+
+# =============================================================================
+# Metrics Tests
+# =============================================================================
+
+def test_metrics_summary_and_prometheus(tmp_path):
+    """Test stage timings, errors and cache hit rates are reported."""
+    from sopel_weather.cache import TTLCache
+    from sopel_weather.stats import Metrics
+
+    metrics = Metrics()
+    cache = TTLCache()
+    cache.set('a', 1)
+    cache.get('a')
+    cache.get('b')
+    metrics.track_cache('geocode', cache)
+    metrics.observe('geocode', 0.02)
+    metrics.observe('geocode', 0.2)
+    metrics.error('openmeteo')
+
+    summary = metrics.summary()
+    assert 'geocode: p50' in summary
+    assert '(n=2)' in summary
+    assert 'errors: openmeteo=1' in summary
+    assert 'geocode cache: 50% of 2 hit' in summary
+
+    path = tmp_path / 'weather.prom'
+    metrics.write_prometheus(str(path))
+    text = path.read_text()
+    assert 'sopel_weather_stage_seconds_bucket{stage="geocode",le="0.025"} 1' in text
+    assert 'sopel_weather_stage_seconds_bucket{stage="geocode",le="+Inf"} 2' in text
+    assert 'sopel_weather_upstream_errors_total{upstream="openmeteo"} 1' in text
+    assert 'sopel_weather_cache_lookups_total{cache="geocode",result="hit"} 1' in text
+
+
+def test_metrics_record_lookup_stages(db):
+    """Test a lookup records the HTTP, parsing and provider stages."""
+    from sopel_weather.stats import METRICS
+
+    bot = make_bot(db)
+    with requests_mock.mock() as m:
+        m.get('https://api.open-meteo.com/v1/forecast', json=OPENMETEO_REPORT_RESPONSE)
+        weather.get_report(bot, '47.6', '-122.33', 'Seattle, WA, US')
+
+    for stage in ('http:api.open-meteo.com', 'json', 'normalize', 'provider:openmeteo'):
+        assert METRICS.histograms[stage].count == 1
+
+
+# =============================================================================
+# Data Model Tests
+# =============================================================================
+
+def test_weather_report_is_slotted():
+    """Test records carry no per-instance dict and copy rather than mutate."""
+    from sopel_weather.model import WeatherReport
+
+    report = WeatherReport('Seattle, WA, US', 12.5, 'Partly cloudy', 0.75, 4.0, 135)
+    assert not hasattr(report, '__dict__')
+    with pytest.raises(AttributeError):
+        report.wind = 4.0
+
+    moved = report.replace(location='Tacoma, WA, US')
+    assert moved.location == 'Tacoma, WA, US'
+    assert report.location == 'Seattle, WA, US'
+    assert moved == report.replace(location='Tacoma, WA, US') != report
+
+
+def test_dict_provider_is_normalized(db, monkeypatch):
+    """Test reports from providers still returning dicts are converted to records."""
+    from sopel_weather.model import Forecast, WeatherReport
+    from sopel_weather.providers.weather import WeatherProvider
+
+    provider = WeatherProvider(
+        'legacy',
+        weather=lambda bot, lat, lon, location: {
+            'location': location, 'temp': 12.5, 'condition': 'Clear', 'humidity': 0.5,
+            'wind': {'speed': 4.0, 'bearing': 90}, 'timezone': 'UTC',
+        },
+        forecast=lambda bot, lat, lon, location: {'location': location, 'data': [
+            {'dow': 'Monday', 'summary': 'Rain', 'high_temp': 12.0, 'low_temp': 5.0},
+        ]},
+    )
+    monkeypatch.setattr(weather, 'get_provider', lambda name: provider)
+
+    report = weather.fetch_report(make_bot(db), 'legacy', '47.6', '-122.33', 'Seattle, WA, US')
+    assert report['weather'] == WeatherReport('Seattle, WA, US', 12.5, 'Clear', 0.5, 4.0, 90, timezone='UTC')
+    assert isinstance(report['forecast'], Forecast)
+    assert report['forecast'].days[0].summary == 'Rain'
+
+
+def test_incomplete_provider_refused():
+    """Test a provider without report, or without one of weather and forecast, is refused when built."""
+    from sopel_weather.providers.weather import WeatherProvider
+
+    def fetch(bot, latitude, longitude, location):
+        return {'weather': 'weather', 'forecast': 'forecast'}
+
+    with pytest.raises(TypeError, match="'partial' needs report"):
+        WeatherProvider('partial', weather=fetch)
+    with pytest.raises(TypeError):
+        WeatherProvider('empty')
+
+    class Subclassed(WeatherProvider):
+        def report(self, bot, latitude, longitude, location):
+            return fetch(bot, latitude, longitude, location)
+
+    provider = Subclassed('subclassed')
+    assert provider.forecast(None, '47.6', '-122.33', 'Seattle, WA, US') == 'forecast'
+    assert WeatherProvider('reported', report=fetch).weather(None, '47.6', '-122.33', 'Seattle, WA, US') == 'weather'
+    assert not provider.has_hourly
+
+
+# =============================================================================
+# Renderer Tests
+# =============================================================================
+
+def test_renderer_weather():
+    """Test the compiled weather template."""
+    from sopel_weather.model import WeatherReport
+    from sopel_weather.render import Renderer
+
+    data = WeatherReport('Seattle, WA, US', 12.5, 'Partly cloudy', 0.75, 4.0, 135, uvindex=2,
+                         timezone='America/Los_Angeles', sunrise=1704729600, sunset=1704762000)
+
+    assert Renderer().weather(data) == (
+        'Seattle, WA, US: 12°C (54°F), Partly cloudy, Humidity: 75%, UV Index: 2, '
+        'Gentle breeze: 14km/h (9mph) (↖)')
+    assert Renderer(units='metric', sunrise_sunset=True).weather(data) == (
+        'Seattle, WA, US: 12°C, Partly cloudy, Humidity: 75%, UV Index: 2, '
+        'Sunrise: 08:00 Sunset: 17:00, Gentle breeze: 14km/h (↖)')
+
+    assert Renderer(units='imperial').weather(data.replace(uvindex=None)) == (
+        'Seattle, WA, US: 54°F, Partly cloudy, Humidity: 75%, Gentle breeze: 9mph (↖)')
+
+
+def test_renderer_forecast():
+    """Test every forecast day is rendered."""
+    from sopel_weather.model import Forecast, ForecastDay
+    from sopel_weather.render import Renderer
+
+    data = Forecast('Seattle, WA, US', [
+        ForecastDay('Monday', 'Rain', 12.0, 5.0),
+        ForecastDay('Tuesday', 'Clear', None, -3.0),
+    ])
+
+    assert Renderer().forecast(data) == (
+        'Seattle, WA, US :: Monday - Rain - 12°C (54°F) / 5°C (41°F)'
+        ' :: Tuesday - Clear - unknown / -3°C (27°F)')
+
+
+def test_compass_arrow_table():
+    """Test the precomputed compass table matches the sector boundaries."""
+    from sopel_weather.render import compass_arrow
+
+    assert compass_arrow(22) == '↓'
+    assert compass_arrow(23) == '↙'
+    assert compass_arrow(67.9) == '↙'
+    assert compass_arrow(337) == '↘'
+    assert compass_arrow(338) == '↓'
+    assert compass_arrow(360) == '↓'
+
+
+# =============================================================================
+# Timezone Tests
+# =============================================================================
+
+class FakeTimezoneFinder:
+    """Stand-in for ``timezonefinder.TimezoneFinder``: everything is in Seattle's zone."""
+    def __init__(self, in_memory=False):
+        pass
+
+    def timezone_at(self, lat, lng):
+        return 'America/Los_Angeles'
+
+
+@pytest.fixture
+def timezone_finder(monkeypatch):
+    from sopel_weather import timezones
+
+    monkeypatch.setattr(timezones, 'TimezoneFinder', FakeTimezoneFinder)
+    monkeypatch.setattr(timezones, '_finder', None)
+    timezones.lookup.cache_clear()
+    yield
+    timezones.lookup.cache_clear()
+
+
+def test_zones_are_cached():
+    """Test each timezone object is only built once."""
+    from sopel_weather.timezones import get_zone
+
+    assert get_zone('America/Los_Angeles') is get_zone('America/Los_Angeles')
+    assert weather.convert_timestamp(1704729600, 'America/Los_Angeles') == '08:00'
+
+
+def test_setlocation_saves_timezone(db, timezone_finder):
+    """Test .setlocation stores the location's timezone, and it survives a reload."""
+    bot = make_bot(db)
+    bot.reply = lambda message: message
+
+    with requests_mock.mock() as m:
+        m.get('https://us1.locationiq.com/v1/search.php', json=LOCATIONIQ_RESPONSE)
+        weather.update_location(bot, MockTrigger('Alice', 'Seattle', command='setlocation'))
+
+    assert db.get_nick_value('Alice', 'weather_timezone') == 'America/Los_Angeles'
+    index = make_bot(db).memory['weather_nick_locations']
+    assert index.get_timezone('Alice') == 'America/Los_Angeles'
+
+
+@pytest.mark.parametrize('with_finder', [False, True])
+def test_setlocation_keeps_settz_timezone(db, monkeypatch, with_finder):
+    """Test .setlocation never touches the timezone users set with Sopel's own .settz."""
+    from sopel_weather import timezones
+
+    monkeypatch.setattr(timezones, 'TimezoneFinder', FakeTimezoneFinder if with_finder else None)
+    monkeypatch.setattr(timezones, '_finder', None)
+    timezones.lookup.cache_clear()
+    db.set_nick_value('Alice', 'timezone', 'Europe/Berlin')
+    bot = make_bot(db)
+    bot.reply = lambda message: message
+
+    with requests_mock.mock() as m:
+        m.get('https://us1.locationiq.com/v1/search.php', json=LOCATIONIQ_RESPONSE)
+        weather.update_location(bot, MockTrigger('Alice', 'Seattle', command='setlocation'))
+    timezones.lookup.cache_clear()
+
+    assert db.get_nick_value('Alice', 'timezone') == 'Europe/Berlin'
+
+
+def test_weather_prefers_saved_timezone(db):
+    """Test sunrise/sunset use the saved timezone rather than the provider's."""
+    bot = make_bot(db)
+    bot.config.weather.sunrise_sunset = True
+    bot.memory['weather_nick_locations'].set('Alice', '47.6', '-122.33', 'Seattle, WA, US', 'Europe/London')
+
+    with requests_mock.mock() as m:
+        m.get('https://api.open-meteo.com/v1/forecast', json=OPENMETEO_REPORT_RESPONSE)
+        data = weather.get_weather(bot, MockTrigger('Alice'))
+
+    assert data.timezone == 'Europe/London'
+
+
+# =============================================================================
+# Prefetch Tests
+# =============================================================================
+
+def test_hot_locations_rank_and_decay():
+    """Test locations are ranked by lookups and forgotten once cold."""
+    from sopel_weather.prefetch import HotLocations
+
+    hot = HotLocations()
+    for _ in range(3):
+        hot.record('seattle', '47.6', '-122.33', 'Seattle, WA, US')
+    hot.record('london', '51.5', '-0.12', 'London, England, GB')
+
+    assert hot.top(1) == [('seattle', ('47.6', '-122.33', 'Seattle, WA, US'))]
+    hot.decay()
+    assert [key for key, _ in hot.top(5)] == ['seattle']
+
+
+def test_openmeteo_reports_batch():
+    """Test several points are fetched with one comma-separated request."""
+    from sopel_weather.providers.weather.openmeteo import openmeteo_reports
+
+    points = [('47.6', '-122.33', 'Seattle, WA, US'), ('51.5', '-0.12', 'London, England, GB')]
+    with requests_mock.mock() as m:
+        m.get('https://api.open-meteo.com/v1/forecast', json=[OPENMETEO_REPORT_RESPONSE] * 2)
+        reports = openmeteo_reports(MockBot(), points)
+
+        assert m.call_count == 1
+        assert m.request_history[0].qs['latitude'] == ['47.6,51.5']
+
+    assert [report['forecast'].location for report in reports] == ['Seattle, WA, US', 'London, England, GB']
+
+
+def test_prefetch_refreshes_hot_locations(db):
+    """Test the prefetch job refreshes expiring hot locations in one request."""
+    bot = make_bot(db)
+    with requests_mock.mock() as m:
+        m.get('https://api.open-meteo.com/v1/forecast', json=OPENMETEO_REPORT_RESPONSE)
+        weather.get_report(bot, '47.6', '-122.33', 'Seattle, WA, US')
+        weather.get_report(bot, '47.6', '-122.33', 'Seattle, WA, US')
+        weather.get_report(bot, '51.5', '-0.12', 'London, England, GB')
+        weather.get_report(bot, '51.5', '-0.12', 'London, England, GB')
+        assert m.call_count == 2
+
+        # Fresh entries are left alone
+        weather.prefetch_hot_locations(bot)
+        assert m.call_count == 2
+
+        bot.memory['weather_cache'].clear()
+        m.get('https://api.open-meteo.com/v1/forecast', json=[OPENMETEO_REPORT_RESPONSE] * 2)
+        weather.prefetch_hot_locations(bot)
+        assert m.call_count == 3
+        assert m.request_history[-1].qs['longitude'] == ['-122.33,-0.12']
+
+    assert weather.weather_cache_key(bot, 'report', '51.5', '-0.12') in bot.memory['weather_cache']
+
+
+# =============================================================================
+# Multi-location Tests
+# =============================================================================
+
+def locationiq_by_query(request, context):
+    """LocationIQ stand-in knowing Seattle and London, and nothing else."""
+    places = {
+        'seattle': LOCATIONIQ_RESPONSE,
+        'london': [{"lat": "51.5", "lon": "-0.12",
+                    "address": {"city": "London", "state": "England", "country_code": "gb"}}],
+    }
+    query = request.qs['q'][0]
+    if query not in places:
+        context.status_code = 404
+        return {'error': 'Unable to geocode'}
+    return places[query]
+
+
+def test_weather_many_locations_one_request(db):
+    """Test .weather A | B | C geocodes concurrently and batches the weather."""
+    bot = make_bot(db)
+    bot.say = lambda message: message
+    bot.reply = lambda message: message
+
+    with requests_mock.mock() as m:
+        geocoder = m.get('https://us1.locationiq.com/v1/search.php', json=locationiq_by_query)
+        forecast = m.get('https://api.open-meteo.com/v1/forecast', json=[OPENMETEO_REPORT_RESPONSE] * 2)
+        reply = weather.weather_command(bot, MockTrigger('Alice', 'Seattle | London | Nowhere'))
+
+        assert geocoder.call_count == 3
+        assert forecast.call_count == 1
+
+    assert reply == ('Seattle, Washington, US: 12°C (54°F), Partly cloudy'
+                     ' | London, England, GB: 12°C (54°F), Partly cloudy'
+                     ' | Nowhere: Unable to geocode')
+
+
+def test_weather_many_locations_limit(db):
+    """Test asking for more than max_locations is refused without any lookup."""
+    bot = make_bot(db)
+    bot.config.weather.max_locations = 2
+    bot.reply = lambda message: message
+
+    with requests_mock.mock() as m:
+        weather.weather_command(bot, MockTrigger('Alice', 'a | b | c'))
+
+        assert m.call_count == 0
+
+
+@pytest.mark.parametrize('locations', ['|', ' | | '])
+def test_weather_many_locations_empty(db, locations):
+    """Test separators without any location get the usage instead of an empty reply."""
+    bot = make_bot(db)
+    replies = []
+    bot.say = replies.append
+    bot.reply = replies.append
+
+    with requests_mock.mock() as m:
+        assert weather.weather_command(bot, MockTrigger('Alice', locations)) is weather.NOLIMIT
+        assert m.call_count == 0
+
+    assert replies == ['Give me locations separated by |, like .weather London | Paris.']
+
+
+# =============================================================================
+# Channel Roster Tests
+# =============================================================================
+
+class MockChannel:
+    """Mock channel whose ``ops`` are operators."""
+    def __init__(self, users, ops=()):
+        self.users = dict.fromkeys(users)
+        self.ops = ops
+
+    def has_privilege(self, nick, privilege):
+        return nick in self.ops
+
+
+def make_roster_bot(db, channel):
+    bot = make_bot(db)
+    bot.config.weather.nick_lookup = True
+    bot.channels = {'#weather': channel}
+    bot.say = lambda message: message
+    bot.reply = lambda message: message
+    index = bot.memory['weather_nick_locations']
+    index.set('Alice', '47.6', '-122.33', 'Seattle, WA, US')
+    index.set('Bob', '47.61', '-122.34', 'Seattle, WA, US')
+    index.set('Carol', '51.5', '-0.12', 'London, England, GB')
+    return bot
+
+
+def test_weather_channel_roster(db):
+    """Test .weather #channel fetches each grid cell once, in one request."""
+    bot = make_roster_bot(db, MockChannel(['Alice', 'Bob', 'Carol', 'Dave']))
+
+    with requests_mock.mock() as m:
+        m.get('https://api.open-meteo.com/v1/forecast', json=[OPENMETEO_REPORT_RESPONSE] * 2)
+        reply = weather.weather_command(bot, MockTrigger('Alice', '#weather'))
+
+        assert m.call_count == 1
+        assert m.request_history[0].qs['latitude'] == ['47.6,51.5']
+
+    assert reply == ('Seattle, WA, US: 12°C (54°F), Partly cloudy (Alice, Bob)'
+                     ' | London, England, GB: 12°C (54°F), Partly cloudy (Carol)')
+
+    # Rate limited per channel
+    replies = []
+    bot.reply = replies.append
+    weather.weather_command(bot, MockTrigger('Alice', '#weather'))
+    assert replies[0].startswith('Try again in')
+
+
+def test_weather_channel_roster_ops_only(db):
+    """Test roster_ops_only keeps non-operators from asking."""
+    bot = make_roster_bot(db, MockChannel(['Alice', 'Bob'], ops=['Bob']))
+    bot.config.weather.roster_ops_only = True
+
+    with requests_mock.mock() as m:
+        m.get('https://api.open-meteo.com/v1/forecast', json=[OPENMETEO_REPORT_RESPONSE])
+        weather.weather_command(bot, MockTrigger('Alice', '#weather'))
+        assert m.call_count == 0
+
+        weather.weather_command(bot, MockTrigger('Bob', '#weather'))
+        assert m.call_count == 1
+
+
+def test_weather_channel_roster_needs_nick_lookup(db):
+    """Test the roster is refused when looking up other users is disabled."""
+    bot = make_roster_bot(db, MockChannel(['Alice', 'Bob', 'Carol']))
+    bot.config.weather.nick_lookup = False
+
+    with requests_mock.mock() as m:
+        reply = weather.weather_command(bot, MockTrigger('Alice', '#weather'))
+        assert m.call_count == 0
+
+    assert reply is weather.NOLIMIT
+    assert bot.memory['weather_roster_times'] == {}
+
+
+# =============================================================================
+# Gazetteer Tests
+# =============================================================================
+
+def geonames_city(name, latitude, longitude, country, state, population, timezone):
+    """A row of a GeoNames cities dump."""
+    return '\t'.join([
+        '1', name, name, '', latitude, longitude, 'P', 'PPL', country, '', state, '', '', '',
+        population, '', '0', timezone, '2024-01-01',
+    ])
+
+
+@pytest.fixture
+def gazetteer_file(tmp_path, capsys):
+    from sopel_weather import gazetteer
+
+    cities = tmp_path / 'cities.txt'
+    cities.write_text('\n'.join([
+        geonames_city('Seattle', '47.60621', '-122.33207', 'US', 'WA', '737015', 'America/Los_Angeles'),
+        geonames_city('London', '51.50853', '-0.12574', 'GB', 'ENG', '8961989', 'Europe/London'),
+        geonames_city('London', '42.98339', '-81.23304', 'CA', '08', '422324', 'America/Toronto'),
+        geonames_city('Buffalo', '42.88645', '-78.87837', 'US', 'NY', '278349', 'America/New_York'),
+        geonames_city('Portland', '45.52345', '-122.67621', 'US', 'OR', '652503', 'America/Los_Angeles'),
+        geonames_city('Paris', '48.85341', '2.3488', 'FR', '11', '2138551', 'Europe/Paris'),
+    ]), encoding='utf-8')
+    admin1 = tmp_path / 'admin1.txt'
+    admin1.write_text('US.WA\tWashington\tWashington\t5815135\nGB.ENG\tEngland\tEngland\t6269131\n'
+                      'US.NY\tNew York\tNew York\t5128638\n', encoding='utf-8')
+    postal = tmp_path / 'postal.txt'
+    postal.write_text('US\t90210\tBeverly Hills\tCalifornia\tCA\tLos Angeles\t037\t\t\t34.0901\t-118.4065\t4\n',
+                      encoding='utf-8')
+
+    path = str(tmp_path / 'gazetteer.idx')
+    assert gazetteer.main([str(cities), '--admin1', str(admin1), '--postal', str(postal), '-o', path]) == 0
+    assert capsys.readouterr().out.startswith('Wrote {}: 7 places'.format(path))
+    return path
+
+
+def test_gazetteer_lookup(gazetteer_file):
+    """Test exact, qualified, postal, prefix and misspelt lookups."""
+    from sopel_weather.gazetteer import Gazetteer
+
+    gazetteer = Gazetteer(gazetteer_file)
+    try:
+        assert len(gazetteer) == 7
+        assert gazetteer.lookup('London') == ('51.5085', '-0.1257', 'London, England, GB', 'Europe/London')
+        assert gazetteer.lookup('london, ca')[2] == 'London, CA'
+        assert gazetteer.lookup('Buffalo, New York')[2] == 'Buffalo, New York, US'
+        assert gazetteer.lookup('Buffalo, NY')[2] == 'Buffalo, New York, US'
+        assert gazetteer.lookup('Buffalo, York') is None
+        assert gazetteer.lookup('90210') == ('34.0901', '-118.4065', 'Beverly Hills, California, US', None)
+        assert gazetteer.lookup('Seatt')[2] == 'Seattle, Washington, US'
+        assert gazetteer.lookup('Seatle')[2] == 'Seattle, Washington, US'
+        assert gazetteer.lookup('Tokyo') is None
+        # A longer name is not a misspelling of its first word
+        assert gazetteer.lookup('Portland Maine') is None
+        assert gazetteer.lookup('Paris Texas') is None
+        assert gazetteer.lookup('Portlnd')[2] == 'Portland, US'
+        assert gazetteer.memory_usage()['total'] > 0
+    finally:
+        gazetteer.close()
+
+
+def test_gazetteer_before_geocoder(db, gazetteer_file):
+    """Test places in the gazetteer never reach the geocoder."""
+    bot = make_bot(db)
+    bot.config.weather.gazetteer_file = gazetteer_file
+    weather.setup(bot)
+
+    with requests_mock.mock() as m:
+        m.get('https://us1.locationiq.com/v1/search.php', json=LOCATIONIQ_RESPONSE)
+        found = weather.get_geocoords(bot, MockTrigger('Alice', 'Seattle'))
+        assert m.call_count == 0
+
+        weather.get_geocoords(bot, MockTrigger('Alice', 'Tokyo'))
+        assert m.call_count == 1
+
+    assert found == ('47.6062', '-122.3321', 'Seattle, Washington, US', 'America/Los_Angeles')
+    weather.shutdown(bot)
+
+
+# =============================================================================
+# Request Size Tests
+# =============================================================================
+
+@pytest.mark.parametrize('function, url, bot, param, expected', [
+    ('openmeteo:openmeteo_weather', 'https://api.open-meteo.com/v1/forecast', MockBot, 'daily', None),
+    ('openmeteo:openmeteo_weather', 'https://api.open-meteo.com/v1/forecast', MockBotWithSunrise, 'daily',
+     'sunrise,sunset'),
+    ('openweathermap:openweathermap_weather', 'https://api.openweathermap.org/data/2.5/onecall', MockBotWithSunrise,
+     'exclude', 'minutely,hourly,daily,alerts'),
+    ('pirateweather:pirateweather_weather', 'https://api.pirateweather.net/forecast/test-api-key/47.6,-122.33',
+     MockBot, 'exclude', 'minutely,hourly,alerts,flags,daily'),
+    ('pirateweather:pirateweather_weather', 'https://api.pirateweather.net/forecast/test-api-key/47.6,-122.33',
+     MockBotWithSunrise, 'exclude', 'minutely,hourly,alerts,flags'),
+    ('tomorrow:tomorrow_weather', 'https://api.tomorrow.io/v4/weather/forecast', MockBot, 'timesteps', '1m'),
+    ('tomorrow:tomorrow_report', 'https://api.tomorrow.io/v4/weather/forecast', MockBot, 'timesteps', '1m,1d'),
+])
+def test_provider_requests_only_rendered_fields(function, url, bot, param, expected):
+    """Test each provider asks for no more than the config renders."""
+    import importlib
+
+    module, name = function.split(':')
+    func = getattr(importlib.import_module('sopel_weather.providers.weather.' + module), name)
+    error = {'message': 'stop', 'error': 'stop', 'reason': 'stop'}
+    with requests_mock.mock() as m:
+        m.get(url, json=error, status_code=400)
+        with pytest.raises(Exception):
+            func(bot(), '47.6', '-122.33', 'Seattle, WA, US')
+
+        values = m.request_history[0].qs.get(param)
+    assert values == (None if expected is None else [expected])
+
+
+def test_transport_counts_response_bytes():
+    """Test response body sizes are recorded per upstream."""
+    from sopel_weather import transport
+    from sopel_weather.stats import METRICS
+
+    METRICS.reset()
+    transport.configure()
+    with requests_mock.mock() as m:
+        m.get('https://api.open-meteo.com/v1/forecast', text='x' * 2048)
+        transport.get('https://api.open-meteo.com/v1/forecast')
+
+    assert METRICS.received == {'api.open-meteo.com': 2048}
+    assert 'received: api.open-meteo.com=2.0KiB' in METRICS.summary()
+    transport.close()
+
+
+# =============================================================================
+# HTTP Response Cache Tests
+# =============================================================================
+
+def test_response_cache_key_strips_secrets():
+    """Test API keys never make it into cache keys."""
+    from sopel_weather.httpcache import cache_key
+
+    assert cache_key('https://api.tomorrow.io/v4/weather/forecast', {'apikey': 'secret', 'location': '1,2'}) == \
+        'https://api.tomorrow.io/v4/weather/forecast?location=1%2C2'
+    assert 'secret' not in cache_key('https://api.pirateweather.net/forecast/secret/1,2', {'units': 'si'},
+                                     secrets=('secret',))
+
+
+def test_response_cache_survives_restart(tmp_path):
+    """Test a fresh response is served from disk after the cache is reopened."""
+    from sopel_weather import transport
+    from sopel_weather.httpcache import ResponseCache
+
+    path = str(tmp_path / 'http.sqlite')
+    url = 'https://api.open-meteo.com/v1/forecast'
+    with requests_mock.mock() as m:
+        m.get(url, json=OPENMETEO_CURRENT_RESPONSE, headers={'Cache-Control': 'max-age=600'})
+        transport.configure(cache=ResponseCache(path))
+        transport.get(url, params={'latitude': '47.6'})
+        transport.close()
+
+        transport.configure(cache=ResponseCache(path))
+        r = transport.get(url, params={'latitude': '47.6'})
+        assert m.call_count == 1
+        assert r.json() == OPENMETEO_CURRENT_RESPONSE
+    transport.configure()
+
+
+def test_response_cache_revalidates(tmp_path):
+    """Test stale responses are revalidated with their ETag."""
+    from sopel_weather import transport
+    from sopel_weather.httpcache import ResponseCache
+
+    cache = ResponseCache(str(tmp_path / 'http.sqlite'))
+    url = 'https://api.open-meteo.com/v1/forecast'
+    with requests_mock.mock() as m:
+        transport.configure(cache=cache)
+        m.get(url, json=OPENMETEO_CURRENT_RESPONSE, headers={'Cache-Control': 'no-cache', 'ETag': '"v1"'})
+        transport.get(url)
+
+        m.get(url, status_code=304, headers={'Cache-Control': 'max-age=60'})
+        r = transport.get(url)
+        assert m.request_history[-1].headers['If-None-Match'] == '"v1"'
+        assert r.status_code == 200
+        assert r.json() == OPENMETEO_CURRENT_RESPONSE
+
+        transport.get(url)
+        assert m.call_count == 2
+    assert cache.revalidated == 1
+    transport.configure()
+
+
+def test_quota_spent_only_on_sent_requests(db, tmp_path):
+    """Test responses from the disk cache cost no quota, while revalidations do."""
+    from sopel_weather import quota, transport
+    from sopel_weather.httpcache import ResponseCache
+
+    bot = make_bot(db)
+    now = [time.time()]
+    transport.configure(cache=ResponseCache(str(tmp_path / 'http.sqlite'), clock=lambda: now[0]))
+    bot.memory['weather_quota'] = quotas = quota.QuotaManager({'openmeteo': (100, 0)})
+    url = 'https://api.open-meteo.com/v1/forecast'
+
+    with requests_mock.mock() as m:
+        m.get(url, json=OPENMETEO_REPORT_RESPONSE, headers={'Cache-Control': 'max-age=600', 'ETag': '"v1"'})
+        for _ in range(3):
+            bot.memory['weather_cache'].clear()
+            weather.get_report(bot, '47.6', '-122.33', 'Seattle, WA, US')
+        assert m.call_count == 1
+        assert quotas.get('openmeteo', 'test-api-key').used == 1
+
+        now[0] += 601
+        m.get(url, status_code=304, headers={'Cache-Control': 'max-age=600'})
+        bot.memory['weather_cache'].clear()
+        weather.get_report(bot, '47.6', '-122.33', 'Seattle, WA, US')
+        assert m.call_count == 2
+        assert quotas.get('openmeteo', 'test-api-key').used == 2
+    transport.configure()
+
+
+def test_quota_usage_saved_on_interval(db):
+    """Test spending quota writes nothing until the interval job, and the usage survives a reload."""
+    from sopel_weather import quota
+
+    bot = make_bot(db)
+    bot.memory['weather_quota'] = quota.QuotaManager({'openmeteo': (100, 0)})
+
+    with requests_mock.mock() as m:
+        m.get('https://api.open-meteo.com/v1/forecast', json=OPENMETEO_REPORT_RESPONSE)
+        weather.get_report(bot, '47.6', '-122.33', 'Seattle, WA, US')
+        weather.get_report(bot, '51.5', '-0.13', 'London, England, GB')
+    assert db.get_plugin_value('weather', 'quota_usage') is None
+
+    weather.save_changes(bot)
+    assert list(db.get_plugin_value('weather', 'quota_usage').values())[0][1] == 2
+    weather.shutdown(bot)
+
+    bot = make_bot(db)
+    bot.memory['weather_quota'].limits = {'openmeteo': (100, 0)}
+    assert bot.memory['weather_quota'].get('openmeteo', 'test-api-key').used == 2
+
+
+def test_send_hook_failure_releases_probe():
+    """Test a half-open breaker's probe is given back when a send hook refuses the request."""
+    from sopel_weather import quota, transport
+
+    transport.configure(min_calls=1, cooldown=0)
+    url = 'https://api.open-meteo.com/v1/forecast'
+    transport.get_breaker(url).record_failure()
+
+    def refuse():
+        raise quota.QuotaExceeded('Daily openmeteo quota used up')
+
+    with requests_mock.mock() as m:
+        m.get(url, json={})
+        with pytest.raises(quota.QuotaExceeded), transport.sending(refuse):
+            transport.get(url)
+        assert transport.get(url).status_code == 200
+        assert m.call_count == 1
+    transport.configure()
+
+
+# =============================================================================
+# Hourly Forecast Tests
+# =============================================================================
+
+def openmeteo_hourly_response(start, hours=24):
+    return {
+        'timezone': 'America/Los_Angeles',
+        'hourly': {
+            'time': [start + 3600 * hour for hour in range(hours)],
+            'temperature_2m': [10.0 + hour for hour in range(hours)],
+            'precipitation': [0.4 if hour == 1 else 0.0 for hour in range(hours)],
+            'wind_speed_10m': [5.0] * hours,
+        },
+    }
+
+
+def test_hourly_series_window():
+    """Test slices start at the hour covering the given time."""
+    from sopel_weather.model import HourlySeries
+
+    series = HourlySeries('Seattle, WA, US', 'UTC', [0, 3600, 7200, 10800], [1, 2, 3, 4], [0] * 4, [1] * 4)
+    assert series.temp.itemsize == 4
+    assert list(series.window(0, 2).temp) == [1.0, 2.0]
+    assert list(series.window(5000, 2).times) == [3600, 7200]
+    assert list(series.window(-100, 9).times) == [0, 3600, 7200, 10800]
+
+
+def test_forecast_hourly_slices_from_cache(db):
+    """Test .forecast hourly fetches the series once and slices it for later requests."""
+    bot = make_bot(db)
+    bot.say = lambda message: message
+    bot.memory['weather_nick_locations'].set('Alice', '47.6', '-122.33', 'Seattle, WA, US', 'UTC')
+    start = int(time.time()) // 3600 * 3600
+    hours = ['{:02d}:00'.format((start // 3600 + hour) % 24) for hour in range(3)]
+
+    with requests_mock.mock() as m:
+        m.get('https://api.open-meteo.com/v1/forecast', json=openmeteo_hourly_response(start))
+        reply = weather.forecast_command(bot, MockTrigger('Alice', 'hourly 2', command='forecast'))
+        longer = weather.forecast_command(bot, MockTrigger('Alice', 'hourly 3', command='forecast'))
+
+        assert m.call_count == 1
+        assert m.last_request.qs['hourly'] == ['temperature_2m,precipitation,wind_speed_10m']
+        assert m.last_request.qs['forecast_hours'] == ['24']
+
+    assert reply == ('Seattle, WA, US :: {} 10°C (50°F), 18km/h (11mph)'
+                     ' :: {} 11°C (52°F), 0.4mm (0.02in), 18km/h (11mph)').format(*hours)
+    assert longer.startswith(reply)
+    assert longer.count(' :: ') == 3
+
+
+@pytest.mark.parametrize('units', ['both', 'metric', 'imperial'])
+@pytest.mark.parametrize('amount', [0.0, 12.5])
+def test_renderer_hourly_fits_one_line(units, amount):
+    """Test the longest hourly reply is cut to whole hours within one IRC line."""
+    from sopel_weather.model import HourlySeries
+    from sopel_weather.render import LINE_BYTES, Renderer
+
+    hours = weather.HOURLY_MAX_HOURS
+    series = HourlySeries('Llanfairpwllgwyngyll, Wales, GB', 'Europe/London', [3600 * hour for hour in range(hours)],
+                          [-10.0] * hours, [amount] * hours, [30.0] * hours)
+    reply = Renderer(units).hourly(series)
+
+    assert len(reply.encode('utf-8')) <= LINE_BYTES
+    assert reply.count(' :: ') >= 4
+    assert not reply.endswith(', ')
+    assert Renderer(units).hourly(series, max_bytes=10).count(' :: ') == 1
+
+
+def test_forecast_hourly_unsupported_provider(db, monkeypatch):
+    """Test providers without hourly data are skipped without spending quota."""
+    from sopel_weather.providers.weather import WeatherProvider
+
+    bot = make_bot(db)
+    bot.reply = lambda message: message
+    bot.memory['weather_nick_locations'].set('Alice', '47.6', '-122.33', 'Seattle, WA, US')
+    monkeypatch.setattr(weather, 'get_provider', lambda name: WeatherProvider(name, report=lambda *args: None))
+
+    with pytest.raises(Exception, match='no hourly forecast'):
+        weather.get_hourly(bot, MockTrigger('Alice', command='forecast'), '', 6)
+    assert bot.memory['weather_quota'].dump() == {}
+
+
+# =============================================================================
+# Rate Limit Tests
+# =============================================================================
+
+def test_rate_limiter_nick_and_channel():
+    """Test nicks and channels have their own buckets, and one refusal is noticed per streak."""
+    from sopel_weather.ratelimit import RateLimited, RateLimiter
+
+    now = [0.0]
+    limiter = RateLimiter(2, 3, 60, clock=lambda: now[0])
+    limiter.acquire('Alice', '#channel')
+    limiter.acquire('Alice', '#channel')
+    with pytest.raises(RateLimited) as first:
+        limiter.acquire('Alice', '#channel')
+    with pytest.raises(RateLimited) as second:
+        limiter.acquire('Alice', '#channel')
+    assert first.value.scope == 'nick' and first.value.retry_after == pytest.approx(30)
+    assert first.value.notify and not second.value.notify
+
+    # Alice's refusals cost the channel nothing
+    limiter.acquire('Bob', '#channel')
+    with pytest.raises(RateLimited) as full:
+        limiter.acquire('Carol', '#channel')
+    assert full.value.scope == 'channel'
+    limiter.acquire('Carol')
+
+    now[0] = 30.0
+    limiter.acquire('Alice')
+
+
+def test_rate_limit_counts_only_upstream_lookups(db):
+    """Test cached replies stay free while uncached ones are limited with a notice."""
+    from sopel_weather.ratelimit import RateLimiter
+
+    bot = make_bot(db)
+    bot.memory['weather_rate_limits'] = RateLimiter(1, 15, 60)
+    bot.memory['weather_nick_locations'].set('Alice', '47.6', '-122.33', 'Seattle, WA, US')
+    notices = []
+    bot.say = lambda message: message
+    bot.reply = lambda message: message
+    bot.notice = lambda message, nick: notices.append((nick, message))
+
+    with requests_mock.mock() as m:
+        m.get('https://api.open-meteo.com/v1/forecast', json=OPENMETEO_REPORT_RESPONSE)
+        geocoder = m.get('https://us1.locationiq.com/v1/search.php', json=locationiq_by_query)
+        for _ in range(3):
+            assert weather.weather_command(bot, MockTrigger('Alice')).startswith('Seattle, WA, US')
+        assert weather.forecast_command(bot, MockTrigger('Alice', command='forecast')).startswith('Seattle')
+
+        assert weather.weather_command(bot, MockTrigger('Alice', 'London')) is weather.NOLIMIT
+        assert weather.weather_command(bot, MockTrigger('Alice', 'Paris')) is weather.NOLIMIT
+        assert geocoder.call_count == 0
+        assert m.call_count == 1
+
+    assert len(notices) == 1
+    assert notices[0][0] == 'Alice'
+    assert notices[0][1].startswith('Too many lookups from this nick; try again in 60s')
+
+
+def test_rate_limit_on_weather_fetch(db):
+    """Test a limit hit by the weather request itself gets the notice, and no fallback is tried."""
+    from sopel_weather.ratelimit import RateLimiter
+
+    bot = make_bot(db)
+    bot.memory['weather_rate_limits'] = RateLimiter(1, 15, 60)
+    bot.memory['weather_api_keys'] = {'tomorrow': 'tomorrow-key'}
+    bot.config.weather.fallback_providers = ['tomorrow']
+    bot.memory['weather_nick_locations'].set('Alice', '47.6', '-122.33', 'Seattle, WA, US')
+    notices = []
+    replies = []
+    bot.say = lambda message: message
+    bot.reply = replies.append
+    bot.notice = lambda message, nick: notices.append((nick, message))
+
+    with requests_mock.mock() as m:
+        m.get('https://api.open-meteo.com/v1/forecast', json=OPENMETEO_REPORT_RESPONSE)
+        fallback = m.get('https://api.tomorrow.io/v4/weather/forecast', json={})
+        assert weather.weather_command(bot, MockTrigger('Alice')).startswith('Seattle, WA, US')
+        bot.memory['weather_cache'].clear()
+        assert weather.weather_command(bot, MockTrigger('Alice')) is weather.NOLIMIT
+
+        assert m.call_count == 1
+        assert fallback.call_count == 0
+
+    assert replies == []
+    assert len(notices) == 1
+    assert notices[0][1].startswith('Too many lookups from this nick')
+    assert bot.memory['weather_quota'].dump() == {}
+
+
+def test_rate_limit_skips_http_cache_hits(db, tmp_path):
+    """Test lookups answered from the HTTP cache cost no rate-limit tokens."""
+    from sopel_weather import transport
+    from sopel_weather.httpcache import ResponseCache
+    from sopel_weather.ratelimit import RateLimiter
+
+    bot = make_bot(db)
+    transport.configure(cache=ResponseCache(str(tmp_path / 'http.sqlite')))
+    bot.memory['weather_rate_limits'] = RateLimiter(1, 15, 60)
+    bot.memory['weather_nick_locations'].set('Alice', '47.6', '-122.33', 'Seattle, WA, US')
+    notices = []
+    bot.say = lambda message: message
+    bot.reply = lambda message: message
+    bot.notice = lambda message, nick: notices.append((nick, message))
+
+    with requests_mock.mock() as m:
+        m.get('https://api.open-meteo.com/v1/forecast', json=OPENMETEO_REPORT_RESPONSE,
+              headers={'Cache-Control': 'max-age=600'})
+        for _ in range(3):
+            bot.memory['weather_cache'].clear()
+            assert weather.weather_command(bot, MockTrigger('Alice')).startswith('Seattle, WA, US')
+        assert m.call_count == 1
+    transport.configure()
+
+    assert notices == []
+
+
+# =============================================================================
+# Stale-While-Revalidate Tests
+# =============================================================================
+
+def test_weather_served_stale_while_refreshing(db):
+    """Test an expired report is answered at once while one background refresh replaces it."""
+    import threading
+    from sopel_weather.cache import TTLCache
+
+    bot = make_bot(db)
+    now = [time.time()]
+    bot.memory['weather_cache'] = cache = TTLCache(grace=600, clock=lambda: now[0])
+    bot.memory['weather_nick_locations'].set('Alice', '47.6', '-122.33', 'Seattle, WA, US')
+    warmer = dict(OPENMETEO_REPORT_RESPONSE, current=dict(OPENMETEO_REPORT_RESPONSE['current'], temperature_2m=20.0))
+    release = threading.Event()
+
+    def refreshed(request, context):
+        # Hold the refresh until both stale reads are done
+        release.wait(5)
+        return warmer
+
+    with requests_mock.mock() as m:
+        m.get('https://api.open-meteo.com/v1/forecast', [{'json': OPENMETEO_REPORT_RESPONSE}, {'json': refreshed}])
+        assert weather.get_weather(bot, MockTrigger('Alice')).temp == 12.5
+
+        now[0] += 601
+        assert weather.get_weather(bot, MockTrigger('Alice')).temp == 12.5
+        assert weather.get_weather(bot, MockTrigger('Alice')).temp == 12.5
+        release.set()
+        for thread in threading.enumerate():
+            if thread.name == 'sopel-weather-refresh':
+                thread.join()
+
+        assert m.call_count == 2
+        assert weather.get_weather(bot, MockTrigger('Alice')).temp == 20.0
+
+    assert cache.stale == 2